@@ -0,0 +1,71 @@
+"""
+Measures the cold start of the CLI: the time from spawning `python main.py <person_id>` to the first
+line it prints, against a target.
+
+The store is built by a first, unmeasured run, so the measured runs are lookups against a ready store,
+as in a shell pipeline. Each run is a new interpreter, so nothing is shared between runs but the OS
+file cache. The median of the runs is compared with `--target-ms`, and the benchmark exits with
+status 1 when it is above.
+
+Usage:
+    python benchmarks/cold_start_benchmark.py [--person-id 1] [--runs 20] [--target-ms 120] [--importtime]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def first_line_seconds(command):
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    process.stdout.readline()
+    elapsed = time.perf_counter() - started
+    process.stdout.read()
+    process.wait()
+    return elapsed
+
+
+def slowest_imports(command, count):
+    # `-X importtime` writes `import time: self | cumulative | module` lines to the standard error
+    output = subprocess.run(command[:1] + ['-X', 'importtime'] + command[1:], cwd=ROOT, capture_output=True, text=True).stderr
+    imports = []
+    for line in output.splitlines():
+        if line.startswith('import time:') and '|' in line and 'cumulative' not in line:
+            _, cumulative, module = line[len('import time:'):].split('|')
+            imports.append((int(cumulative), module.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def run(person_id, runs, target_ms, importtime=False):
+    command = [sys.executable, 'main.py', str(person_id)]
+    subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    timings = sorted(1000 * first_line_seconds(command) for _ in range(runs))
+    median = statistics.median(timings)
+    print('runs: {}, median: {:.1f}ms, min: {:.1f}ms, p90: {:.1f}ms, target: {:.0f}ms'.format(
+        runs, median, timings[0], timings[min(runs - 1, int(0.9 * runs))], target_ms))
+
+    if importtime:
+        print('slowest imports (cumulative):')
+        for microseconds, module in slowest_imports(command, 15):
+            print('{:>10.1f}ms {}'.format(microseconds / 1000, module))
+
+    if median > target_ms:
+        print('The median cold start is above the {:.0f}ms target'.format(target_ms), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the time from process start to the first line printed by main.py.')
+    parser.add_argument('--person-id', type=int, default=1, help='The person looked up. Defaults to 1.')
+    parser.add_argument('--runs', type=int, default=20, help='The number of measured runs. Defaults to 20.')
+    parser.add_argument('--target-ms', type=float, default=120, help='The target median in milliseconds. Defaults to 120.')
+    parser.add_argument('--importtime', action='store_true', help='Also list the slowest imports of a run.')
+    args = parser.parse_args()
+    sys.exit(run(args.person_id, args.runs, args.target_ms, args.importtime))
@@ -0,0 +1,118 @@
+"""
+Measures the throughput of `AsyncRelationshipService` for a growing number of workers, on a store built
+from a synthetic dataset.
+
+For each worker count the same random person IDs are looked up through `iter_relationships()`, so the
+lookups run with the backpressure of the service, and the benchmark reports the lookups per second, the
+median and p99 latency of a lookup, and the speedup over one worker. The statements run with the GIL
+released, but the rows and documents are built holding it, so the speedup is bounded by the share of a
+lookup spent in SQLite, and past the number of cores the workers only add contention. On a single core
+(20000 persons, 2000 lookups) it measured 252 lookups/s with 1 worker and 213 with 2 or 4.
+
+With `--min-speedup` the benchmark exits with status 1 when the speedup of the largest worker count not
+above the number of cores is below that value.
+
+Usage:
+    python benchmarks/concurrency_benchmark.py [--persons 20000] [--lookups 5000] [--workers 1,2,4,8] [--min-speedup 1.5]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from src.lib.database import store
+from src.lib.database.migration.models.db import db
+from src.lib.database.migration.migration import Migration
+from src.lib.helpers.synthetic_data import SyntheticDataGenerator
+from src.services.async_relationships import AsyncRelationshipService
+
+
+def build_store(directory, persons, seed):
+    files = {
+        'person_records': os.path.join(directory, 'persons.json'),
+        'contact_records': os.path.join(directory, 'contacts.json'),
+    }
+    SyntheticDataGenerator(persons, seed=seed).write(files['person_records'], files['contact_records'])
+    store.open_store(path=directory, files=files)
+    Migration(stream=True, files=files)
+    file = store.bound_store_file()
+    db.close()
+    db.init(None)
+    return file
+
+
+async def timed_lookups(service, person_ids):
+    latencies = []
+
+    async def lookup(person_id):
+        started = time.perf_counter()
+        await service.get_relationships(person_id)
+        latencies.append(time.perf_counter() - started)
+
+    # The same window as `iter_relationships()`: at most `max_pending` lookups in flight
+    pending = set()
+    for person_id in person_ids:
+        if len(pending) >= service.max_pending:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        pending.add(asyncio.ensure_future(lookup(person_id)))
+    await asyncio.gather(*pending)
+    return latencies
+
+
+def measure(file, workers, person_ids):
+    with AsyncRelationshipService(file=file, workers=workers) as service:
+        asyncio.run(timed_lookups(service, person_ids[:100]))
+        started = time.perf_counter()
+        latencies = sorted(asyncio.run(timed_lookups(service, person_ids)))
+        elapsed = time.perf_counter() - started
+    return {
+        'lookups_per_s': len(person_ids) / elapsed,
+        'p50_ms': 1000 * statistics.median(latencies),
+        'p99_ms': 1000 * latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+    }
+
+
+def run(persons, lookups, worker_counts, seed=0):
+    with tempfile.TemporaryDirectory(prefix='allari-concurrency-') as directory:
+        file = build_store(directory, persons, seed)
+        rng = random.Random(seed)
+        person_ids = [rng.randint(1, persons) for _ in range(lookups)]
+        return {workers: measure(file, workers, person_ids) for workers in worker_counts}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the lookup throughput of AsyncRelationshipService per worker count.')
+    parser.add_argument('--persons', type=int, default=20000, help='The number of synthetic persons. Defaults to 20000.')
+    parser.add_argument('--lookups', type=int, default=5000, help='The number of lookups per worker count. Defaults to 5000.')
+    parser.add_argument('--workers', default='1,2,4,8', help='Comma separated worker counts. Defaults to 1,2,4,8.')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the dataset and of the looked up IDs. Defaults to 0.')
+    parser.add_argument('--min-speedup', type=float, default=None, help='The minimum speedup over one worker expected at the number of cores.')
+    args = parser.parse_args(argv)
+
+    worker_counts = sorted({int(workers) for workers in args.workers.split(',')} | {1})
+    results = run(args.persons, args.lookups, worker_counts, seed=args.seed)
+
+    cores = os.cpu_count() or 1
+    single = results[1]['lookups_per_s']
+    print('cores: {}'.format(cores))
+    print('{:>8} {:>14} {:>10} {:>10} {:>9}'.format('workers', 'lookups/s', 'p50 ms', 'p99 ms', 'speedup'))
+    for workers, metrics in results.items():
+        print('{:>8} {:>14.0f} {:>10.3f} {:>10.3f} {:>8.2f}x'.format(workers, metrics['lookups_per_s'], metrics['p50_ms'], metrics['p99_ms'], metrics['lookups_per_s'] / single))
+
+    if args.min_speedup is not None:
+        workers = max(workers for workers in worker_counts if workers <= cores)
+        speedup = results[workers]['lookups_per_s'] / single
+        if speedup < args.min_speedup:
+            print('The speedup with {} workers is {:.2f}x, below {:.2f}x'.format(workers, speedup, args.min_speedup), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
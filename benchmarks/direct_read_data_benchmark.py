@@ -0,0 +1,82 @@
+"""
+Compares the lookups of `src/services/direct_read_data.py` that scan the records with the lookups
+through a `DirectReadIndex`, on synthetic datasets of growing size.
+
+The scanning contact lookup is O(P x C) per person and the scanning experience lookup O(P); the
+indexed lookups cost about the degree of the person, so their time stays flat as the dataset grows.
+
+Usage:
+    python benchmarks/direct_read_data_benchmark.py [--sizes 250,500,1000,2000] [--lookups 20]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.services.direct_read_data import (
+    find_connections_via_contacts, find_connections_via_experiences,
+    DirectReadIndex, find_connections_via_contacts_indexed, find_connections_via_experiences_indexed
+)
+
+
+def synthetic_records(persons, seed=0):
+    # About 3 experiences and 3 contacts per person, over persons / 20 companies and persons phone numbers
+    rng = random.Random(seed)
+    companies = max(1, persons // 20)
+    person_records, contact_records = [], []
+    for person_id in range(1, persons + 1):
+        experiences = []
+        for _ in range(rng.randint(1, 5)):
+            start = rng.randint(733000, 738000)
+            experiences.append({
+                'company': 'Company{}'.format(rng.randrange(companies)),
+                'title': 'Title',
+                'start': datetime.date.fromordinal(start).isoformat(),
+                'end': None if rng.random() < 0.2 else datetime.date.fromordinal(start + rng.randint(30, 1500)).isoformat(),
+            })
+        person_records.append({'id': person_id, 'first': 'First', 'last': 'Last', 'phone': '(555) {:07d}'.format(person_id), 'experience': experiences})
+        for _ in range(rng.randint(1, 5)):
+            contact_records.append({
+                'id': len(contact_records) + 1, 'owner_id': person_id, 'contact_nickname': 'Nickname',
+                'phone': [{'number': '(555) {:07d}'.format(rng.randint(1, persons)), 'type': 'cell'}],
+            })
+    return person_records, contact_records
+
+
+def time_per_lookup(lookup, person_ids):
+    started = time.perf_counter()
+    for person_id in person_ids:
+        lookup(person_id)
+    return (time.perf_counter() - started) / len(person_ids)
+
+
+def run(sizes, lookups):
+    print('{:>8} {:>9} {:>14} {:>14} {:>14} {:>14} {:>10}'.format(
+        'persons', 'contacts', 'scan contacts', 'index contacts', 'scan exps', 'index exps', 'index build'))
+    for persons in sizes:
+        person_records, contact_records = synthetic_records(persons)
+        person_ids = random.Random(1).sample(range(1, persons + 1), min(lookups, persons))
+
+        started = time.perf_counter()
+        index = DirectReadIndex(person_records, contact_records)
+        build = time.perf_counter() - started
+
+        timings = [
+            time_per_lookup(lambda person_id: find_connections_via_contacts(person_records, person_id, contact_records), person_ids),
+            time_per_lookup(lambda person_id: find_connections_via_contacts_indexed(index, person_id), person_ids),
+            time_per_lookup(lambda person_id: find_connections_via_experiences(person_records, person_id), person_ids),
+            time_per_lookup(lambda person_id: find_connections_via_experiences_indexed(index, person_id), person_ids),
+        ]
+        print('{:>8} {:>9} {:>12.3f}ms {:>12.3f}ms {:>12.3f}ms {:>12.3f}ms {:>8.1f}ms'.format(
+            persons, len(contact_records), *(1000 * timing for timing in timings), 1000 * build))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the scanning and indexed direct_read_data lookups.')
+    parser.add_argument('--sizes', default='250,500,1000,2000', help='Comma separated numbers of persons. Defaults to 250,500,1000,2000.')
+    parser.add_argument('--lookups', type=int, default=20, help='The number of person IDs looked up per size. Defaults to 20.')
+    args = parser.parse_args()
+    run([int(size) for size in args.sizes.split(',')], args.lookups)
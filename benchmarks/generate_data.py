@@ -0,0 +1,47 @@
+"""
+Writes a synthetic `persons.json` and `contacts.json` of any size with `SyntheticDataGenerator`.
+
+Records are written one at a time, so 10M persons take about as little memory as 1k.
+
+Usage:
+    python benchmarks/generate_data.py --persons 1000000 --out /tmp/data [--seed 0] [--company-skew 1.1] ...
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.lib.helpers.synthetic_data import SyntheticDataGenerator
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write synthetic persons.json and contacts.json files.')
+    parser.add_argument('--persons', type=int, required=True, help='The number of persons, e.g. 1000 to 10000000.')
+    parser.add_argument('--out', required=True, help='The directory of the persons.json and contacts.json files.')
+    parser.add_argument('--seed', type=int, default=0, help='The random seed. Defaults to 0.')
+    parser.add_argument('--companies', type=int, default=None, help='The number of companies. Defaults to one per 10 persons.')
+    parser.add_argument('--company-skew', type=float, default=0.8, help='The Zipf exponent of the company sizes, 0 for uniform. Defaults to 0.8.')
+    parser.add_argument('--experiences', type=float, default=2.5, help='The mean number of experiences per person. Defaults to 2.5.')
+    parser.add_argument('--median-tenure-days', type=int, default=720, help='The median length of an experience in days. Defaults to 720.')
+    parser.add_argument('--current-share', type=float, default=0.2, help='The share of experiences with no end date. Defaults to 0.2.')
+    parser.add_argument('--phone-format-variety', type=float, default=0.5, help='The share of phones not written as (123) 456-7890. Defaults to 0.5.')
+    parser.add_argument('--contacts', type=float, default=3, help='The mean number of contacts per person. Defaults to 3.')
+    parser.add_argument('--known-contact-share', type=float, default=0.5, help='The share of contact phones belonging to a person. Defaults to 0.5.')
+    args = parser.parse_args(argv)
+
+    generator = SyntheticDataGenerator(
+        args.persons, seed=args.seed, companies=args.companies, company_skew=args.company_skew,
+        experiences_per_person=args.experiences, median_tenure_days=args.median_tenure_days,
+        current_share=args.current_share, phone_format_variety=args.phone_format_variety,
+        contacts_per_person=args.contacts, known_contact_share=args.known_contact_share
+    )
+    os.makedirs(args.out, exist_ok=True)
+    started = time.perf_counter()
+    stats = generator.write(os.path.join(args.out, 'persons.json'), os.path.join(args.out, 'contacts.json'))
+    print('Wrote {persons} persons, {experiences} experiences and {contacts} contacts'.format(**stats), end=' ')
+    print('to {} in {:.1f}s'.format(args.out, time.perf_counter() - started))
+
+
+if __name__ == '__main__':
+    main()
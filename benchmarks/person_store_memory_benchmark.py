@@ -0,0 +1,61 @@
+"""
+Reports the memory used per person by the records loaded with `json.load`, one dict per record and
+field, against a `PersonStore` built from the same JSON file.
+
+Memory is measured with `tracemalloc` as the bytes still allocated once the records are loaded.
+
+Usage:
+    python benchmarks/person_store_memory_benchmark.py [--persons 100000]
+"""
+import os
+import gc
+import sys
+import json
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from direct_read_data_benchmark import synthetic_records
+from src.services.person_store import PersonStore
+
+
+def retained_bytes(load):
+    gc.collect()
+    tracemalloc.start()
+    loaded = load()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return loaded, size
+
+
+def run(persons):
+    person_records, _ = synthetic_records(persons)
+    experiences = sum(len(person['experience']) for person in person_records)
+    with tempfile.TemporaryDirectory() as directory:
+        file = os.path.join(directory, 'persons.json')
+        with open(file, 'w') as f:
+            json.dump(person_records, f)
+        del person_records
+
+        def load_dicts():
+            with open(file, 'r') as f:
+                return json.load(f)
+
+        records, dict_bytes = retained_bytes(load_dicts)
+        del records
+        store, store_bytes = retained_bytes(lambda: PersonStore.from_json(file))
+
+    print('persons: {}, experiences: {}'.format(persons, experiences))
+    print('{:>12} {:>14} {:>16}'.format('', 'bytes', 'bytes/person'))
+    print('{:>12} {:>14} {:>16.1f}'.format('dicts', dict_bytes, dict_bytes / persons))
+    print('{:>12} {:>14} {:>16.1f}'.format('PersonStore', store_bytes, store_bytes / persons))
+    print('PersonStore uses {:.1f}x less memory'.format(dict_bytes / store_bytes))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the memory used by dict records and by a PersonStore.')
+    parser.add_argument('--persons', type=int, default=100000, help='The number of synthetic persons. Defaults to 100000.')
+    run(parser.parse_args().persons)
@@ -0,0 +1,227 @@
+"""
+Benchmarks both lookup engines on a synthetic dataset, and compares the results with a stored baseline.
+
+For each engine the suite measures:
+
+- ingest_s: the time to turn the JSON files into something that answers lookups. For `direct` it is
+  loading the persons into a `PersonStore` and the contacts, and building a `DirectReadIndex`, for `db`
+  it is a streaming `Migration` into a new store.
+- single_lookup_ms: the median time of one person lookup, `find_connections_via_*_indexed` for `direct`,
+  `PersonRepository.get_person_relationships()` for `db`.
+- batch_lookup_s: the time to look up `--batch` persons in one go, `resolve_relationships()` for `db`.
+- memory_bytes: for `direct` the bytes still allocated once the records and the index are loaded, for
+  `db` the peak bytes allocated during the ingest, both measured with `tracemalloc` in a separate run.
+
+Times are the median of `--repeats` runs. With `--save-baseline` the results are written to
+`benchmarks/baselines/<persons>.json`; otherwise they are compared with that file when it exists, any metric
+more than `--tolerance` above its baseline is flagged, and the suite exits with status 1.
+
+Baselines only compare runs on the same machine: save them on the machine the suite runs on.
+
+Usage:
+    python benchmarks/suite.py [--persons 2000] [--engines direct,db] [--save-baseline | --tolerance 0.25]
+"""
+import os
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from src.lib.database import store
+from src.lib.database.migration.models.db import db
+from src.lib.database.migration.migration import Migration
+from src.lib.helpers.synthetic_data import SyntheticDataGenerator
+from src.services.direct_read_data import (
+    load_contacts,
+    DirectReadIndex, find_connections_via_contacts_indexed, find_connections_via_experiences_indexed
+)
+from src.services.person_relationships import PersonRepository, resolve_relationships
+from src.services.person_store import PersonStore
+
+BASELINE_DIR = os.path.join(ROOT, 'benchmarks', 'baselines')
+
+ENGINES = ('direct', 'db')
+
+METRICS = ('ingest_s', 'single_lookup_ms', 'batch_lookup_s', 'memory_bytes')
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def traced_bytes(function, peak=False):
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    gc.collect()
+    current, highest = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, highest if peak else current
+
+
+class DirectEngine:
+    """The lookups of `src/services/direct_read_data.py`, over the persons held in a `PersonStore` and the contact records held in memory."""
+
+    def __init__(self, files):
+        self.files = files
+
+    def ingest(self):
+        self.index = DirectReadIndex(PersonStore.from_json(self.files['person_records']), load_contacts(self.files['contact_records']))
+
+    def lookup(self, person_id):
+        return find_connections_via_contacts_indexed(self.index, person_id) + find_connections_via_experiences_indexed(self.index, person_id)
+
+    def batch_lookup(self, person_ids):
+        return [self.lookup(person_id) for person_id in person_ids]
+
+    def memory(self):
+        return traced_bytes(self.ingest)[1]
+
+    def close(self):
+        self.index = None
+
+
+class DatabaseEngine:
+    """The `PersonRepository` lookups, over a store built by a streaming `Migration` in a temporary directory."""
+
+    def __init__(self, files):
+        self.files = files
+        self.directory = None
+
+    def ingest(self):
+        self.close()
+        self.directory = tempfile.mkdtemp(prefix='allari-benchmark-')
+        store.open_store(path=self.directory, files=self.files)
+        Migration(stream=True, files=self.files)
+        self.repository = PersonRepository()
+
+    def lookup(self, person_id):
+        return self.repository.get_person_relationships(person_id=person_id)
+
+    def batch_lookup(self, person_ids):
+        return list(resolve_relationships(person_ids))
+
+    def memory(self):
+        return traced_bytes(self.ingest, peak=True)[1]
+
+    def close(self):
+        if not db.is_closed():
+            db.close()
+        db.init(None)
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
+            os.rmdir(self.directory)
+            self.directory = None
+
+
+def measure(engine, person_ids, batch_ids, repeats):
+    ingest = statistics.median(timed(engine.ingest)[1] for _ in range(repeats))
+    single = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for person_id in person_ids:
+            engine.lookup(person_id)
+        single.append((time.perf_counter() - started) / len(person_ids))
+    batch = statistics.median(timed(lambda: engine.batch_lookup(batch_ids))[1] for _ in range(repeats))
+    memory = engine.memory()
+    engine.close()
+    return {'ingest_s': ingest, 'single_lookup_ms': 1000 * statistics.median(single), 'batch_lookup_s': batch, 'memory_bytes': memory}
+
+
+def run(persons, engines, seed=0, repeats=3, lookups=50, batch=500, data=None):
+    """
+    Generates the dataset, unless `data` holds one, and returns the metrics of each engine.
+    """
+    with tempfile.TemporaryDirectory(prefix='allari-data-') as directory:
+        directory = data or directory
+        files = {
+            'person_records': os.path.join(directory, 'persons.json'),
+            'contact_records': os.path.join(directory, 'contacts.json'),
+        }
+        if data is None:
+            SyntheticDataGenerator(persons, seed=seed).write(files['person_records'], files['contact_records'])
+
+        rng = random.Random(seed)
+        person_ids = [rng.randint(1, persons) for _ in range(lookups)]
+        batch_ids = [rng.randint(1, persons) for _ in range(batch)]
+        engine_classes = {'direct': DirectEngine, 'db': DatabaseEngine}
+        return {name: measure(engine_classes[name](files), person_ids, batch_ids, repeats) for name in engines}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the results next to the baseline and returns the `engine.metric` names more than `tolerance` above it.
+    """
+    regressions = []
+    print('{:<8} {:<18} {:>14} {:>14} {:>9}'.format('engine', 'metric', 'baseline', 'current', 'change'))
+    for engine, metrics in results.items():
+        for metric in METRICS:
+            current = metrics[metric]
+            previous = baseline.get(engine, {}).get(metric)
+            if not previous:
+                print('{:<8} {:<18} {:>14} {:>14.6g} {:>9}'.format(engine, metric, '-', current, '-'))
+                continue
+            change = current / previous - 1
+            flag = ''
+            if change > tolerance:
+                regressions.append('{}.{}'.format(engine, metric))
+                flag = '  REGRESSION'
+            print('{:<8} {:<18} {:>14.6g} {:>14.6g} {:>+8.1%}{}'.format(engine, metric, previous, current, change, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the direct_read_data and database lookup engines.')
+    parser.add_argument('--persons', type=int, default=2000, help='The number of synthetic persons. Defaults to 2000.')
+    parser.add_argument('--engines', default=','.join(ENGINES), help='Comma separated engines among direct,db. Defaults to both.')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the dataset and of the looked up IDs. Defaults to 0.')
+    parser.add_argument('--repeats', type=int, default=3, help='The number of runs each time is the median of. Defaults to 3.')
+    parser.add_argument('--lookups', type=int, default=50, help='The number of single lookups per run. Defaults to 50.')
+    parser.add_argument('--batch', type=int, default=500, help='The number of persons of the batch lookup. Defaults to 500.')
+    parser.add_argument('--data', default=None, help='A directory holding persons.json and contacts.json to use instead of generating them.')
+    parser.add_argument('--baseline', default=None, help='The baseline file. Defaults to benchmarks/baselines/<persons>.json.')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline instead of comparing them.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='The relative slowdown flagged as a regression. Defaults to 0.25.')
+    args = parser.parse_args(argv)
+
+    engines = [engine for engine in args.engines.split(',') if engine]
+    unknown = set(engines) - set(ENGINES)
+    if unknown:
+        parser.error('unknown engines: {}'.format(', '.join(sorted(unknown))))
+
+    results = run(args.persons, engines, seed=args.seed, repeats=args.repeats, lookups=args.lookups, batch=args.batch, data=args.data)
+    baseline_file = args.baseline or os.path.join(BASELINE_DIR, '{}.json'.format(args.persons))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_file), exist_ok=True)
+        with open(baseline_file, 'w') as f:
+            json.dump({'persons': args.persons, 'seed': args.seed, 'results': results}, f, indent=4)
+        compare(results, {}, args.tolerance)
+        print('Saved the baseline {}'.format(baseline_file))
+        return 0
+
+    baseline = {}
+    if os.path.exists(baseline_file):
+        with open(baseline_file, 'r') as f:
+            baseline = json.load(f)['results']
+    else:
+        print('No baseline {}, run with --save-baseline to create it'.format(baseline_file), file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print('Regressions above {:.0%}: {}'.format(args.tolerance, ', '.join(regressions)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,171 @@
-from src.services.person_relationships import execute
+import os
+import sys
+import argparse
+
+# Get the root directory of the project
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Add the root directory to the Python path
+sys.path.append(ROOT_DIR)
+from src.services.person_relationships import execute, execute_many, execute_cluster
+from src.lib.database.migration.models.db import db
+from src.lib.database.store import collect_stale_stores, is_store_ready, store_file
+from src.lib.helpers.profiling import profiler
+# The ingest, delta and traversal code is imported by the options that use it, so a lookup
+# against a ready store only loads the lookup code
+
+
 def main(person_id=0):
     execute(person_id)
-    
+
+
+def main_many(person_ids=None, output_format='text'):
+    return execute_many(person_ids, output_format=output_format)
+
+
+def parse_range(value):
+    """
+    Parses an inclusive `START:END` range of person IDs.
+    """
+    try:
+        start, end = (int(bound) for bound in value.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid range {!r}, expected START:END'.format(value))
+    return range(start, end + 1)
+
+
+def read_ids_file(file):
+    """
+    Yields the person IDs of a file, one per line, skipping blank lines and `#` comments. `-` reads the standard input.
+    """
+    f = sys.stdin if file == '-' else open(file, 'r')
+    try:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                yield int(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def iter_person_ids(args):
+    """
+    Yields the person IDs selected on the command line: the positional IDs, then the ranges, then the files.
+    """
+    yield from args.person_ids
+    for person_ids in args.range or []:
+        yield from person_ids
+    for file in args.file or []:
+        yield from read_ids_file(file)
+
+
+def run_subcommand(argv):
+    """
+    Runs the `path` and `within` subcommands, which walk the connection graph over several hops, the `cluster` subcommand, which lists the connected component of a person, and the `snapshot` subcommand, which writes the graph to a file `path` and `within` can read with `--snapshot`.
+
+    Returns:
+        int: The exit status, 1 if no path or person was found.
+    """
+    parser = argparse.ArgumentParser(prog='main.py', description='Walk the connection graph beyond direct connections.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    path = commands.add_parser('path', help='Find a shortest connection path between two persons.')
+    path.add_argument('source_id', type=int)
+    path.add_argument('target_id', type=int)
+    path.add_argument('--max-hops', type=int, default=None, help='Give up on paths longer than this.')
+    path.add_argument('--format', choices=['text', 'json'], default='text')
+    path.add_argument('--snapshot', default=None, metavar='PATH', help='Walk a graph snapshot file instead of the store.')
+    within = commands.add_parser('within', help='Find every person within K connections of a person.')
+    within.add_argument('person_id', type=int)
+    within.add_argument('--hops', type=int, default=2, help='The maximum number of hops. Defaults to 2.')
+    within.add_argument('--format', choices=['text', 'json'], default='text')
+    within.add_argument('--snapshot', default=None, metavar='PATH', help='Walk a graph snapshot file instead of the store.')
+    cluster = commands.add_parser('cluster', help='Find the cluster of a person and list its members, one page at a time.')
+    cluster.add_argument('person_id', type=int)
+    cluster.add_argument('--after', type=int, default=None, metavar='PERSON_ID', help='Start the page after this member ID, as printed at the end of the previous page.')
+    cluster.add_argument('--page-size', type=int, default=100, help='The maximum number of members listed. Defaults to 100.')
+    cluster.add_argument('--format', choices=['text', 'json'], default='text')
+    snapshot = commands.add_parser('snapshot', help='Write the connection graph to a memory-mappable snapshot file.')
+    snapshot.add_argument('file', metavar='PATH')
+    snapshot.add_argument('--verify', action='store_true', help='Check the checksums of every section of the snapshot file instead of writing it. Readers only check its header.')
+    args = parser.parse_args(argv)
+
+    from src.services.connection_traversal import execute_path, execute_within
+    if args.command == 'path':
+        found = execute_path(args.source_id, args.target_id, max_hops=args.max_hops, output_format=args.format, snapshot=args.snapshot)
+    elif args.command == 'within':
+        found = execute_within(args.person_id, args.hops, output_format=args.format, snapshot=args.snapshot)
+    elif args.command == 'snapshot':
+        from src.services.graph_snapshot import execute_snapshot
+        execute_snapshot(args.file, verify=args.verify)
+        found = True
+    else:
+        found = execute_cluster(args.person_id, after_person_id=args.after, page_size=args.page_size, output_format=args.format)
+    return 0 if found else 1
+
+
+# Subcommands dispatched before the person lookup arguments are parsed
+SUBCOMMANDS = ('path', 'within', 'cluster', 'snapshot')
+
 
 if __name__ == "__main__":
-    import sys
-    person_id = int(sys.argv[1])
-    main(person_id)
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        sys.exit(run_subcommand(sys.argv[1:]))
+
+    parser = argparse.ArgumentParser(description='Find the persons connected to one or many persons.')
+    parser.add_argument('person_ids', type=int, nargs='*', metavar='person_id', help='The IDs of the persons whose relationships you want to find.')
+    parser.add_argument('--range', type=parse_range, action='append', metavar='START:END', help='An inclusive range of person IDs. Can be repeated.')
+    parser.add_argument('--file', action='append', metavar='PATH', help='A file with one person ID per line, or - for the standard input. Can be repeated.')
+    parser.add_argument('--all', action='store_true', help='Find the relationships of every person.')
+    parser.add_argument('--format', choices=['text', 'jsonl'], default='text', help='The output format of batch lookups. Defaults to text.')
+    parser.add_argument('--delta', action='append', metavar='PATH', help='A delta file of added, updated and deleted records to apply to the store before any lookup. Can be repeated.')
+    parser.add_argument('--refresh', action='store_true', help='Recompute the stored connections of the path, within, cluster and snapshot commands when they were computed before today, so the ongoing experiences overlap up to today. Run it once a day. Builds the store if needed.')
+    parser.add_argument('--workers', type=int, default=None, help='The number of processes consolidating the records and building the connection graph when the store is built or refreshed, 0 for every core. Builds the store if needed. Has no effect on a store already built, except with --refresh. Defaults to 1.')
+    parser.add_argument('--gc', action='store_true', help='Remove the database stores built from previous versions of the JSON files.')
+    parser.add_argument('--profile', action='store_true', help='Write the time, rows and SQL statements of each migration stage and query, and the peak RSS, as JSON to the standard error.')
+    parser.add_argument('--profile-file', default=None, metavar='PATH', help='Write the --profile report to PATH instead of the standard error. Implies --profile.')
+    parser.add_argument('--cprofile', default=None, metavar='PATH', help='Also dump the cProfile statistics of the run to PATH, to be read with pstats or snakeviz.')
+    args = parser.parse_args()
+
+    if args.profile or args.profile_file is not None or args.cprofile is not None:
+        profiler.enable(db)
+    function_profiler = None
+    if args.cprofile is not None:
+        import cProfile
+        function_profiler = cProfile.Profile()
+        function_profiler.enable()
+    try:
+        if args.gc:
+            for file in collect_stale_stores():
+                print('Removed stale store: {}'.format(file))
+
+        if args.workers is not None and not args.refresh and is_store_ready(store_file()):
+            print('The store of the current JSON files is already built, --workers {} has no effect'.format(args.workers), file=sys.stderr)
+        elif args.workers is not None:
+            from src.lib.database.migration.migration import Migration
+            Migration(stream=True, workers=args.workers, pipeline=True)
+
+        for file in args.delta or []:
+            from src.lib.database.migration.delta import DeltaMigration
+            DeltaMigration(delta_file=file)
+
+        if args.refresh:
+            from src.lib.database.migration.delta import ConnectionRefresh
+            ConnectionRefresh(workers=1 if args.workers is None else args.workers)
+
+        if args.all:
+            main_many(None, output_format=args.format)
+        elif len(args.person_ids) == 1 and not args.range and not args.file and args.format == 'text':
+            main(args.person_ids[0])
+        elif args.person_ids or args.range or args.file:
+            if main_many(iter_person_ids(args), output_format=args.format):
+                sys.exit(1)
+        elif not args.gc and not args.delta and not args.refresh and args.workers is None:
+            parser.error('a person_id, --range, --file, --all, --delta, --refresh or --workers is required')
+    finally:
+        if function_profiler is not None:
+            function_profiler.disable()
+            function_profiler.dump_stats(args.cprofile)
+        if profiler.enabled:
+            profiler.disable()
+            profiler.write_report(args.profile_file)
@@ -0,0 +1,47 @@
+import os
+import sys
+import signal
+import argparse
+import threading
+
+# Get the root directory of the project
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Add the root directory to the Python path
+sys.path.append(ROOT_DIR)
+from src.services.query_server import RelationshipService, create_server, watch_data_version
+
+
+def main(host='127.0.0.1', port=8080, socket_path=None, cache_size=10000, reload_interval=5.0, connections=4):
+    service = RelationshipService(cache_size=cache_size, connections=connections)
+    if socket_path is not None and os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = create_server(service, host=host, port=port, socket_path=socket_path)
+    stop_event = threading.Event()
+    if reload_interval > 0:
+        threading.Thread(target=watch_data_version, args=(service, reload_interval, stop_event), daemon=True).start()
+
+    # Stop gracefully on SIGTERM as well as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print('Serving data version {} on {}'.format(service.data_version, socket_path or 'http://{}:{}'.format(*server.server_address[:2])), flush=True)
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        stop_event.set()
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve person relationships over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='The TCP host to listen on. Defaults to 127.0.0.1.')
+    parser.add_argument('--port', type=int, default=8080, help='The TCP port to listen on. Defaults to 8080.')
+    parser.add_argument('--socket', metavar='PATH', help='Listen on a Unix socket instead of a TCP port.')
+    parser.add_argument('--cache-size', type=int, default=10000, help='The number of answers kept in the LRU cache. Defaults to 10000.')
+    parser.add_argument('--reload-interval', type=float, default=5.0, help='Seconds between data version checks, 0 disables reloads. Defaults to 5.')
+    parser.add_argument('--connections', type=int, default=4, help='The number of read-only connections to the store, which bounds the concurrent lookups. Defaults to 4.')
+    args = parser.parse_args()
+    main(host=args.host, port=args.port, socket_path=args.socket, cache_size=args.cache_size, reload_interval=args.reload_interval, connections=args.connections)
@@ -1,19 +1,131 @@
+import sys
+import os
+import threading
+from contextlib import contextmanager
+
+from peewee import DatabaseError, InterfaceError
+
 from src.lib.database.migration.models.db import db
+from src.lib.database.store import open_store, store_is_open_read_only, bound_store_file, connections_are_stale, connections_date
 
 
 def database_connect():
+    if db.database is None:
+        open_store()
     try:
-        db.connect()
-    except:
-        print('Database connection already exists')
-        db.close()
-        try:
-            db.connection()
-        except Exception as e:
-            msg = 'Database connection could not be established: {}'.format(e)
-            print(msg)
-            raise Exception(msg)
+        # peewee keeps one connection per thread, an open one is reused
+        db.connect(reuse_if_open=True)
+    except (DatabaseError, InterfaceError) as e:
+        msg = 'Database connection could not be established: {}'.format(e)
+        print(msg)
+        raise Exception(msg)
 
 
 def is_database_connected():
-    return False if db.is_closed() else True
\ No newline at end of file
+    return False if db.is_closed() else True
+
+
+def ensure_store(stream=True, stored_connections=False):
+    """
+    Connects the shared `db` to the store of the current JSON files, running the migration only when that store is not built yet.
+
+    A lookup against a ready store therefore never imports the ingest code (`Migration`, the bulk loader, the connection graph builder).
+
+    Args:
+        stream (bool, optional): Passed to `Migration` when the store has to be built. Defaults to True.
+        stored_connections (bool, optional): Warns on stderr when the stored connections were computed before today, so the overlaps of the ongoing experiences are shorter than they are today. The store is not written: `python main.py --refresh` recomputes them (see `ConnectionRefresh`). Used by the readers of the stored graph. Defaults to False.
+    """
+    if not is_database_connected():
+        database_connect()
+    if not store_is_open_read_only():
+        # Only imported when the store has to be built
+        from src.lib.database.migration.migration import Migration
+        Migration(stream=stream)
+    if stored_connections and connections_are_stale():
+        print('The stored connections were computed on {}, run `python main.py --refresh` to resolve the ongoing experiences to today'.format(connections_date()), file=sys.stderr)
+
+
+def build_store(stream=True):
+    """
+    Builds the store of the current JSON files in a separate process, unless it is already built, and returns its path.
+
+    The ingest binds the shared `db` of the process running it, so running it in another process leaves the `db` of this one, and the threads reading through it, on the store they are serving until `ConnectionManager.publish()` is called.
+
+    Args:
+        stream (bool, optional): Passed to `Migration`. Defaults to True.
+
+    Returns:
+        str: The path of the ready store.
+    """
+    # Only imported by the reloads of long running readers
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # A forked child would inherit the connections and locks of the reading threads
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(_build_store, stream).result()
+
+
+def _build_store(stream):
+    ensure_store(stream=stream)
+    file = bound_store_file()
+    db.close()
+    return file
+
+
+class ConnectionManager:
+    """
+    Manages the per-thread connections of the shared `db` for threads reading a published store.
+
+    peewee opens one connection per thread. A store is published with `publish()`, which binds `db` to it read-only and starts a new generation. A thread enters `reader()` around each unit of work: when its connection belongs to an older generation, it is closed and a connection to the published store is opened. The threads still reading the previous store finish on the connection they have, so publishing a new store never blocks or fails a lookup, and each lookup reads a single consistent snapshot of a single store.
+
+    Args:
+        database (peewee.Database, optional): The database. Defaults to the shared `db`.
+    """
+
+    def __init__(self, database=db):
+        self.database = database
+        self.generation = 0
+        self.published = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def publish(self, file):
+        """
+        Binds the database to a ready store, read-only. Each thread moves to it on its next `reader()`.
+
+        Args:
+            file (str): The path of the ready store.
+
+        Returns:
+            int: The new generation.
+        """
+        with self._lock:
+            self.database.init('file:{}?mode=ro'.format(os.path.abspath(file)), uri=True)
+            self.published = file
+            self.generation += 1
+            return self.generation
+
+    @contextmanager
+    def reader(self):
+        """
+        Makes sure the connection of the calling thread reads the published store for the duration of a `with` block, which receives the generation of that store.
+
+        The block runs in a read transaction, so its statements all read the same snapshot of the store, even when a delta is committed to it in the meantime (see `src.lib.database.pool.read_transaction()`).
+        """
+        with self._lock:
+            if getattr(self._local, 'generation', None) != self.generation or self.database.is_closed():
+                if not self.database.is_closed():
+                    self.database.close()
+                self.database.connect()
+                self._local.generation = self.generation
+            generation = self.generation
+        with self.database.atomic():
+            yield generation
+
+    def release(self):
+        """
+        Closes the connection of the calling thread, e.g. before the thread ends.
+        """
+        if not self.database.is_closed():
+            self.database.close()
+        self._local.generation = None
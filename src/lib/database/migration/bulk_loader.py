@@ -0,0 +1,135 @@
+"""Module providing a bulk, transactional loader for the migration models."""
+import sqlite3
+import time
+from itertools import islice
+
+# SQLite raised its default bound-parameter limit from 999 to 32766 in 3.32.0
+SQLITE_MAX_VARIABLES = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+
+# Pragmas applied while ingesting. The store is discarded when an ingest does not complete
+# (see `src.lib.database.store`), so durability can be traded for speed.
+INGEST_PRAGMAS = {
+    'journal_mode': 'memory',
+    'synchronous': 0,
+    'cache_size': -262144,
+}
+
+
+class BulkLoader:
+    """
+    Writes model rows in batches, using chunked multi-row inserts inside explicit transactions.
+
+    The loader is a context manager: entering it applies the `INGEST_PRAGMAS` and leaving it restores the pragma values found before the ingest.
+
+    Each batch is written in a single transaction. Inside a batch, the rows of every model are written with multi-row `INSERT` statements sized to the SQLite bound-parameter limit, in the order the models were first seen, so parent rows are written before the rows referencing them. The statement text is built once per table and chunk length, and the row values are bound as they are, so they must already be in their database representation.
+
+    The time spent and the rows written are accumulated per table and can be read with `get_stats()`.
+
+    Args:
+        database (peewee.Database): The database to write to.
+        batch_size (int, optional): The number of records written per transaction. Defaults to 10000.
+        pragmas (dict, optional): The pragmas to apply while ingesting. Defaults to `INGEST_PRAGMAS`.
+    """
+
+    def __init__(self, database, batch_size=10000, pragmas=None):
+        self.database = database
+        self.batch_size = batch_size
+        self.pragmas = INGEST_PRAGMAS if pragmas is None else pragmas
+        self._saved_pragmas = {}
+        self._stats = {}
+        self._statements = {}
+
+    def __enter__(self):
+        for key, value in self.pragmas.items():
+            self._saved_pragmas[key] = self.database.pragma(key)
+            self.database.pragma(key, value)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for key, value in self._saved_pragmas.items():
+            self.database.pragma(key, value)
+        self._saved_pragmas = {}
+        return False
+
+    def load(self, records, to_rows):
+        """
+        Writes an iterable of records, `batch_size` records per transaction.
+
+        Args:
+            records (iterable): The records to write. It is consumed lazily, one batch at a time.
+            to_rows (callable): Maps a record to a list of `(model, row)` tuples, where `row` is a dict of column values.
+
+        Returns:
+            int: The number of records written.
+        """
+        records = iter(records)
+        count = 0
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                return count
+            rows_by_model = {}
+            for record in batch:
+                for model, row in to_rows(record):
+                    rows_by_model.setdefault(model, []).append(row)
+            self.write(rows_by_model)
+            count += len(batch)
+
+    def write(self, rows_by_model):
+        """
+        Writes one batch of rows in a single transaction.
+
+        Args:
+            rows_by_model (dict): The rows to insert, keyed by model, in insertion order.
+        """
+        with self.database.atomic():
+            for model, rows in rows_by_model.items():
+                if not rows:
+                    continue
+                started = time.perf_counter()
+                keys = list(rows[0])
+                chunk_size = max(SQLITE_MAX_VARIABLES // max(len(keys), 1), 1)
+                for offset in range(0, len(rows), chunk_size):
+                    chunk = rows[offset:offset + chunk_size]
+                    params = [row[key] for row in chunk for key in keys]
+                    self.database.execute_sql(self._insert_statement(model, keys, len(chunk)), params)
+                self._add_stats(model._meta.table_name, len(rows), time.perf_counter() - started)
+
+    def get_stats(self):
+        """
+        Returns the ingest statistics per table.
+
+        Returns:
+            dict: Maps each table name to a dict with the `rows` written, the `seconds` spent and the `rows_per_sec` rate.
+        """
+        stats = {}
+        for table, (rows, seconds) in self._stats.items():
+            stats[table] = {
+                'rows'          :       rows,
+                'seconds'       :       seconds,
+                'rows_per_sec'  :       rows / seconds if seconds else float(rows),
+            }
+        return stats
+
+    def report(self):
+        """
+        Returns a human readable line per table with the rows written and the rows/sec rate.
+        """
+        return [
+            '{}: {} rows in {:.3f}s ({:.0f} rows/sec)'.format(table, stats['rows'], stats['seconds'], stats['rows_per_sec'])
+            for table, stats in self.get_stats().items()
+        ]
+
+    def _insert_statement(self, model, keys, count):
+        statement_key = (model, tuple(keys), count)
+        if statement_key not in self._statements:
+            columns = ', '.join('"{}"'.format(model._meta.combined[key].column_name) for key in keys)
+            values = '({})'.format(', '.join('?' * len(keys)))
+            self._statements[statement_key] = 'INSERT INTO "{}" ({}) VALUES {}'.format(
+                model._meta.table_name, columns, ', '.join([values] * count)
+            )
+        return self._statements[statement_key]
+
+    def _add_stats(self, table, rows, seconds):
+        total_rows, total_seconds = self._stats.get(table, (0, 0.0))
+        self._stats[table] = (total_rows + rows, total_seconds + seconds)
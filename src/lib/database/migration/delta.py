@@ -0,0 +1,349 @@
+import sys
+import json
+import datetime
+
+# Import necessary modules and models
+from src.lib.database.conn import db, database_connect, is_database_connected
+from src.lib.database.store import STORE_META_TABLE, CONNECTIONS_DATE_KEY, store_is_open_read_only, reopen_store_for_writing, bump_delta_version, mark_store_ready, set_store_meta, connections_date, connections_are_stale
+from src.lib.database.migration.migration import Migration
+from src.lib.database.migration.bulk_loader import BulkLoader
+from src.lib.database.migration.models.person_model import Person
+from src.lib.database.migration.models.experience_model import Experience
+from src.lib.database.migration.models.contact_model import Contact
+from src.lib.database.migration.models.phone_model import Phone
+from src.lib.database.migration.models.person_connection_model import PersonConnection
+from src.lib.database.migration.models.person_cluster_model import PersonCluster
+from src.services.connection_graph import build_connections, person_connections, connection_rows
+from src.services.person_clusters import build_clusters, update_clusters
+
+# The sections of a delta file and the change lists of each section
+DELTA_SECTIONS = ('persons', 'contacts')
+DELTA_CHANGES = ('added', 'updated', 'deleted')
+
+
+class DeltaMigration:
+    """
+    The `DeltaMigration` class applies a delta of person and contact records to the ready store of the current JSON files, instead of rebuilding the store from scratch.
+
+    A delta file is a JSON object with a `persons` and a `contacts` section. Each section holds an `added` and an `updated` list of records, in the same shape as the records of the full JSON files, and a `deleted` list of record IDs:
+
+        {"persons": {"added": [...], "updated": [...], "deleted": [4, 8]}, "contacts": {"added": [...], "updated": [...], "deleted": [15]}}
+
+    Added and updated records are both written as upserts keyed by `id`, so applying the same delta twice gives the same store. A person's experiences and a contact's phones are replaced as a whole, and deleting a person deletes their experiences and the contacts they own.
+
+    Only the `person_connection` rows of the affected persons are rebuilt: the changed and deleted persons and the owners of the changed and deleted contacts, before and after the change. Their connections are recomputed with `src.services.connection_graph.person_connections()`, which only reads the companies and phone keys of these persons, and replace their previous connections in both directions. The clusters are then updated with `src.services.person_clusters.update_clusters()`: the added connections merge clusters, and only the clusters that lost a connection are recomputed. The indexes are maintained by SQLite as the rows change.
+
+    The null end dates of the ongoing experiences are resolved to the date recorded when the connections were built, so a store never mixes overlaps computed on different days; `ConnectionRefresh` moves that date forward.
+
+    The whole delta is applied in a single transaction, then the delta version of the store is incremented so that `current_data_version()` changes and long-lived readers such as the query server drop their cached answers.
+    """
+
+    # private property delta data
+    _delta_data = None
+
+    # private property counters of the applied changes
+    _stats = None
+
+    # private property previous clusters of the deleted persons
+    _deleted_clusters = None
+
+    # private property connected pairs removed and added by the delta
+    _removed_pairs = None
+    _added_pairs = None
+
+    # private property date the null end dates are resolved to
+    _today = None
+
+    def __init__(self, delta_file=None, delta_data=None):
+        """
+        Initializes the DeltaMigration class and applies the delta. This method performs the following tasks:
+        1. Opens the store of the current JSON files, running the full migration first if it is not built yet.
+        2. Loads and validates the delta.
+        3. Applies the person and contact changes and rebuilds the connections and clusters of the affected persons.
+        4. Increments the delta version and reopens the store read-only.
+
+        Args:
+            delta_file (str, optional): The path of the delta JSON file.
+            delta_data (dict, optional): The delta itself, used when `delta_file` is not given.
+
+        Raises:
+            Exception: If the delta could not be loaded or applied. The store is left unchanged.
+        """
+        self._stats = {'{}_{}'.format(section, change): 0 for section in DELTA_SECTIONS for change in DELTA_CHANGES}
+        self._stats.update({'affected_persons': 0, 'connections_removed': 0, 'connections_added': 0, 'cluster_members_updated': 0, 'delta_version': None})
+        self._deleted_clusters = set()
+        self._removed_pairs = set()
+        self._added_pairs = set()
+        self._delta_data = self.load_delta_file_data(delta_file) if delta_file is not None else delta_data
+        self.validate_delta_data()
+
+        self.database_connect()
+        if not store_is_open_read_only():
+            Migration(stream=True)
+        reopen_store_for_writing()
+        self._today = connections_date() or datetime.date.today()
+        try:
+            with db.atomic():
+                affected = self.apply_person_changes()
+                affected |= self.apply_contact_changes()
+                self.update_connection_records(affected)
+                self.update_cluster_records(affected)
+                self._stats['delta_version'] = bump_delta_version()
+        except Exception as e:
+            msg = 'Delta migration could not be completed: {}'.format(e)
+            print(msg)
+            raise Exception(msg)
+        finally:
+            mark_store_ready()
+        print('Delta: {}'.format(json.dumps(self._stats)), file=sys.stderr)
+
+    def get_stats(self):
+        """
+        Returns the number of records added, updated and deleted per section, the number of affected persons, the connection rows removed and added, the persons whose cluster was recomputed, and the new delta version.
+        """
+        return self._stats
+
+    # Method to connect to the database
+    def database_connect(self):
+        """
+        Attempts to connect to the database if it is not already connected.
+        """
+        if not is_database_connected():
+            database_connect()
+
+    # Method to load the delta from a file
+    def load_delta_file_data(self, delta_file):
+        """
+        Loads the delta JSON object from a file.
+
+        Args:
+            delta_file (str): The path of the delta file.
+
+        Returns:
+            dict: The delta.
+
+        Raises:
+            Exception: If the file could not be loaded.
+        """
+        try:
+            with open(delta_file, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            msg = 'load_delta_file_data({}): File could not be loaded: {}'.format(delta_file, e)
+            print(msg)
+            raise Exception(msg)
+
+    def validate_delta_data(self):
+        """
+        Checks that the delta is an object with only known sections and change lists, filling the missing ones with empty lists.
+
+        Raises:
+            Exception: If the delta has an unexpected shape.
+        """
+        if not isinstance(self._delta_data, dict) or set(self._delta_data) - set(DELTA_SECTIONS):
+            msg = 'validate_delta_data(): The delta must be an object with {} sections'.format(' and '.join(DELTA_SECTIONS))
+            print(msg)
+            raise Exception(msg)
+        for section in DELTA_SECTIONS:
+            changes = self._delta_data.setdefault(section, {})
+            if not isinstance(changes, dict) or set(changes) - set(DELTA_CHANGES):
+                msg = 'validate_delta_data(): The {} section must be an object with {} lists'.format(section, ', '.join(DELTA_CHANGES))
+                print(msg)
+                raise Exception(msg)
+            for change in DELTA_CHANGES:
+                if not isinstance(changes.setdefault(change, []), list):
+                    msg = 'validate_delta_data(): {}.{} must be a list'.format(section, change)
+                    print(msg)
+                    raise Exception(msg)
+
+    def apply_person_changes(self):
+        """
+        Deletes, then upserts, the persons of the delta along with their experiences.
+
+        Returns:
+            set: The IDs of the affected persons.
+        """
+        changes = self._delta_data['persons']
+        affected = set()
+
+        for person_id in changes['deleted']:
+            contact_ids = [contact.id for contact in Contact.select(Contact.id).where(Contact.owner == person_id)]
+            if contact_ids:
+                Phone.delete().where(Phone.contact.in_(contact_ids)).execute()
+                Contact.delete().where(Contact.id.in_(contact_ids)).execute()
+            Experience.delete().where(Experience.person == person_id).execute()
+            self._delete_connection_records([person_id])
+            membership = PersonCluster.select(PersonCluster.cluster).where(PersonCluster.person == person_id).tuples().first()
+            if membership is not None:
+                self._deleted_clusters.add(membership[0])
+                PersonCluster.delete().where(PersonCluster.person == person_id).execute()
+            if Person.delete().where(Person.id == person_id).execute():
+                self._stats['persons_deleted'] += 1
+            affected.add(person_id)
+
+        for change in ('added', 'updated'):
+            for record in changes[change]:
+                person = Migration.consolidate_person(record)
+                rows = Migration.person_rows(person)
+                Person.insert(rows[0][1]).on_conflict(
+                    conflict_target=[Person.id],
+                    preserve=[Person.first_name, Person.last_name, Person.phone, Person.phone_key]
+                ).execute()
+                Experience.delete().where(Experience.person == person['id']).execute()
+                if person['experiences']:
+                    Experience.insert_many(person['experiences']).execute()
+                self._stats['persons_{}'.format(change)] += 1
+                affected.add(person['id'])
+        return affected
+
+    def apply_contact_changes(self):
+        """
+        Deletes, then upserts, the contacts of the delta along with their phones.
+
+        Returns:
+            set: The IDs of the owners of the changed contacts, before and after the change.
+        """
+        changes = self._delta_data['contacts']
+        affected = set()
+
+        for contact_id in changes['deleted']:
+            owner_id = self._contact_owner_id(contact_id)
+            if owner_id is None:
+                continue
+            Phone.delete().where(Phone.contact == contact_id).execute()
+            Contact.delete().where(Contact.id == contact_id).execute()
+            self._stats['contacts_deleted'] += 1
+            affected.add(owner_id)
+
+        for change in ('added', 'updated'):
+            for record in changes[change]:
+                contact = Migration.consolidate_contact(record)
+                rows = Migration.contact_rows(contact)
+                previous_owner_id = self._contact_owner_id(contact['id'])
+                if previous_owner_id is not None:
+                    affected.add(previous_owner_id)
+                Contact.insert(rows[0][1]).on_conflict(
+                    conflict_target=[Contact.id],
+                    preserve=[Contact.owner, Contact.nickname]
+                ).execute()
+                Phone.delete().where(Phone.contact == contact['id']).execute()
+                if contact['phones']:
+                    Phone.insert_many(contact['phones']).execute()
+                self._stats['contacts_{}'.format(change)] += 1
+                affected.add(contact['owner_id'])
+        return affected
+
+    def update_connection_records(self, affected):
+        """
+        Replaces the connections of the affected persons, in both directions, with their recomputed connections.
+
+        Args:
+            affected (set): The IDs of the affected persons.
+        """
+        self._stats['affected_persons'] = len(affected)
+        if not affected:
+            return
+        self._delete_connection_records(affected)
+        connections = person_connections(db, affected, today=self._today)
+        rows = list(connection_rows(connections))
+        for i in range(0, len(rows), 500):
+            PersonConnection.insert_many(rows[i:i + 500]).execute()
+        self._stats['connections_added'] += len(rows)
+        # The pairs whose connection was only recomputed neither merge nor split clusters
+        self._added_pairs = connections.keys() - self._removed_pairs
+        self._removed_pairs -= connections.keys()
+
+    def update_cluster_records(self, affected):
+        """
+        Updates the clusters merged by the added connections and recomputes the ones that lost a connection or a deleted person.
+
+        Args:
+            affected (set): The IDs of the affected persons.
+        """
+        if affected:
+            self._stats['cluster_members_updated'] = update_clusters(db, self._added_pairs, self._removed_pairs, affected, self._deleted_clusters)
+
+    def _delete_connection_records(self, person_ids):
+        # Connections are stored in both directions, so the reverse rows are found from the forward ones
+        edges = []
+        for person_id in person_ids:
+            for (other_id,) in db.execute_sql('SELECT person_b FROM person_connection WHERE person_a = ?', (person_id,)):
+                edges.append((person_id, other_id))
+                edges.append((other_id, person_id))
+                self._removed_pairs.add((person_id, other_id) if person_id < other_id else (other_id, person_id))
+        if edges:
+            db.cursor().executemany('DELETE FROM person_connection WHERE person_a = ? AND person_b = ?', edges)
+            self._stats['connections_removed'] += len(set(edges))
+
+    @staticmethod
+    def _contact_owner_id(contact_id):
+        row = Contact.select(Contact.owner).where(Contact.id == contact_id).tuples().first()
+        return None if row is None else row[0]
+
+
+class ConnectionRefresh:
+    """
+    The `ConnectionRefresh` class resolves the null end dates of the connections stored in the ready store of the current JSON files to today, once the date they were resolved to is past. It is a maintenance step, run by `python main.py --refresh`, e.g. once a day: the commands reading the store never write to it.
+
+    Ongoing experiences are common, so their persons reach most of the graph and recomputing them one by one costs more than a build: the `person_connection`, `cluster` and `person_cluster` tables are rebuilt from the records, as by the full migration, in a single transaction. The new date is recorded in the store metadata and the delta version is incremented in the same transaction, so long-lived readers drop their cached answers.
+
+    The transaction takes the write lock of the store before checking the recorded date, so concurrent refreshes run one after the other and the later ones find the connections up to date.
+    """
+
+    # private property counters of the refresh
+    _stats = None
+
+    def __init__(self, today=None, workers=1):
+        """
+        Initializes the ConnectionRefresh class and refreshes the connections if they were resolved to an earlier date, running the full migration first if the store is not built yet.
+
+        Args:
+            today (datetime.date, optional): The date the null end dates are resolved to. Defaults to today.
+            workers (int, optional): The number of worker processes computing the connection graph, see `build_connections()`. Defaults to 1.
+
+        Raises:
+            Exception: If the connections could not be refreshed. The store is left unchanged.
+        """
+        today = today or datetime.date.today()
+        self._stats = {'refreshed': False, 'connections': 0, 'clusters': 0, 'delta_version': None}
+
+        if not is_database_connected():
+            database_connect()
+        if not store_is_open_read_only():
+            Migration(stream=True)
+        if not connections_are_stale(today):
+            return
+        reopen_store_for_writing()
+        try:
+            with db.atomic(lock_type='IMMEDIATE'):
+                # Read under the write lock, so a refresh committed meanwhile is seen
+                row = db.execute_sql('SELECT value FROM {} WHERE key = ?'.format(STORE_META_TABLE), (CONNECTIONS_DATE_KEY,)).fetchone()
+                if row is None or datetime.date.fromisoformat(row[0]) < today:
+                    self.rebuild_connection_records(today, workers)
+                    set_store_meta(CONNECTIONS_DATE_KEY, today.isoformat())
+                    self._stats['delta_version'] = bump_delta_version()
+                    self._stats['refreshed'] = True
+        except Exception as e:
+            msg = 'Connection refresh could not be completed: {}'.format(e)
+            print(msg)
+            raise Exception(msg)
+        finally:
+            mark_store_ready()
+        print('Connection refresh: {}'.format(json.dumps(self._stats)), file=sys.stderr)
+
+    def get_stats(self):
+        """
+        Returns whether the connections were refreshed, the connection and cluster rows written and the new delta version.
+        """
+        return self._stats
+
+    def rebuild_connection_records(self, today, workers):
+        """
+        Replaces the connections and the clusters with the ones computed from the records, the null end dates standing for `today`.
+        """
+        for table in ('person_connection', 'person_cluster', 'cluster'):
+            db.execute_sql('DELETE FROM "{}"'.format(table))
+        # Not entered, so the ingest pragmas are not applied to the published store
+        loader = BulkLoader(db)
+        self._stats['connections'] = loader.load(connection_rows(build_connections(db, today=today, workers=workers)), lambda row: [(PersonConnection, row)])
+        self._stats['clusters'] = loader.load(build_clusters(db), lambda row: [row])
@@ -1,18 +1,26 @@
+import sys
 import json
+import time
+import datetime
 
 # Import necessary modules and models
 from src.lib.database.conn import db, database_connect, is_database_connected
+from src.lib.database.store import FILES, CONNECTIONS_DATE_KEY, store_is_open_read_only, mark_store_ready, set_store_meta
 from src.lib.database.migration.models.person_model import Person
 from src.lib.database.migration.models.experience_model import Experience
 from src.lib.database.migration.models.contact_model import Contact
 from src.lib.database.migration.models.phone_model import Phone
-from src.lib.helpers.format import normalize_phone
+from src.lib.database.migration.models.person_connection_model import PersonConnection
+from src.lib.database.migration.models.person_cluster_model import Cluster, PersonCluster
+from src.lib.database.migration.bulk_loader import BulkLoader
+from src.lib.helpers.format import normalize_phone, canonical_phone_key
+from src.lib.helpers.json_stream import iter_json_array
+from src.lib.helpers.profiling import profiler
+from src.services.connection_graph import build_connections, connection_rows
+from src.services.person_clusters import build_clusters
 
-# Define file paths for JSON data
-FILES = {
-    'person_records'    : 'src/lib/database/migration/data/persons.json',
-    'contact_records'   : 'src/lib/database/migration/data/contacts.json'
-}
+# Models written by the migration, parents first
+MODELS = [Person, Experience, Contact, Phone, PersonConnection, Cluster, PersonCluster]
 
 
 class Migration:
@@ -24,12 +32,16 @@ class Migration:
     3. Loading JSON data from files
     4. Consolidating and transforming the loaded data
     5. Creating person and contact records in the database
+    6. Computing the connection graph once and storing it in the `person_connection` table
+    7. Computing the connected components of the graph and storing them in the `cluster` and `person_cluster` tables
+    
+    The database is a content-addressed store (see `src.lib.database.store`): when a store already exists for the current JSON files and schema version, it is opened read-only and the ingest steps are skipped.
     
     The class has several private properties to store the loaded data, and various methods to perform the different migration tasks.
     
     The `database_connect()` method ensures the database connection is established before proceeding with the migration.
     
-    The `migrate_tables()` method creates the necessary database tables (Person, Experience, Contact, Phone) if they don't already exist.
+    The `migrate_tables()` method creates the necessary database tables (Person, Experience, Contact, Phone) if they don't already exist. Their indexes are only created by `create_indexes()`, once the records are written, so the bulk load does not maintain them row by row.
     
     The `load_json_file_data()` method is a helper function to load JSON data from a file, specified by a file key.
     
@@ -37,7 +49,15 @@ class Migration:
     
     The `consolidate_persons_data()` and `consolidate_contacts_data()` methods transform the loaded JSON data into a more structured format, ready for insertion into the database.
     
-    The `create_person_records()` and `create_contact_records()` methods create the actual records in the database, based on the consolidated data.
+    The `create_person_records()` and `create_contact_records()` methods create the actual records in the database, based on the consolidated data, through a `BulkLoader` that writes batches of multi-row inserts inside transactions.
+    
+    The `create_connection_records()` method computes the combined experience/contact graph from the written records and stores it as indexed edges, so relationship lookups read a person's edges instead of recomputing both rules.
+    
+    The `create_cluster_records()` method groups the persons into the connected components of that graph with a union-find pass over the stored edges (see `src.services.person_clusters`).
+    
+    In streaming mode (`Migration(stream=True)`) the JSON files are never fully loaded: `stream_persons_data()` and `stream_contacts_data()` parse the root level arrays record by record and consolidate each record on its way to the bulk loader, so memory stays flat regardless of the file sizes.
+    
+    In pipeline mode (`Migration(pipeline=True)`) the `create_pipelined_records()` method replaces the load, consolidate and create records steps: both files are parsed, consolidated by a process pool and written concurrently, through bounded queues (see `src.lib.database.migration.pipeline`).
     """
     
     # private property persons data
@@ -46,8 +66,26 @@ class Migration:
     # private property contacts data
     _contacts_data = []
     
+    # private property bulk loader used by the create records methods
+    _bulk_loader: BulkLoader = None
+    
+    # private property streaming mode flag
+    _stream = False
+    
+    # private property number of worker processes building the connection graph
+    _workers = 1
+    
+    # private property source JSON files, keyed like `FILES`
+    _files = FILES
+    
+    # private property pipeline mode flag
+    _pipeline = False
+    
+    # private property ingest pipeline used in pipeline mode
+    _ingest_pipeline = None
+    
     # Constructor
-    def __init__(self):
+    def __init__(self, stream=False, workers=1, files=None, pipeline=False):
         """
         Initializes the Migration class. This method performs the following tasks:
         1. Connects to the database.
@@ -55,24 +93,67 @@ class Migration:
         3. Loads JSON data from files.
         4. Consolidates and transforms the loaded data.
         5. Creates person and contact records in the database.
+        6. Creates the database indexes.
+        7. Creates the person connection records.
+        8. Creates the cluster records.
+
+        Steps 2 to 8 are skipped when the connected store is already complete. In streaming mode steps 3 to 5 run as a single pass over each file, and steps 3 and 4 are timed within it. In pipeline mode they run as concurrent stages over both files, each stage timed on its own.
+
+        Each step is timed as a `Migration.<method>` section of the shared profiler when it is enabled (see `src.lib.helpers.profiling`), with the records it loaded or the rows it wrote.
+
+        Args:
+            stream (bool, optional): If True, the JSON files are parsed incrementally and fed straight into the database. Defaults to False.
+            workers (int, optional): The number of worker processes computing the connection graph, 0 for every core. Defaults to 1.
+            files (dict, optional): The source JSON files, keyed like `FILES`. Defaults to `FILES`. The store bound to `db` should be the store of these files (see `open_store()`).
+            pipeline (bool, optional): If True, the JSON files are parsed, consolidated by `workers` processes and written in concurrent stages. Defaults to False.
 
         Raises:
             Exception: If any error occurs during the database migration process.
         """
-        self.database_connect()
+        self._stream = stream
+        self._workers = workers
+        self._files = FILES if files is None else files
+        self._pipeline = pipeline
+        with profiler.section('Migration.database_connect'):
+            self.database_connect()
+        if store_is_open_read_only():
+            return
+
         try:
-            self.migrate_tables()
+            with profiler.section('Migration.migrate_tables'):
+                self.migrate_tables()
         except Exception as e:
             msg = 'Database migration could not be completed: {}'.format(e)
             print(msg)
             raise Exception(msg)
 
-        self.load_persons_json_file_data()
-        self.load_contacts_json_file_data()
-        self.consolidate_persons_data()
-        self.consolidate_contacts_data()
-        self.create_person_records()
-        self.create_contact_records()
+        if self._pipeline:
+            create_records = (self.create_pipelined_records,)
+        else:
+            create_records = (self.create_person_records, self.create_contact_records)
+        if not self._stream and not self._pipeline:
+            with profiler.section('Migration.load_persons_json_file_data') as section:
+                self.load_persons_json_file_data()
+                section.add_rows(len(self._persons_data))
+            with profiler.section('Migration.load_contacts_json_file_data') as section:
+                self.load_contacts_json_file_data()
+                section.add_rows(len(self._contacts_data))
+            with profiler.section('Migration.consolidate_persons_data') as section:
+                self.consolidate_persons_data()
+                section.add_rows(len(self._persons_data))
+            with profiler.section('Migration.consolidate_contacts_data') as section:
+                self.consolidate_contacts_data()
+                section.add_rows(len(self._contacts_data))
+        for stage in create_records + (self.create_indexes, self.create_connection_records, self.create_cluster_records):
+            with profiler.section('Migration.{}'.format(stage.__name__)) as section:
+                written = self._written_rows()
+                stage()
+                section.add_rows(self._written_rows() - written)
+        mark_store_ready()
+        for line in self._get_bulk_loader().report():
+            print('Migration: {}'.format(line), file=sys.stderr)
+        for line in self._ingest_pipeline.report() if self._ingest_pipeline else []:
+            print('Migration: {}'.format(line), file=sys.stderr)
     
     def get_person_data(self):
         """
@@ -80,6 +161,18 @@ class Migration:
         """
         return self._persons_data
 
+    def get_ingest_stats(self):
+        """
+        Returns the rows written and the rows/sec rate per table, as reported by the bulk loader.
+        """
+        return self._bulk_loader.get_stats() if self._bulk_loader else {}
+
+    def get_pipeline_stats(self):
+        """
+        Returns the throughput and queue depth per stage in pipeline mode, as reported by the ingest pipeline.
+        """
+        return self._ingest_pipeline.get_stats() if self._ingest_pipeline else {}
+
     def get_contacts_data(self):
         """
         Returns the contacts data loaded from the JSON file.
@@ -100,14 +193,29 @@ class Migration:
 
     def migrate_tables(self):
         """
-        Attempts to create the database tables for the Person, Experience, Contact, and Phone models. If an exception occurs during the table creation, a message is printed and the exception is re-raised.
+        Attempts to create the database tables for the Person, Experience, Contact, and Phone models, without their indexes. If an exception occurs during the table creation, a message is printed and the exception is re-raised.
         """
         try:
-            db.create_tables([Person, Experience, Contact, Phone])
+            with db.atomic():
+                for model in MODELS:
+                    model._schema.create_table(safe=True)
         except Exception as e:
             msg = 'Database migration could not be completed: {}'.format(e)
             print(msg)
             raise Exception(msg)
+    
+    def create_indexes(self):
+        """
+        Creates the indexes declared by the Person, Experience, Contact, and Phone models. If an exception occurs during the index creation, a message is printed and the exception is re-raised.
+        """
+        try:
+            with db.atomic():
+                for model in MODELS:
+                    model._schema.create_indexes(safe=True)
+        except Exception as e:
+            msg = 'Database indexes could not be created: {}'.format(e)
+            print(msg)
+            raise Exception(msg)
     # Method to create database tables
     def create_tables():
         """
@@ -134,7 +242,7 @@ class Migration:
         Loads JSON data from a file specified by the `file_key` parameter.
         
         Args:
-            file_key (str): The key to look up the file path in the `FILES` dictionary.
+            file_key (str): The key to look up the file path in the source files, `FILES` by default.
         
         Returns:
             dict: The JSON data loaded from the file.
@@ -142,7 +250,7 @@ class Migration:
         Raises:
             Exception: If the file could not be found or loaded.
         """
-        file = FILES.get(file_key, None)
+        file = self._files.get(file_key, None)
         if file is None:
             msg = 'load_json_data({}): File could not be found'.format(file_key)
             print(msg)
@@ -178,20 +286,11 @@ class Migration:
         """
         Consolidates the persons data by extracting the relevant fields and normalizing the phone numbers.
         
-        This method is responsible for transforming the raw persons data into a more structured format that can be easily used to create the database records. It extracts the first name, last name, phone number, and experiences from the original persons data, and normalizes the phone number using the `normalize_phone` function.
+        This method is responsible for transforming the raw persons data into a more structured format that can be easily used to create the database records. It extracts the ID, first name, last name, phone number, and experiences from the original persons data, normalizes the phone number using the `normalize_phone` function and derives its integer key using the `canonical_phone_key` function.
         
         The resulting consolidated data is stored in the `_persons_data` attribute, which can then be used to create the actual database records.
         """
-        consolidated_data = []
-        for person in self._persons_data:
-            consolidated_person = {
-                'first_name': person['first'],
-                'last_name': person['last'],
-                'phone': normalize_phone(person['phone']),
-                'experiences': [{'person_id':0, 'company': exp['company'], 'title': exp['title'], 'start_date': exp['start'], 'end_date': exp['end']} for exp in person['experience']]
-                 
-            }
-            consolidated_data.append(consolidated_person)
+        consolidated_data = [self.consolidate_person(person) for person in self._persons_data]
         self._persons_data = consolidated_data
     
     # Method to consolidate contacts data
@@ -199,49 +298,211 @@ class Migration:
         """
         Consolidates the contacts data by extracting the relevant fields and normalizing the phone numbers.
         
-        This method is responsible for transforming the raw contacts data into a more structured format that can be easily used to create the database records. It extracts the owner ID, nickname, and phone numbers from the original contacts data, and normalizes the phone numbers using the `normalize_phone` function.
+        This method is responsible for transforming the raw contacts data into a more structured format that can be easily used to create the database records. It extracts the ID, owner ID, nickname, and phone numbers from the original contacts data, normalizes the phone numbers using the `normalize_phone` function and derives their integer keys using the `canonical_phone_key` function.
         
         The resulting consolidated data is stored in the `_contacts_data` attribute, which can then be used to create the actual database records.
         """
-        consolidated_data = []
-        for contact in self._contacts_data:
-            consolidated_contact = {
-                'owner_id': contact['owner_id'],
-                'nickname': contact['contact_nickname'],
-                'phones': [{'type': phone['type'], 'number': normalize_phone(phone['number'])} for phone in contact['phone']],
-            }
-            consolidated_data.append(consolidated_contact)
+        consolidated_data = [self.consolidate_contact(contact) for contact in self._contacts_data]
         self._contacts_data = consolidated_data
     
+    @staticmethod
+    def consolidate_person(person):
+        """
+        Transforms a person record from the JSON file into the consolidated format used to create the database records.
+        """
+        return {
+            'id': person['id'],
+            'first_name': person['first'],
+            'last_name': person['last'],
+            'phone': normalize_phone(person['phone']),
+            'phone_key': canonical_phone_key(person['phone']),
+            'experiences': [{'person_id': person['id'], 'company': exp['company'], 'title': exp['title'], 'start_date': exp['start'], 'end_date': exp['end']} for exp in person['experience']]
+        }
+    
+    @staticmethod
+    def consolidate_contact(contact):
+        """
+        Transforms a contact record from the JSON file into the consolidated format used to create the database records.
+        """
+        return {
+            'id': contact['id'],
+            'owner_id': contact['owner_id'],
+            'nickname': contact['contact_nickname'],
+            'phones': [{'contact_id': contact['id'], 'type': phone['type'], 'number': normalize_phone(phone['number']), 'number_key': canonical_phone_key(phone['number'])} for phone in contact['phone']],
+        }
+    
+    # Method to stream JSON records from a file
+    def stream_json_file_data(self, file_key):
+        """
+        Parses the root level array of the file specified by the `file_key` parameter one record at a time.
+        
+        Args:
+            file_key (str): The key to look up the file path in the source files, `FILES` by default.
+        
+        Returns:
+            generator: The records of the file, in file order.
+        
+        Raises:
+            Exception: If the file could not be found.
+        """
+        file = self._files.get(file_key, None)
+        if file is None:
+            msg = 'stream_json_file_data({}): File could not be found'.format(file_key)
+            print(msg)
+            raise Exception(msg)
+        return iter_json_array(file)
+    
+    def stream_persons_data(self):
+        """
+        Yields the consolidated persons parsed incrementally from the persons JSON file.
+        
+        When the profiler is enabled, the parsing and the consolidation are timed as the `Migration.stream_persons_data.parse` and `Migration.stream_persons_data.consolidate` sections (see `profiled_stream()`).
+        """
+        return self.profiled_stream('Migration.stream_persons_data', self.stream_json_file_data('person_records'), self.consolidate_person)
+    
+    def stream_contacts_data(self):
+        """
+        Yields the consolidated contacts parsed incrementally from the contacts JSON file.
+        
+        When the profiler is enabled, the parsing and the consolidation are timed as the `Migration.stream_contacts_data.parse` and `Migration.stream_contacts_data.consolidate` sections (see `profiled_stream()`).
+        """
+        return self.profiled_stream('Migration.stream_contacts_data', self.stream_json_file_data('contact_records'), self.consolidate_contact)
+    
+    @staticmethod
+    def profiled_stream(name, records, consolidate):
+        """
+        Yields the consolidated records, timing the parsing and the consolidation of each record when the profiler is enabled.
+        
+        The records are consumed by the bulk loader inside its `Migration.create_*_records` section, so the time of each step is accumulated record by record and accounted once the stream ends, as the `<name>.parse` and `<name>.consolidate` sections. Their time is also part of the time of the enclosing section.
+        
+        Args:
+            name (str): The prefix of the section names.
+            records (iterable): The raw records.
+            consolidate (callable): Maps a raw record to its consolidated form.
+        
+        Returns:
+            generator: The consolidated records.
+        """
+        if not profiler.enabled:
+            return (consolidate(record) for record in records)
+        return Migration._timed_stream(name, iter(records), consolidate)
+    
+    @staticmethod
+    def _timed_stream(name, records, consolidate):
+        parse_seconds = consolidate_seconds = 0.0
+        count = 0
+        end = object()
+        try:
+            while True:
+                started = time.perf_counter()
+                record = next(records, end)
+                parsed = time.perf_counter()
+                parse_seconds += parsed - started
+                if record is end:
+                    break
+                consolidated = consolidate(record)
+                consolidate_seconds += time.perf_counter() - parsed
+                count += 1
+                yield consolidated
+        finally:
+            profiler.record('{}.parse'.format(name), parse_seconds, count)
+            profiler.record('{}.consolidate'.format(name), consolidate_seconds, count)
+    
     def create_person_records(self):
         """
         Creates person records in the database based on the consolidated persons data.
         
-        This method iterates through the `_persons_data` list, which contains the consolidated persons data. For each person, it creates a new `Person` entity in the database using the `Person.create()` method, passing in the consolidated person data as keyword arguments.
-        
-        After creating the `Person` entity, it then iterates through the `experiences` list for that person, and creates a new `Experience` entity for each experience, associating it with the newly created `Person` entity by setting the `person_id` field.
+        This method hands the `_persons_data` list, or the `stream_persons_data()` generator in streaming mode, to the bulk loader, which writes each batch of persons, followed by their experiences, in a single transaction. The person IDs from the JSON file are kept, so experiences reference their person without reading back the inserted rows.
         
         This method is responsible for persisting the consolidated persons data to the database.
         """
-        for person in self._persons_data:
-            personEntity = Person.create(**person)
-            for exp in person['experiences']:
-                exp['person_id'] = personEntity.id
-                Experience.create(**exp)
+        with self._get_bulk_loader() as loader:
+            loader.load(self.stream_persons_data() if self._stream else self._persons_data, self.person_rows)
     
     def create_contact_records(self):
         """
         Creates contact records in the database based on the consolidated contacts data.
         
-        This method iterates through the `_contacts_data` list, which contains the consolidated contacts data. For each contact, it creates a new `Contact` entity in the database using the `Contact.create()` method, passing in the consolidated contact data as keyword arguments.
-        
-        After creating the `Contact` entity, it then iterates through the `phones` list for that contact, and creates a new `Phone` entity for each phone number, associating it with the newly created `Contact` entity by setting the `contact_id` field.
+        This method hands the `_contacts_data` list, or the `stream_contacts_data()` generator in streaming mode, to the bulk loader, which writes each batch of contacts, followed by their phone numbers, in a single transaction. The contact IDs from the JSON file are kept, so phones reference their contact without reading back the inserted rows.
         
         This method is responsible for persisting the consolidated contacts data to the database.
         """
-        for contact in self._contacts_data:
-            contactEntity = Contact.create(**contact)
-            for phone in contact['phones']:
-                phone['contact_id'] = contactEntity.id
-                Phone.create(**phone)
-
+        with self._get_bulk_loader() as loader:
+            loader.load(self.stream_contacts_data() if self._stream else self._contacts_data, self.contact_rows)
+    
+    def create_pipelined_records(self):
+        """
+        Creates the person and contact records in the database, running the parse, consolidate and write steps of both files concurrently.
+        
+        Each file is parsed by its own thread and consolidated by a pool of `workers` processes, in chunks handed over through bounded queues, while the bulk loader writes the consolidated chunks in this thread. The persons are written before the contacts, which reference them; the contacts are parsed and consolidated meanwhile. The records are the same as the ones of `create_person_records()` and `create_contact_records()`.
+        """
+        # Only imported in pipeline mode
+        from src.lib.database.migration.pipeline import IngestPipeline, PipelineSource
+        sources = [
+            PipelineSource('persons', self.stream_json_file_data('person_records'), self.consolidate_person, self.person_rows),
+            PipelineSource('contacts', self.stream_json_file_data('contact_records'), self.consolidate_contact, self.contact_rows),
+        ]
+        with self._get_bulk_loader() as loader:
+            self._ingest_pipeline = IngestPipeline(loader, workers=self._workers)
+            self._ingest_pipeline.run(sources)
+        # The stages overlap, so each one is reported as a section of its own, with its work time
+        for stage, stats in self._ingest_pipeline.get_stats()['stages'].items():
+            profiler.record('Migration.create_pipelined_records.{}'.format(stage), stats['seconds'], stats['records'])
+    
+    def create_connection_records(self):
+        """
+        Creates the person connection records from the person, experience, contact and phone records already in the database.
+        
+        The graph combines the shared company rule and the symmetric contact rule (see `src.services.connection_graph`), and every connection is written in both directions, ordered by the `(person_a, person_b)` primary key. With more than one worker, the rules are computed by a process pool sharded by company and phone key bucket, which writes the same records.
+        
+        The null end dates of the ongoing experiences are resolved to today, which is recorded in the store metadata so deltas resolve them to the same date and `python main.py --refresh` recomputes them once it is past (see `src.lib.database.migration.delta.ConnectionRefresh`).
+        """
+        today = datetime.date.today()
+        with self._get_bulk_loader() as loader:
+            loader.load(connection_rows(build_connections(db, today=today, workers=self._workers)), lambda row: [(PersonConnection, row)])
+        set_store_meta(CONNECTIONS_DATE_KEY, today.isoformat())
+    
+    def create_cluster_records(self):
+        """
+        Creates the cluster and person cluster records from the person connection records already in the database.
+        
+        Every person gets a cluster, the ID of a cluster being the lowest ID of its members, so the records do not depend on the order of the ingest.
+        """
+        with self._get_bulk_loader() as loader:
+            loader.load(build_clusters(db), lambda row: [row])
+    
+    @staticmethod
+    def person_rows(person):
+        """
+        Maps a consolidated person to the `(model, row)` tuples written by the bulk loader.
+        """
+        rows = [(Person, {
+            'id': person['id'],
+            'first_name': person['first_name'],
+            'last_name': person['last_name'],
+            'phone': person['phone'],
+            'phone_key': person['phone_key'],
+        })]
+        rows.extend((Experience, exp) for exp in person['experiences'])
+        return rows
+    
+    @staticmethod
+    def contact_rows(contact):
+        """
+        Maps a consolidated contact to the `(model, row)` tuples written by the bulk loader.
+        """
+        rows = [(Contact, {
+            'id': contact['id'],
+            'owner_id': contact['owner_id'],
+            'nickname': contact['nickname'],
+        })]
+        rows.extend((Phone, phone) for phone in contact['phones'])
+        return rows
+    
+    def _written_rows(self):
+        return sum(stats['rows'] for stats in self.get_ingest_stats().values())
+    
+    def _get_bulk_loader(self):
+        if self._bulk_loader is None:
+            self._bulk_loader = BulkLoader(db)
+        return self._bulk_loader
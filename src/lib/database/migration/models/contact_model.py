@@ -15,3 +15,12 @@ class Contact(BaseModel):
     id = AutoField()
     nickname = CharField()
     owner = ForeignKeyField(Person, backref='contacts')
+
+    class Meta:
+        """
+        Declares the covering index used to find the contacts of an owner.
+        The indexes are created after the bulk load, see `Migration.create_indexes()`.
+        """
+        indexes = (
+            (('owner', 'nickname'), False),
+        )
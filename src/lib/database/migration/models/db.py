@@ -1,7 +1,7 @@
 from peewee import SqliteDatabase
-from random import randint
 
 database_path = 'src/lib/database/migration/data/db/'
-database_name = 'allari-data-consistency_{}_.db'.format(randint(1000000, 9999999))
-database = '{}{}'.format(database_path, database_name)
-db = SqliteDatabase(database, pragmas={'foreign_keys': 1})
+database_prefix = 'allari-data-consistency_'
+# The database file is bound by `src.lib.database.store.open_store()`, which picks
+# the content-addressed store for the current data files.
+db = SqliteDatabase(None, pragmas={'foreign_keys': 1})
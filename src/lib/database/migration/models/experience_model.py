@@ -21,3 +21,12 @@ class Experience(BaseModel):
     start_date = DateField()
     end_date = DateField(null=True)
     person = ForeignKeyField(Person, backref='experiences')
+
+    class Meta:
+        """
+        Declares the covering index used to find the experiences of a company within a date interval.
+        The indexes are created after the bulk load, see `Migration.create_indexes()`.
+        """
+        indexes = (
+            (('company', 'start_date', 'end_date', 'person', 'title'), False),
+        )
@@ -0,0 +1,44 @@
+"""Module providing the PersonCluster and Cluster entity classes."""
+from peewee import IntegerField, ForeignKeyField
+from src.lib.database.migration.models.base_model import BaseModel
+from src.lib.database.migration.models.person_model import Person
+
+class Cluster(BaseModel):
+    """
+    Represents a connected component of the connection graph, computed at ingest.
+    
+    Attributes:
+        id (int): The cluster ID, which is the lowest person ID of its members.
+        size (int): The number of persons in the cluster.
+    """
+    id = IntegerField(primary_key=True)
+    size = IntegerField()
+
+    class Meta:
+        table_name = 'cluster'
+        without_rowid = True
+
+
+class PersonCluster(BaseModel):
+    """
+    Represents the membership of a person in a cluster. Every person belongs to exactly one cluster, a person without connections forming a cluster of its own.
+    
+    Attributes:
+        person (Person): The person.
+        cluster (Cluster): The cluster of the person.
+    """
+    person = ForeignKeyField(Person, primary_key=True, backref='+')
+    cluster = ForeignKeyField(Cluster, backref='members', index=False)
+
+    class Meta:
+        """
+        The table is clustered on its `person_id` primary key, so the cluster of a person is a single lookup.
+        
+        The `(cluster_id, person_id)` index lists the members of a cluster in person ID order, one page at a time.
+        """
+        table_name = 'person_cluster'
+        without_rowid = True
+
+
+# Named after the table, like the indexes of the other models
+PersonCluster.add_index(PersonCluster.cluster, PersonCluster.person, name='person_cluster_cluster_id_person_id')
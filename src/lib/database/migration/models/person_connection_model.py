@@ -0,0 +1,32 @@
+"""Module providing a PersonConnection entity class."""
+from peewee import BooleanField, IntegerField, ForeignKeyField, CompositeKey
+from src.lib.database.migration.models.base_model import BaseModel
+from src.lib.database.migration.models.person_model import Person
+
+class PersonConnection(BaseModel):
+    """
+    Represents a directed edge of the connection graph, computed once at ingest.
+    
+    Every connection is stored in both directions, so the connections of a person are the rows whose `person_a` is that person.
+    
+    Attributes:
+        person_a (Person): The person the edge starts from.
+        person_b (Person): The person connected to `person_a`.
+        via_experience (bool): True if both persons worked at the same company with overlapping employment periods.
+        via_contact (bool): True if at least one of the persons has the other's phone number in their contacts.
+        overlap_days (int, optional): The largest employment overlap in days over the shared companies, or None if the persons are not connected via experience.
+    """
+    person_a = ForeignKeyField(Person, column_name='person_a', backref='connections', index=False)
+    person_b = ForeignKeyField(Person, column_name='person_b', backref='+', index=False)
+    via_experience = BooleanField(default=False)
+    via_contact = BooleanField(default=False)
+    overlap_days = IntegerField(null=True)
+
+    class Meta:
+        """
+        The table is clustered on its `(person_a, person_b)` primary key, which makes it its own
+        covering index: the connections of a person are a single range read.
+        """
+        table_name = 'person_connection'
+        primary_key = CompositeKey('person_a', 'person_b')
+        without_rowid = True
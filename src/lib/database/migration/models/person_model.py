@@ -1,6 +1,6 @@
 """Module providing a Person entity class."""
 
-from peewee import CharField, AutoField
+from peewee import CharField, AutoField, IntegerField
 from src.lib.database.migration.models.base_model import BaseModel
 
 class Person(BaseModel):
@@ -12,8 +12,19 @@ class Person(BaseModel):
         first_name (str): The person's first name.
         last_name (str): The person's last name.
         phone (str, optional): The person's phone number.
+        phone_key (int, optional): The canonical integer key of the phone number, see `canonical_phone_key`.
     """
     id = AutoField()
     first_name = CharField()
     last_name = CharField()
     phone = CharField(null=True)
+    phone_key = IntegerField(null=True)
+
+    class Meta:
+        """
+        Declares the covering index used to match contact phone keys to persons.
+        The indexes are created after the bulk load, see `Migration.create_indexes()`.
+        """
+        indexes = (
+            (('phone_key', 'first_name', 'last_name'), False),
+        )
@@ -1,5 +1,5 @@
 """Module providing a Phone entity class."""
-from peewee import CharField, AutoField, ForeignKeyField
+from peewee import CharField, AutoField, ForeignKeyField, IntegerField
 from src.lib.database.migration.models.base_model import BaseModel
 from src.lib.database.migration.models.contact_model import Contact
 
@@ -11,9 +11,21 @@ class Phone(BaseModel):
         id (int): The unique identifier for the phone number.
         type (str): The type of phone number (e.g. "mobile", "home", "work").
         number (str): The actual phone number.
+        number_key (int, optional): The canonical integer key of the phone number, see `canonical_phone_key`.
         contact (Contact): The contact that this phone number is associated with.
     """
     id = AutoField()
     type = CharField()
     number = CharField()
-    contact = ForeignKeyField(Contact, backref='phones')
\ No newline at end of file
+    number_key = IntegerField(null=True)
+    contact = ForeignKeyField(Contact, backref='phones')
+
+    class Meta:
+        """
+        Declares the covering indexes used to read the phone numbers of a contact and to find the contacts holding a phone number.
+        The indexes are created after the bulk load, see `Migration.create_indexes()`.
+        """
+        indexes = (
+            (('contact', 'number_key', 'number', 'type'), False),
+            (('number_key', 'contact'), False),
+        )
@@ -0,0 +1,260 @@
+"""Module providing a staged ingest pipeline, running the parse, normalize and write stages concurrently."""
+import os
+import time
+import queue
+import threading
+from collections import deque, namedtuple
+from itertools import islice
+
+# A source of records: `records` yields the raw records, `normalize` maps a raw record to its
+# consolidated form and `to_rows` maps a consolidated record to the `(model, row)` tuples written
+PipelineSource = namedtuple('PipelineSource', ['name', 'records', 'normalize', 'to_rows'])
+
+# Marks the end of a source on a queue
+_END = object()
+
+# How often a stage blocked on a queue checks whether another stage failed, in seconds
+_POLL_SECONDS = 0.05
+
+
+class _Stopped(Exception):
+    """Raised in a stage blocked on a queue when another stage failed."""
+
+
+def normalize_chunk(normalize, records):
+    """
+    Normalizes a chunk of raw records, in a worker process of the normalize stage.
+
+    Returns:
+        tuple: The normalized records and the seconds spent.
+    """
+    started = time.perf_counter()
+    return [normalize(record) for record in records], time.perf_counter() - started
+
+
+class StageStats:
+    """
+    The records processed by one stage of a source, the time the stage spent working on them, and the depth of the queue it feeds.
+
+    The time does not include the time the stage waited on its queues, and is summed over the workers of the stage, so `records_per_sec` is the rate the stage could sustain on its own.
+    """
+
+    def __init__(self, name, workers=1, queue_size=None):
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.records = 0
+        self.seconds = 0.0
+        self._depths = 0
+        self._depth_samples = 0
+        self._max_depth = 0
+
+    def add(self, records, seconds):
+        self.records += records
+        self.seconds += seconds
+
+    def sample_depth(self, depth):
+        self._depths += depth
+        self._depth_samples += 1
+        self._max_depth = max(self._max_depth, depth)
+
+    def to_dict(self):
+        seconds = self.seconds / self.workers
+        return {
+            'records'               :       self.records,
+            'seconds'               :       seconds,
+            'records_per_sec'       :       self.records / seconds if seconds else float(self.records),
+            'queue_size'            :       self.queue_size,
+            'avg_queue_depth'       :       self._depths / self._depth_samples if self._depth_samples else 0.0,
+            'max_queue_depth'       :       self._max_depth,
+        }
+
+
+class IngestPipeline:
+    """
+    Writes the records of several sources through three stages connected by bounded queues:
+
+    1. a parse stage, a thread per source reading the raw records in chunks,
+    2. a normalize stage, a thread per source handing the chunks to a process pool, in order, with at most two chunks per worker in flight,
+    3. a single write stage, in the calling thread, which owns the database connection and writes each chunk in one transaction through the bulk loader.
+
+    Every stage of every source runs concurrently, so the wall time approaches the time of the slowest stage instead of the sum of the stages. The queues hold at most `queue_size` chunks, so a fast stage waits for a slow one instead of buffering the whole file. The sources are written one after the other, in the order given, so a source can reference the records of the sources before it; the later sources are parsed and normalized meanwhile, up to their queues.
+
+    A failing stage stops the other stages, and `run()` raises its error.
+
+    Args:
+        loader (BulkLoader): The loader writing the rows. It should be entered by the caller.
+        workers (int, optional): The number of normalize processes, 0 for every core. Defaults to 1, which normalizes in the thread of each source.
+        chunk_size (int, optional): The number of records per chunk. Defaults to 5000.
+        queue_size (int, optional): The number of chunks each queue holds. Defaults to 4.
+    """
+
+    def __init__(self, loader, workers=1, chunk_size=5000, queue_size=4):
+        self.loader = loader
+        self.workers = (os.cpu_count() or 1) if workers == 0 else workers
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.seconds = 0.0
+        self._stats = {}
+        self._errors = []
+        self._stop = threading.Event()
+
+    def run(self, sources):
+        """
+        Parses, normalizes and writes the records of the sources.
+
+        Args:
+            sources (list[PipelineSource]): The sources, in write order.
+
+        Returns:
+            int: The number of records written.
+
+        Raises:
+            Exception: If a stage failed.
+        """
+        started = time.perf_counter()
+        self._stop.clear()
+        self._errors = []
+        executor = self._get_executor()
+        threads, outputs = [], []
+        for source in sources:
+            parsed, normalized = queue.Queue(self.queue_size), queue.Queue(self.queue_size)
+            parse = self._add_stats(source, 'parse', queue_size=self.queue_size)
+            normalize = self._add_stats(source, 'normalize', workers=self.workers, queue_size=self.queue_size)
+            threads.append(threading.Thread(target=self._run_stage, args=(parse, self._parse, source, parsed), daemon=True))
+            threads.append(threading.Thread(target=self._run_stage, args=(normalize, self._normalize, source, parsed, normalized, executor), daemon=True))
+            outputs.append((source, normalized, self._add_stats(source, 'write')))
+        for thread in threads:
+            thread.start()
+        count = 0
+        try:
+            for source, normalized, stats in outputs:
+                count += self._run_stage(stats, self._write, source, normalized)
+        finally:
+            # Unblocks the stages of the sources not written when the write stage failed or was interrupted
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+            self.seconds += time.perf_counter() - started
+        if self._errors:
+            name, error = self._errors[0]
+            msg = 'Ingest pipeline stage {} failed: {}'.format(name, error)
+            print(msg)
+            raise Exception(msg)
+        return count
+
+    def get_stats(self):
+        """
+        Returns the statistics of every stage, keyed `<source>.<stage>`, and the wall time of the pipeline.
+
+        Returns:
+            dict: The `seconds` of wall time and the `stages`, each a dict with the `records` processed, the `seconds` of work per worker, the `records_per_sec` rate, the `queue_size` and the `avg_queue_depth` and `max_queue_depth` of the queue the stage feeds, sampled each time the stage queues a chunk.
+        """
+        return {
+            'seconds'       :       self.seconds,
+            'stages'        :       {name: stats.to_dict() for name, stats in self._stats.items()},
+        }
+
+    def report(self):
+        """
+        Returns a human readable line per stage with its throughput and the depth of the queue it feeds, and a line with the wall time.
+        """
+        lines = []
+        for name, stats in self.get_stats()['stages'].items():
+            line = '{}: {} records in {:.3f}s ({:.0f} records/sec)'.format(name, stats['records'], stats['seconds'], stats['records_per_sec'])
+            if stats['queue_size'] is not None:
+                line += ', queue depth {:.1f} avg, {} max of {}'.format(stats['avg_queue_depth'], stats['max_queue_depth'], stats['queue_size'])
+            lines.append(line)
+        lines.append('pipeline: {:.3f}s wall time'.format(self.seconds))
+        return lines
+
+    def _get_executor(self):
+        if self.workers <= 1:
+            return None
+        # Only imported when the normalize stage runs in worker processes
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # A forked child would inherit the locks held by the threads of the other stages
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def _add_stats(self, source, stage, workers=1, queue_size=None):
+        name = '{}.{}'.format(source.name, stage)
+        self._stats.setdefault(name, StageStats(name, workers=workers, queue_size=queue_size))
+        return self._stats[name]
+
+    def _run_stage(self, stats, function, *args):
+        try:
+            return function(stats, *args)
+        except _Stopped:
+            return 0
+        except Exception as e:
+            self._errors.append((stats.name, e))
+            self._stop.set()
+            return 0
+
+    def _put(self, stats, output, item):
+        while True:
+            try:
+                output.put(item, timeout=_POLL_SECONDS)
+                break
+            except queue.Full:
+                if self._stop.is_set():
+                    raise _Stopped()
+        if item is not _END:
+            stats.sample_depth(output.qsize())
+
+    def _get(self, source_queue):
+        while not self._stop.is_set():
+            try:
+                return source_queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                pass
+        raise _Stopped()
+
+    def _parse(self, stats, source, parsed):
+        records = iter(source.records)
+        while True:
+            started = time.perf_counter()
+            chunk = list(islice(records, self.chunk_size))
+            stats.add(len(chunk), time.perf_counter() - started)
+            if not chunk:
+                break
+            self._put(stats, parsed, chunk)
+        self._put(stats, parsed, _END)
+
+    def _normalize(self, stats, source, parsed, normalized, executor):
+        pending = deque()
+
+        def put_oldest():
+            records, seconds = pending.popleft().result()
+            stats.add(len(records), seconds)
+            self._put(stats, normalized, records)
+
+        while True:
+            chunk = self._get(parsed)
+            if chunk is _END:
+                break
+            if executor is None:
+                records, seconds = normalize_chunk(source.normalize, chunk)
+                stats.add(len(records), seconds)
+                self._put(stats, normalized, records)
+                continue
+            # The chunks are queued in order, with a bounded number in flight
+            pending.append(executor.submit(normalize_chunk, source.normalize, chunk))
+            if len(pending) >= 2 * self.workers:
+                put_oldest()
+        while pending:
+            put_oldest()
+        self._put(stats, normalized, _END)
+
+    def _write(self, stats, source, normalized):
+        count = 0
+        while True:
+            records = self._get(normalized)
+            if records is _END:
+                return count
+            started = time.perf_counter()
+            count += self.loader.load(records, source.to_rows)
+            stats.add(len(records), time.perf_counter() - started)
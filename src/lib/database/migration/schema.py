@@ -0,0 +1,94 @@
+"""Module providing the in place upgrades of existing stores"""
+import datetime
+
+from src.lib.database.migration.models.db import db
+from src.lib.database.store import CONNECTIONS_DATE_KEY, set_store_meta
+from src.lib.database.migration.models.person_connection_model import PersonConnection
+from src.lib.database.migration.bulk_loader import BulkLoader
+from src.lib.helpers.format import canonical_phone_key
+from src.services.connection_graph import build_connections, connection_rows
+from src.services.person_clusters import build_clusters
+
+
+def backfill_phone_keys():
+    """
+    Fills the canonical phone key columns added by schema version 3 from the stored phone numbers.
+    """
+    db.connection().create_function('canonical_phone_key', 1, canonical_phone_key, deterministic=True)
+    db.execute_sql('UPDATE "person" SET "phone_key" = canonical_phone_key("phone")')
+    db.execute_sql('UPDATE "phone" SET "number_key" = canonical_phone_key("number")')
+
+
+def build_connection_records():
+    """
+    Fills the `person_connection` table added by schema version 4 from the stored records, and records the date the null end dates were resolved to.
+    """
+    today = datetime.date.today()
+    BulkLoader(db).load(connection_rows(build_connections(db, today=today)), lambda row: [(PersonConnection, row)])
+    set_store_meta(CONNECTIONS_DATE_KEY, today.isoformat())
+
+
+def build_cluster_records():
+    """
+    Fills the `cluster` and `person_cluster` tables added by schema version 5 from the stored connections.
+    """
+    BulkLoader(db).load(build_clusters(db), lambda row: [row])
+
+
+# Statements upgrading a store to a schema version from the previous one, keyed by the version they produce.
+# Index names follow the peewee naming, so a store upgraded in place matches a freshly built one.
+UPGRADES = {
+    2: [
+        'CREATE INDEX IF NOT EXISTS "person_phone_first_name_last_name" ON "person" ("phone", "first_name", "last_name")',
+        'CREATE INDEX IF NOT EXISTS "experience_company_start_date_end_date_person_id_title" ON "experience" ("company", "start_date", "end_date", "person_id", "title")',
+        'CREATE INDEX IF NOT EXISTS "contact_owner_id_nickname" ON "contact" ("owner_id", "nickname")',
+        'CREATE INDEX IF NOT EXISTS "phone_contact_id_number_type" ON "phone" ("contact_id", "number", "type")',
+    ],
+    3: [
+        'ALTER TABLE "person" ADD COLUMN "phone_key" INTEGER',
+        'ALTER TABLE "phone" ADD COLUMN "number_key" INTEGER',
+        backfill_phone_keys,
+        'DROP INDEX IF EXISTS "person_phone_first_name_last_name"',
+        'DROP INDEX IF EXISTS "phone_contact_id_number_type"',
+        'CREATE INDEX IF NOT EXISTS "person_phone_key_first_name_last_name" ON "person" ("phone_key", "first_name", "last_name")',
+        'CREATE INDEX IF NOT EXISTS "phone_contact_id_number_key_number_type" ON "phone" ("contact_id", "number_key", "number", "type")',
+        'CREATE INDEX IF NOT EXISTS "phone_number_key_contact_id" ON "phone" ("number_key", "contact_id")',
+    ],
+    4: [
+        'CREATE TABLE IF NOT EXISTS "person_connection" ("person_a" INTEGER NOT NULL, "person_b" INTEGER NOT NULL, "via_experience" INTEGER NOT NULL, "via_contact" INTEGER NOT NULL, "overlap_days" INTEGER, PRIMARY KEY ("person_a", "person_b"), FOREIGN KEY ("person_a") REFERENCES "person" ("id"), FOREIGN KEY ("person_b") REFERENCES "person" ("id")) WITHOUT ROWID',
+        build_connection_records,
+    ],
+    5: [
+        'CREATE TABLE IF NOT EXISTS "cluster" ("id" INTEGER NOT NULL PRIMARY KEY, "size" INTEGER NOT NULL) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS "person_cluster" ("person_id" INTEGER NOT NULL PRIMARY KEY, "cluster_id" INTEGER NOT NULL, FOREIGN KEY ("person_id") REFERENCES "person" ("id"), FOREIGN KEY ("cluster_id") REFERENCES "cluster" ("id")) WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS "person_cluster_cluster_id_person_id" ON "person_cluster" ("cluster_id", "person_id")',
+        build_cluster_records,
+    ],
+    # Version 6 stores are in WAL journaling, which `upgrade_store()` sets once the upgrade is committed
+    6: [],
+}
+
+
+def upgrade_schema(from_version, to_version):
+    """
+    Upgrades the schema of the store bound to `db` one version at a time, each version in its own transaction.
+
+    Args:
+        from_version (int): The schema version of the store.
+        to_version (int): The schema version to upgrade to.
+
+    Raises:
+        Exception: If there is no upgrade path between the two versions.
+    """
+    for version in range(from_version + 1, to_version + 1):
+        steps = UPGRADES.get(version, None)
+        if steps is None:
+            msg = 'upgrade_schema({}, {}): No upgrade to schema version {}'.format(from_version, to_version, version)
+            print(msg)
+            raise Exception(msg)
+        with db.atomic():
+            for step in steps:
+                if callable(step):
+                    step()
+                else:
+                    db.execute_sql(step)
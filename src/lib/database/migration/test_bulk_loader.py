@@ -0,0 +1,62 @@
+import pytest
+from peewee import SqliteDatabase
+from src.lib.database.migration.bulk_loader import BulkLoader
+from src.lib.database.migration.models.person_model import Person
+from src.lib.database.migration.models.experience_model import Experience
+
+MODELS = [Person, Experience]
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = SqliteDatabase(str(tmp_path / 'bulk.db'), pragmas={'foreign_keys': 1})
+    with database.bind_ctx(MODELS):
+        database.create_tables(MODELS)
+        yield database
+    database.close()
+
+
+def person_rows(person_id):
+    return [
+        (Person, {'id': person_id, 'first_name': 'First', 'last_name': 'Last {}'.format(person_id), 'phone': None}),
+        (Experience, {'person_id': person_id, 'company': 'OrangeCart', 'title': 'Engineer', 'start_date': '2017-01-01', 'end_date': None}),
+    ]
+
+
+def test_load_writes_every_row_in_batches(database):
+    loader = BulkLoader(database, batch_size=7)
+    with loader:
+        count = loader.load(range(1, 51), person_rows)
+
+    assert count == 50
+    assert Person.select().count() == 50
+    assert Experience.select().count() == 50
+    assert Experience.get(Experience.person == 50).company == 'OrangeCart'
+
+    stats = loader.get_stats()
+    assert stats['person']['rows'] == 50
+    assert stats['experience']['rows'] == 50
+    assert stats['person']['rows_per_sec'] > 0
+
+
+def test_pragmas_are_restored(database):
+    journal_mode = database.pragma('journal_mode')
+    synchronous = database.pragma('synchronous')
+
+    with BulkLoader(database) as loader:
+        assert database.pragma('journal_mode') == 'memory'
+        assert database.pragma('synchronous') == 0
+        loader.load([1], person_rows)
+
+    assert database.pragma('journal_mode') == journal_mode
+    assert database.pragma('synchronous') == synchronous
+
+
+def test_failed_batch_is_rolled_back(database):
+    loader = BulkLoader(database, batch_size=10)
+    with loader:
+        loader.load([1], person_rows)
+        with pytest.raises(Exception):
+            loader.load([2, 2], person_rows)
+
+    assert [person.id for person in Person.select()] == [1]
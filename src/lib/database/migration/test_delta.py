@@ -0,0 +1,233 @@
+import json
+import random
+import datetime
+import pytest
+from src.lib.database.migration.models.db import db
+from src.lib.database import store
+from src.lib.database.conn import ensure_store
+from src.lib.database.migration.migration import Migration
+from src.lib.database.migration.delta import DeltaMigration, ConnectionRefresh
+from src.services.connection_graph import build_connections
+from src.services.person_clusters import build_clusters
+
+
+@pytest.fixture
+def store_copy(tmp_path):
+    # Builds a private store of the current JSON files, so deltas do not touch the shared one
+    if not db.is_closed():
+        db.close()
+    store.open_store(path=str(tmp_path))
+    Migration(stream=True)
+    yield str(tmp_path)
+    if not db.is_closed():
+        db.close()
+    db.init(None)
+
+
+def stored_connections():
+    return {
+        (person_a, person_b): (bool(via_experience), bool(via_contact), overlap_days)
+        for person_a, person_b, via_experience, via_contact, overlap_days in db.execute_sql(
+            'SELECT person_a, person_b, via_experience, via_contact, overlap_days FROM person_connection WHERE person_a < person_b'
+        )
+    }
+
+
+def assert_connections_match_full_build():
+    assert stored_connections() == build_connections(db)
+    # Every connection is stored in both directions
+    forward = db.execute_sql('SELECT COUNT(*) FROM person_connection WHERE person_a < person_b').fetchone()[0]
+    backward = db.execute_sql('SELECT COUNT(*) FROM person_connection WHERE person_a > person_b').fetchone()[0]
+    assert forward == backward
+
+
+def assert_clusters_match_full_build():
+    expected = {(model._meta.table_name, tuple(sorted(row.items()))) for model, row in build_clusters(db)}
+    stored = {('cluster', (('id', cluster_id), ('size', size))) for cluster_id, size in db.execute_sql('SELECT id, size FROM cluster')}
+    stored |= {
+        ('person_cluster', (('cluster_id', cluster_id), ('person_id', person_id)))
+        for person_id, cluster_id in db.execute_sql('SELECT person_id, cluster_id FROM person_cluster')
+    }
+    assert stored == expected
+
+
+DELTA = {
+    'persons': {
+        'added': [{'id': 100, 'first': 'Ada', 'last': 'Lovelace', 'phone': '(555) 000-0100', 'experience': [
+            {'company': 'OrangeCart', 'title': 'Engineer', 'start': '2018-01-01', 'end': None},
+        ]}],
+        'updated': [{'id': 3, 'first': 'Bob', 'last': 'Johnson', 'phone': '(555) 123-4567', 'experience': [
+            {'company': 'YellowSubmarine', 'title': 'Account Manager', 'start': '2017-07-01', 'end': '2018-05-31'},
+        ]}],
+        'deleted': [5],
+    },
+    'contacts': {
+        'added': [{'id': 100, 'owner_id': 100, 'contact_nickname': 'Boss', 'phone': [{'number': '(123) 456-7890', 'type': 'cell'}]}],
+        'updated': [],
+        'deleted': [1],
+    },
+}
+
+
+def test_delta_matches_full_rebuild(store_copy):
+    migration = DeltaMigration(delta_data=json.loads(json.dumps(DELTA)))
+
+    assert store.store_is_open_read_only()
+    stats = migration.get_stats()
+    assert stats['persons_added'] == 1
+    assert stats['persons_updated'] == 1
+    assert stats['persons_deleted'] == 1
+    assert stats['contacts_added'] == 1
+    assert stats['contacts_deleted'] == 1
+    assert stats['delta_version'] == 1
+
+    assert db.execute_sql('SELECT COUNT(*) FROM person WHERE id = 5').fetchone()[0] == 0
+    assert db.execute_sql('SELECT COUNT(*) FROM contact WHERE owner_id = 5').fetchone()[0] == 0
+    assert db.execute_sql("SELECT company FROM experience WHERE person_id = 3").fetchall() == [('YellowSubmarine',)]
+    assert_connections_match_full_build()
+    assert_clusters_match_full_build()
+
+
+def cluster_of(person_id):
+    return db.execute_sql('SELECT cluster_id FROM person_cluster WHERE person_id = ?', (person_id,)).fetchone()[0]
+
+
+def test_delta_splitting_and_merging_clusters(store_copy):
+    # Person 3 bridges persons 1 and 8: dropping their experiences splits the cluster
+    DeltaMigration(delta_data={'persons': {'updated': [
+        {'id': 3, 'first': 'Bob', 'last': 'Johnson', 'phone': '(555) 123-4567', 'experience': []},
+    ]}})
+    assert cluster_of(1) != cluster_of(8)
+    assert_connections_match_full_build()
+    assert_clusters_match_full_build()
+
+    # A contact of person 9 holding the phones of persons 1 and 8 merges both parts and person 9
+    DeltaMigration(delta_data={'contacts': {'added': [
+        {'id': 300, 'owner_id': 9, 'contact_nickname': 'Both', 'phone': [
+            {'number': '(123) 456-7890', 'type': 'cell'}, {'number': '(222) 333-4444', 'type': 'cell'},
+        ]},
+    ]}})
+    assert cluster_of(1) == cluster_of(8) == cluster_of(9) == 1
+    assert_connections_match_full_build()
+    assert_clusters_match_full_build()
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_random_deltas_keep_clusters_consistent(store_copy, seed):
+    rng = random.Random(seed)
+    persons = {person_id: (first, last, phone) for person_id, first, last, phone in db.execute_sql('SELECT id, first_name, last_name, phone FROM person')}
+    for step in range(8):
+        experiences = [
+            {'company': company, 'title': title, 'start': start_date, 'end': end_date}
+            for company, title, start_date, end_date in db.execute_sql(
+                'SELECT company, title, start_date, end_date FROM experience WHERE person_id = ?', (rng.choice(list(persons)),)
+            )
+        ]
+        person_id = rng.choice(list(persons))
+        first, last, phone = persons[person_id]
+        delta = {'persons': {'updated': [{'id': person_id, 'first': first, 'last': last, 'phone': phone, 'experience': rng.choice([[], experiences])}]}}
+        if step % 3 == 2:
+            delete_id = rng.choice([other_id for other_id in persons if other_id != person_id])
+            delta['persons']['deleted'] = [delete_id]
+            del persons[delete_id]
+        owner_id = rng.choice(list(persons))
+        delta['contacts'] = {'added': [{'id': 400 + step, 'owner_id': owner_id, 'contact_nickname': 'Friend', 'phone': [
+            {'number': persons[rng.choice(list(persons))][2], 'type': 'cell'},
+        ]}]}
+        DeltaMigration(delta_data=delta)
+        assert_clusters_match_full_build()
+
+
+def test_delta_is_idempotent_and_bumps_data_version(store_copy):
+    version = store.current_data_version(path=store_copy)
+    DeltaMigration(delta_data=json.loads(json.dumps(DELTA)))
+    after_first = stored_connections()
+    first_version = store.current_data_version(path=store_copy)
+    DeltaMigration(delta_data=json.loads(json.dumps(DELTA)))
+
+    assert stored_connections() == after_first
+    assert first_version != version
+    assert store.current_data_version(path=store_copy) not in (version, first_version)
+
+
+def test_delta_file_and_failed_delta_leave_store_unchanged(store_copy, tmp_path):
+    before = stored_connections()
+    version = store.current_data_version(path=store_copy)
+
+    # The contact owner does not exist, so the whole delta is rolled back
+    delta_file = tmp_path / 'delta.json'
+    delta_file.write_text(json.dumps({'persons': {'deleted': [1]}, 'contacts': {'added': [
+        {'id': 200, 'owner_id': 999, 'contact_nickname': 'Ghost', 'phone': []}
+    ]}}))
+    with pytest.raises(Exception):
+        DeltaMigration(delta_file=str(delta_file))
+
+    assert store.store_is_open_read_only()
+    assert stored_connections() == before
+    assert store.current_data_version(path=store_copy) == version
+
+
+def test_invalid_delta_is_rejected(store_copy):
+    with pytest.raises(Exception):
+        DeltaMigration(delta_data={'persons': {'renamed': []}})
+
+
+def new_hires(start):
+    return [
+        {'id': person_id, 'first': 'New', 'last': 'Hire', 'phone': '(555) 000-0{}'.format(person_id), 'experience': [
+            {'company': 'LaunchPad', 'title': 'Engineer', 'start': start.isoformat(), 'end': None},
+        ]}
+        for person_id in (101, 102)
+    ]
+
+
+def test_refresh_resolves_ongoing_experiences_to_the_new_date(store_copy):
+    today = datetime.date.today()
+    assert store.connections_date() == today
+    # Two ongoing experiences overlapping 60 days today, 120 days in two months
+    DeltaMigration(delta_data={'persons': {'added': new_hires(today - datetime.timedelta(days=60))}})
+    assert (101, 102) not in stored_connections()
+
+    later = today + datetime.timedelta(days=60)
+    version = store.current_data_version(path=store_copy)
+    ConnectionRefresh(today=later)
+    assert store.store_is_open_read_only()
+    assert store.connections_date() == later
+    assert stored_connections()[(101, 102)] == (True, False, 120)
+    assert stored_connections() == build_connections(db, today=later)
+    assert_clusters_match_full_build()
+    assert store.current_data_version(path=store_copy) != version
+
+    # A delta resolves the ongoing experiences to the recorded date, not to today
+    DeltaMigration(delta_data={'persons': {'updated': new_hires(today - datetime.timedelta(days=60))[:1]}})
+    assert stored_connections() == build_connections(db, today=later)
+
+
+def backdate_connections(days):
+    store.reopen_store_for_writing()
+    store.set_store_meta(store.CONNECTIONS_DATE_KEY, (datetime.date.today() - datetime.timedelta(days=days)).isoformat())
+    store.mark_store_ready()
+
+
+def test_graph_readers_warn_about_stale_connections_without_writing(store_copy, capsys):
+    backdate_connections(1)
+    version = store.current_data_version(path=store_copy)
+
+    ensure_store(stored_connections=True)
+    assert '--refresh' in capsys.readouterr().err
+    assert store.store_is_open_read_only()
+    assert store.connections_are_stale()
+    assert store.current_data_version(path=store_copy) == version
+
+
+def test_refresh_is_a_no_op_on_fresh_connections(store_copy):
+    backdate_connections(1)
+    refresh = ConnectionRefresh()
+    assert refresh.get_stats()['refreshed']
+    assert not store.connections_are_stale()
+    assert_connections_match_full_build()
+    assert_clusters_match_full_build()
+
+    version = store.current_data_version(path=store_copy)
+    assert not ConnectionRefresh().get_stats()['refreshed']
+    assert store.current_data_version(path=store_copy) == version
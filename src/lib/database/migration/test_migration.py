@@ -1,6 +1,7 @@
 import pytest
+from contextlib import ExitStack
 from unittest.mock import patch, mock_open
-from src.lib.database.migration.migration import Migration
+from src.lib.database.migration.migration import Migration, MODELS
 
 @pytest.fixture
 def migration_instance():
@@ -14,10 +15,23 @@ def test_database_connect(migration_instance):
             mock_connect.assert_called_once()
 
 def test_migrate_tables(migration_instance):
-    # Test the migrate_tables method
-    with patch('src.lib.database.migration.migration.db.create_tables') as mock_create_tables:
+    # Test the migrate_tables method creates every table without its indexes
+    with ExitStack() as stack:
+        mock_create_tables = [stack.enter_context(patch.object(model._schema, 'create_table')) for model in MODELS]
+        mock_create_indexes = [stack.enter_context(patch.object(model._schema, 'create_indexes')) for model in MODELS]
         migration_instance.migrate_tables()
-        mock_create_tables.assert_called_once()
+        for mock_create_table in mock_create_tables:
+            mock_create_table.assert_called_once_with(safe=True)
+        for mock_create_index in mock_create_indexes:
+            mock_create_index.assert_not_called()
+
+def test_create_indexes(migration_instance):
+    # Test the create_indexes method
+    with ExitStack() as stack:
+        mock_create_indexes = [stack.enter_context(patch.object(model._schema, 'create_indexes')) for model in MODELS]
+        migration_instance.create_indexes()
+        for mock_create_index in mock_create_indexes:
+            mock_create_index.assert_called_once_with(safe=True)
 
 def test_load_json_file_data(migration_instance):
     # Test the load_json_file_data method
@@ -25,4 +39,13 @@ def test_load_json_file_data(migration_instance):
         data = migration_instance.load_json_file_data('person_records')
         assert data == {"data": []}
 
+def test_stream_data_matches_consolidated_data(migration_instance):
+    # Test the streaming pipeline yields the same records as load + consolidate
+    migration_instance.load_persons_json_file_data()
+    migration_instance.load_contacts_json_file_data()
+    migration_instance.consolidate_persons_data()
+    migration_instance.consolidate_contacts_data()
+    assert list(migration_instance.stream_persons_data()) == migration_instance._persons_data
+    assert list(migration_instance.stream_contacts_data()) == migration_instance._contacts_data
+
 # Add more test cases for other methods
@@ -0,0 +1,85 @@
+import time
+import pytest
+from src.lib.database.migration.models.db import db
+from src.lib.database.migration.migration import Migration
+from src.lib.database.migration.pipeline import IngestPipeline, PipelineSource
+from src.lib.database.store import open_store
+from src.lib.helpers.synthetic_data import SyntheticDataGenerator
+
+STAGE_SECONDS = 0.01
+
+
+class SlowLoader:
+    # Stands in for the bulk loader, spending STAGE_SECONDS per chunk
+    def __init__(self):
+        self.written = []
+
+    def load(self, records, to_rows):
+        time.sleep(STAGE_SECONDS)
+        self.written.extend(to_rows(record) for record in records)
+        return len(records)
+
+
+def slow_records(count):
+    for record in range(count):
+        if record % 10 == 0:
+            time.sleep(STAGE_SECONDS)
+        yield record
+
+
+def slow_normalize(record):
+    if record % 10 == 0:
+        time.sleep(STAGE_SECONDS)
+    return record
+
+
+def failing_normalize(record):
+    if record == 25:
+        raise ValueError('bad record {}'.format(record))
+    return record
+
+
+def build(directory, files, **kwargs):
+    if not db.is_closed():
+        db.close()
+    open_store(path=str(directory), files=files)
+    migration = Migration(stream=True, files=files, **kwargs)
+    dump = {table: db.execute_sql('SELECT * FROM "{}" ORDER BY 1, 2'.format(table)).fetchall() for table in ('person', 'experience', 'contact', 'phone', 'person_connection', 'person_cluster')}
+    db.close()
+    db.init(None)
+    return migration, dump
+
+
+def test_pipelined_store_matches_the_sequential_store(tmp_path):
+    files = {'person_records': str(tmp_path / 'persons.json'), 'contact_records': str(tmp_path / 'contacts.json')}
+    SyntheticDataGenerator(300, seed=5).write(files['person_records'], files['contact_records'])
+    _, sequential = build(tmp_path / 'sequential', files)
+    migration, pipelined = build(tmp_path / 'pipelined', files, workers=2, pipeline=True)
+    assert pipelined == sequential
+    stages = migration.get_pipeline_stats()['stages']
+    assert set(stages) == {'{}.{}'.format(source, stage) for source in ('persons', 'contacts') for stage in ('parse', 'normalize', 'write')}
+    assert stages['persons.write']['records'] == len(sequential['person'])
+    assert stages['contacts.normalize']['records'] == len(sequential['contact'])
+
+
+def test_stages_overlap_within_bounded_queues():
+    loader = SlowLoader()
+    pipeline = IngestPipeline(loader, chunk_size=10, queue_size=2)
+    sources = [PipelineSource(name, slow_records(200), slow_normalize, lambda record: [record]) for name in ('persons', 'contacts')]
+    assert pipeline.run(sources) == 400
+    assert loader.written == [[record] for record in range(200)] * 2
+    stats = pipeline.get_stats()
+    work = sum(stage['seconds'] for stage in stats['stages'].values())
+    # Six stages of about 0.2s each, the contacts being parsed and normalized while the persons are written
+    assert stats['seconds'] < 0.6 * work
+    for stage in stats['stages'].values():
+        assert stage['max_queue_depth'] <= 2
+
+
+def test_a_failing_stage_stops_the_pipeline():
+    loader = SlowLoader()
+    pipeline = IngestPipeline(loader, chunk_size=10, queue_size=1)
+    sources = [PipelineSource('persons', range(1000), failing_normalize, lambda record: [record])]
+    with pytest.raises(Exception, match='persons.normalize failed: bad record 25'):
+        pipeline.run(sources)
+    assert len(loader.written) < 1000
@@ -0,0 +1,221 @@
+"""Module providing a pool of read-only SQLite connections to a store"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def read_transaction(connection):
+    """
+    Runs the statements of a `with` block on a connection in one read transaction.
+
+    Outside of a transaction each statement reads the last committed state of the store, so the statements of a lookup could read part of the store before a delta and part of it after. In WAL journaling, a transaction reads the snapshot of its first statement until it ends, without blocking the writer.
+
+    Args:
+        connection (sqlite3.Connection): A connection opened with `isolation_level=None`.
+    """
+    connection.execute('BEGIN')
+    try:
+        yield connection
+    finally:
+        # An interrupted statement may have ended the transaction already
+        if connection.in_transaction:
+            connection.execute('COMMIT')
+
+
+class ReadOnlyConnectionPool:
+    """
+    A fixed set of read-only SQLite connections to a store file, handed out to one thread at a time.
+
+    The connections are opened with a `mode=ro` URI, so they can never write to the store, and without the same thread check of `sqlite3`, so any thread can use a connection it acquired. A ready store is in WAL journaling (see `src.lib.database.store.mark_store_ready()`), so the connections read concurrently with each other and with a delta being written, each statement reading the last committed state unless it runs in a `read_transaction()`.
+
+    Unlike the shared peewee `db`, the pool does not depend on the thread that runs a query, which lets a bounded executor spread the queries of many requests over the connections.
+
+    Args:
+        file (str): The path of the store file.
+        size (int, optional): The number of connections. Defaults to 4.
+
+    Raises:
+        Exception: If the store cannot be opened.
+    """
+
+    def __init__(self, file, size=4):
+        self.file = file
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._closed = False
+        try:
+            for _ in range(size):
+                connection = self._connect()
+                self._connections.append(connection)
+                self._idle.put(connection)
+        except sqlite3.Error as e:
+            self.close()
+            msg = 'ReadOnlyConnectionPool({}): The store could not be opened: {}'.format(file, e)
+            print(msg)
+            raise Exception(msg)
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            'file:{}?mode=ro'.format(os.path.abspath(self.file)),
+            uri=True,
+            check_same_thread=False,
+            isolation_level=None
+        )
+        # Fails here rather than on the first query when the file is not a store
+        connection.execute('SELECT count(*) FROM sqlite_master').fetchone()
+        return connection
+
+    def acquire(self, timeout=None):
+        """
+        Takes an idle connection, waiting for one to be released if they are all in use.
+
+        Args:
+            timeout (float, optional): The maximum number of seconds to wait. Defaults to waiting forever.
+
+        Returns:
+            sqlite3.Connection: The connection, to be given back with `release()`.
+
+        Raises:
+            Exception: If the pool is closed or no connection was released in time.
+        """
+        if self._closed:
+            self._fail('The pool is closed')
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            self._fail('No connection was released within {} seconds'.format(timeout))
+
+    def release(self, connection):
+        """
+        Gives back a connection taken with `acquire()`.
+        """
+        with self._lock:
+            if self._closed:
+                connection.close()
+                return
+        self._idle.put(connection)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Acquires a connection for the duration of a `with` block.
+        """
+        connection = self.acquire(timeout=timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def journal_mode(self):
+        """
+        Returns the journal mode of the store, 'wal' for a store marked ready by this version.
+        """
+        with self.connection() as connection:
+            return connection.execute('PRAGMA journal_mode').fetchone()[0]
+
+    def close(self):
+        """
+        Closes the idle connections. The connections in use are closed when they are released.
+        """
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _fail(self, reason):
+        msg = 'ReadOnlyConnectionPool({}): {}'.format(self.file, reason)
+        print(msg)
+        raise Exception(msg)
+
+
+class PublishedConnectionPool:
+    """
+    A `ReadOnlyConnectionPool` of the store currently published by a long-lived reader, replaced when a new store is published.
+
+    Each store published starts a new generation with a pool of its own. A lookup takes a connection of the current pool and keeps reading that store until it gives the connection back, so publishing never blocks or fails a lookup. The pool of a retired generation is closed once its last lookup is done; its connections are never opened again, and the connections of the current generation are reused by every lookup, whichever thread runs it.
+
+    Args:
+        size (int, optional): The number of connections per generation, which bounds the concurrent lookups. Defaults to 4.
+    """
+
+    def __init__(self, size=4):
+        self.size = size
+        self.generation = 0
+        self.published = None
+        self._pool = None
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def publish(self, file):
+        """
+        Opens a pool on a ready store and makes it the current one. The pool of the previous store is closed once the lookups using it are done.
+
+        Args:
+            file (str): The path of the ready store.
+
+        Returns:
+            int: The new generation.
+        """
+        pool = ReadOnlyConnectionPool(file, size=self.size)
+        with self._lock:
+            retired, self._pool = self._pool, pool
+            self._users[pool] = 0
+            self.published = file
+            self.generation += 1
+            generation = self.generation
+            if retired is not None and self._users[retired] > 0:
+                # Closed by the last lookup giving a connection back
+                retired = None
+            elif retired is not None:
+                del self._users[retired]
+        if retired is not None:
+            retired.close()
+        return generation
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Acquires a connection to the published store for the duration of a `with` block, which receives the generation of that store and the connection.
+        """
+        with self._lock:
+            if self._pool is None:
+                msg = 'PublishedConnectionPool: No store is published'
+                print(msg)
+                raise Exception(msg)
+            pool, generation = self._pool, self.generation
+            self._users[pool] += 1
+        try:
+            with pool.connection(timeout=timeout) as connection:
+                yield generation, connection
+        finally:
+            with self._lock:
+                self._users[pool] -= 1
+                retired = pool is not self._pool and self._users[pool] == 0
+                if retired:
+                    del self._users[pool]
+            if retired:
+                pool.close()
+
+    def close(self):
+        """
+        Closes the pool of the published store. The connections in use are closed when they are given back.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
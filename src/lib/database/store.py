@@ -0,0 +1,373 @@
+"""Module providing the content-addressed SQLite store"""
+import os
+import glob
+import hashlib
+import sqlite3
+import datetime
+
+from src.lib.database.migration.models.db import db, database_path, database_prefix
+
+# Bump whenever the tables written by `Migration` change shape, and add the matching
+# upgrade to `src.lib.database.migration.schema.UPGRADES`.
+SCHEMA_VERSION = 6
+
+# Define file paths for JSON data
+FILES = {
+    'person_records'    : 'src/lib/database/migration/data/persons.json',
+    'contact_records'   : 'src/lib/database/migration/data/contacts.json'
+}
+
+STORE_META_TABLE = 'store_meta'
+
+# The metadata key of the date the null end dates of the stored connections were resolved to
+CONNECTIONS_DATE_KEY = 'connections_date'
+
+# Suffix of the file a store is built in, before it is renamed to its final name
+BUILDING_SUFFIX = '.building'
+
+_digest_cache = {}
+
+
+def source_digest(files=None):
+    """
+    Computes the content hash of the source JSON files.
+
+    The files are read in fixed size chunks, so hashing does not depend on the file size fitting in memory.
+
+    Args:
+        files (dict, optional): The file paths to hash. Defaults to `FILES`.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest of the files content, in `files` key order.
+    """
+    files = FILES if files is None else files
+    cache_key = tuple((file_key, files[file_key], _file_signature(files[file_key])) for file_key in sorted(files))
+    if cache_key in _digest_cache:
+        return _digest_cache[cache_key]
+
+    digest = hashlib.sha256()
+    for file_key in sorted(files):
+        digest.update(file_key.encode('utf-8'))
+        with open(files[file_key], 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    _digest_cache[cache_key] = digest.hexdigest()
+    return _digest_cache[cache_key]
+
+
+def store_name(digest, schema_version=SCHEMA_VERSION):
+    """
+    Returns the store file name for a source digest and a schema version.
+    """
+    return '{}{}_v{}_.db'.format(database_prefix, digest[:16], schema_version)
+
+
+def store_file(path=None, files=None, schema_version=SCHEMA_VERSION):
+    """
+    Returns the path of the store that matches the current source files and a schema version.
+
+    Args:
+        path (str, optional): The directory holding the stores. Defaults to `database_path`.
+        files (dict, optional): The source files. Defaults to `FILES`.
+        schema_version (int, optional): The schema version. Defaults to `SCHEMA_VERSION`.
+    """
+    path = database_path if path is None else path
+    return os.path.join(path, store_name(source_digest(files), schema_version))
+
+
+def current_data_version(files=None, path=None):
+    """
+    Returns the version of the data served for the current source files: their digest, the schema version and, once deltas were applied to the store, the delta version.
+    """
+    version = '{}-v{}'.format(source_digest(files)[:16], SCHEMA_VERSION)
+    delta_version = read_store_meta(store_file(path=path, files=files), 'delta_version')
+    return version if delta_version is None else '{}-d{}'.format(version, delta_version)
+
+
+def read_store_meta(file, key):
+    """
+    Reads a value of the metadata table of a store file.
+
+    The file is opened read-only and never created.
+
+    Args:
+        file (str): The path of the store file.
+        key (str): The metadata key.
+
+    Returns:
+        str: The value, or None if the file, the table or the key does not exist.
+    """
+    if not os.path.isfile(file):
+        return None
+    try:
+        conn = sqlite3.connect('file:{}?mode=ro'.format(os.path.abspath(file)), uri=True)
+        try:
+            row = conn.execute('SELECT value FROM {} WHERE key = ?'.format(STORE_META_TABLE), (key,)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    return None if row is None else row[0]
+
+
+def is_store_ready(file, schema_version=SCHEMA_VERSION):
+    """
+    Checks whether a store file exists and was completely written by a previous migration.
+
+    The check opens the file read-only and never creates it.
+
+    Args:
+        file (str): The path of the store file.
+        schema_version (int, optional): The schema version the store must have. Defaults to `SCHEMA_VERSION`.
+
+    Returns:
+        bool: True if the store holds a finished ingest for the schema version, False otherwise.
+    """
+    value = read_store_meta(file, 'schema_version')
+    return value is not None and int(value) == schema_version
+
+
+def open_store(path=None, files=None):
+    """
+    Binds the shared `db` to the store of the current source files.
+
+    When the store is ready it is opened read-only. When only a store of an older schema version exists for the same source files, it is upgraded in place first (see `upgrade_store()`). Otherwise the files left by interrupted builds are removed and a new file is opened for writing next to the store (see `building_file()`); `mark_store_ready()` renames it to the store name once the ingest is complete, so the store name only ever holds a complete store.
+
+    Args:
+        path (str, optional): The directory holding the stores. Defaults to `database_path`.
+        files (dict, optional): The source files. Defaults to `FILES`.
+
+    Returns:
+        bool: True if the store is ready and the ingest can be skipped, False otherwise.
+    """
+    file = store_file(path=path, files=files)
+    if not db.is_closed():
+        db.close()
+
+    if not is_store_ready(file):
+        upgrade_store(path=path, files=files)
+
+    if is_store_ready(file):
+        db.init('file:{}?mode=ro'.format(os.path.abspath(file)), uri=True)
+        return True
+
+    for partial in [file] + _companion_files(file) + _abandoned_builds(file):
+        if os.path.exists(partial):
+            os.remove(partial)
+    os.makedirs(os.path.dirname(file) or '.', exist_ok=True)
+    db.init(building_file(file))
+    return False
+
+
+def building_file(file):
+    """
+    Returns the file the store `file` is built in by this process.
+
+    The name holds the process ID, so concurrent builds of the same store never write to the same file, and the build of a process that died can be told from a running one.
+    """
+    return '{}.{}{}'.format(file, os.getpid(), BUILDING_SUFFIX)
+
+
+def store_is_open_read_only():
+    """
+    Returns True if the shared `db` is bound to a ready, read-only store.
+    """
+    return bool(db.connect_params.get('uri')) and str(db.database).endswith('mode=ro')
+
+
+def upgrade_store(path=None, files=None):
+    """
+    Upgrades in place the newest store of an older schema version built from the current source files.
+
+    The upgraded file is renamed to the name of the current schema version only once the upgrade is committed, so an interrupted upgrade leaves the older store untouched.
+
+    Args:
+        path (str, optional): The directory holding the stores. Defaults to `database_path`.
+        files (dict, optional): The source files. Defaults to `FILES`.
+
+    Returns:
+        bool: True if a store was upgraded, False if there was no store to upgrade.
+    """
+    for version in range(SCHEMA_VERSION - 1, 0, -1):
+        older = store_file(path=path, files=files, schema_version=version)
+        if not is_store_ready(older, schema_version=version):
+            continue
+
+        from src.lib.database.migration.schema import upgrade_schema
+        db.init(older)
+        db.connect()
+        try:
+            upgrade_schema(version, SCHEMA_VERSION)
+            write_store_meta()
+            # Outside of the upgrade transactions, which cannot change the journal mode
+            db.pragma('journal_mode', 'wal')
+        finally:
+            db.close()
+        os.replace(older, store_file(path=path, files=files))
+        return True
+    return False
+
+
+def write_store_meta():
+    """
+    Records the current schema version in the metadata table of the store bound to `db`.
+    """
+    set_store_meta('schema_version', SCHEMA_VERSION)
+
+
+def set_store_meta(key, value):
+    """
+    Records a value in the metadata table of the store bound to `db`, creating the table if needed.
+
+    Args:
+        key (str): The metadata key.
+        value: The value, stored as text.
+    """
+    db.execute_sql('CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, value TEXT NOT NULL)'.format(STORE_META_TABLE))
+    db.execute_sql(
+        'INSERT OR REPLACE INTO {} (key, value) VALUES (?, ?)'.format(STORE_META_TABLE),
+        (key, str(value))
+    )
+
+
+def connections_date():
+    """
+    Returns the date the null end dates of the connections stored in the store bound to `db` were resolved to.
+
+    Returns:
+        datetime.date: The date, or None for stores built before the date was recorded.
+    """
+    value = read_store_meta(bound_store_file(), CONNECTIONS_DATE_KEY)
+    return None if value is None else datetime.date.fromisoformat(value)
+
+
+def connections_are_stale(today=None):
+    """
+    Checks whether the connections stored in the store bound to `db` were computed before `today`, so the overlaps of the ongoing experiences are shorter than they are today.
+
+    Args:
+        today (datetime.date, optional): Defaults to today.
+    """
+    computed = connections_date()
+    return computed is None or computed < (today or datetime.date.today())
+
+
+def mark_store_ready():
+    """
+    Records the schema version in the store metadata table, flagging the ingest as complete, switches the store to WAL journaling and reopens it read-only.
+
+    The journal mode is recorded in the file, so the read-only connections opened on the store afterwards (see `src.lib.database.pool`) read it in WAL mode and keep reading while deltas are written to it.
+
+    This must be the last write of a migration so that an interrupted run never leaves a store that looks ready.
+
+    When the store was built in a building file (see `open_store()`), the file is renamed to the store name once it is closed. The rename is atomic, so readers see either no store or the complete one, and the readers of a store of the same name keep the file they opened.
+    """
+    write_store_meta()
+    db.pragma('journal_mode', 'wal')
+    file = bound_store_file()
+    # Closing the only connection checkpoints the write-ahead log into the file before the rename
+    db.close()
+    if file.endswith(BUILDING_SUFFIX):
+        published = file[:-len(BUILDING_SUFFIX)].rsplit('.', 1)[0]
+        os.replace(file, published)
+        file = published
+    db.init('file:{}?mode=ro'.format(os.path.abspath(file)), uri=True)
+    db.connect()
+
+
+def bound_store_file():
+    """
+    Returns the path of the store file bound to `db`, whether it is open read-only or for writing.
+    """
+    file = db.database
+    if file is not None and file.startswith('file:'):
+        file = file[len('file:'):].split('?', 1)[0]
+    return file
+
+
+def reopen_store_for_writing():
+    """
+    Reopens the ready store bound to `db` for writing, so deltas can be applied to it. `mark_store_ready()` reopens it read-only again.
+
+    Raises:
+        Exception: If the bound store is not ready.
+    """
+    file = bound_store_file()
+    if file is None or not is_store_ready(file):
+        msg = 'reopen_store_for_writing(): The store {} is not ready'.format(file)
+        print(msg)
+        raise Exception(msg)
+    if not db.is_closed():
+        db.close()
+    db.init(file)
+    db.connect()
+
+
+def bump_delta_version():
+    """
+    Increments the delta version recorded in the metadata table of the store bound to `db`, which changes `current_data_version()`.
+
+    Returns:
+        int: The new delta version.
+    """
+    db.execute_sql(
+        'INSERT INTO {0} (key, value) VALUES (?, ?) '
+        'ON CONFLICT (key) DO UPDATE SET value = CAST(CAST({0}.value AS INTEGER) + 1 AS TEXT)'.format(STORE_META_TABLE),
+        ('delta_version', '1')
+    )
+    return int(db.execute_sql('SELECT value FROM {} WHERE key = ?'.format(STORE_META_TABLE), ('delta_version',)).fetchone()[0])
+
+
+def collect_stale_stores(path=None, keep=None):
+    """
+    Removes every store in `path` except the ones listed in `keep`.
+
+    Args:
+        path (str, optional): The directory holding the stores. Defaults to `database_path`.
+        keep (list[str], optional): The store files to preserve. Defaults to the store of the current source files.
+
+    Returns:
+        list[str]: The removed store files.
+    """
+    path = database_path if path is None else path
+    keep = [store_file(path=path)] if keep is None else keep
+    keep = {os.path.abspath(file) for file in keep}
+
+    removed = []
+    for file in sorted(glob.glob(os.path.join(path, '{}*_.db'.format(database_prefix)))):
+        if os.path.abspath(file) in keep:
+            continue
+        for stale in [file] + _companion_files(file):
+            if os.path.exists(stale):
+                os.remove(stale)
+        removed.append(file)
+    return removed
+
+
+def _file_signature(file):
+    stat = os.stat(file)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _companion_files(file):
+    return ['{}{}'.format(file, suffix) for suffix in ('-journal', '-wal', '-shm')]
+
+
+def _abandoned_builds(file):
+    # The building files of this process and of the processes that are no longer running
+    abandoned = []
+    for building in glob.glob(glob.escape(file) + '.*' + BUILDING_SUFFIX):
+        pid = building[len(file) + 1:-len(BUILDING_SUFFIX)]
+        if pid.isdigit() and (int(pid) == os.getpid() or not _process_exists(int(pid))):
+            abandoned += [building] + _companion_files(building)
+    return abandoned
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
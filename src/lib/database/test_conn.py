@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import threading
+import pytest
+from peewee import SqliteDatabase
+from src.lib.database.conn import db, ensure_store, build_store, ConnectionManager
+from src.lib.database.store import bound_store_file
+from src.lib.database.pool import ReadOnlyConnectionPool, PublishedConnectionPool, read_transaction
+
+
+def test_build_store_returns_the_ready_store():
+    ensure_store()
+    assert os.path.abspath(build_store()) == os.path.abspath(bound_store_file())
+
+
+def test_threads_move_to_a_published_store_on_their_next_reader():
+    ensure_store()
+    file = bound_store_file()
+    manager = ConnectionManager()
+    manager.publish(file)
+    entered, published, done = threading.Event(), threading.Event(), threading.Event()
+    seen = []
+
+    def read():
+        with manager.reader() as generation:
+            connection = db.connection()
+            entered.set()
+            published.wait(5)
+            # A publish does not touch the connection of a thread in the middle of a read
+            seen.append((generation, db.connection() is connection))
+        with manager.reader() as generation:
+            seen.append((generation, db.connection() is connection))
+        manager.release()
+        done.set()
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    assert entered.wait(5)
+    assert manager.publish(file) == 2
+    published.set()
+    assert done.wait(5)
+    thread.join()
+
+    assert seen == [(1, True), (2, False)]
+
+
+def wal_store(tmp_path):
+    writer = sqlite3.connect(str(tmp_path / 'store.db'), isolation_level=None)
+    writer.execute('PRAGMA journal_mode = wal')
+    writer.execute('CREATE TABLE person (id INTEGER PRIMARY KEY)')
+    writer.execute('INSERT INTO person (id) VALUES (1)')
+    return str(tmp_path / 'store.db'), writer
+
+
+def test_reader_blocks_read_one_snapshot(tmp_path):
+    file, writer = wal_store(tmp_path)
+    database = SqliteDatabase(None)
+    manager = ConnectionManager(database)
+    manager.publish(file)
+    count = 'SELECT COUNT(*) FROM person'
+    with manager.reader():
+        assert database.execute_sql(count).fetchone()[0] == 1
+        # A delta committed in the middle of a lookup is not seen by the rest of it
+        writer.execute('INSERT INTO person (id) VALUES (2)')
+        assert database.execute_sql(count).fetchone()[0] == 1
+    with manager.reader():
+        assert database.execute_sql(count).fetchone()[0] == 2
+    manager.release()
+
+    with ReadOnlyConnectionPool(file, size=1) as pool, pool.connection() as connection:
+        with read_transaction(connection):
+            assert connection.execute(count).fetchone()[0] == 2
+            writer.execute('INSERT INTO person (id) VALUES (3)')
+            assert connection.execute(count).fetchone()[0] == 2
+        assert not connection.in_transaction
+        assert connection.execute(count).fetchone()[0] == 3
+    writer.close()
+
+
+def test_published_pool_reuses_connections_and_retires_generations(tmp_path):
+    file, writer = wal_store(tmp_path)
+    pool = PublishedConnectionPool(size=1)
+    assert pool.publish(file) == 1
+    with pool.connection() as (generation, first):
+        pass
+    with pool.connection() as (generation, second):
+        assert (generation, second) == (1, first)
+        # A lookup on the previous store finishes on it, and its connection is closed afterwards
+        assert pool.publish(file) == 2
+        assert second.execute('SELECT COUNT(*) FROM person').fetchone()[0] == 1
+    with pytest.raises(sqlite3.ProgrammingError):
+        second.execute('SELECT 1')
+    with pool.connection() as (generation, third):
+        assert generation == 2 and third is not first
+    pool.close()
+    writer.close()
@@ -0,0 +1,119 @@
+import os
+import json
+import pytest
+from src.lib.database.migration.models.db import db
+from src.lib.database import store
+
+
+@pytest.fixture
+def source_files(tmp_path):
+    persons = tmp_path / 'persons.json'
+    contacts = tmp_path / 'contacts.json'
+    persons.write_text(json.dumps([{"id": 1, "first": "Jane", "last": "Doe", "phone": None, "experience": []}]))
+    contacts.write_text(json.dumps([]))
+    yield {'person_records': str(persons), 'contact_records': str(contacts)}
+    # Unbind the shared database so the next user opens the default store
+    if not db.is_closed():
+        db.close()
+    db.init(None)
+
+
+def test_store_file_is_keyed_by_content(tmp_path, source_files):
+    first = store.store_file(path=str(tmp_path), files=source_files)
+    assert store.store_file(path=str(tmp_path), files=source_files) == first
+
+    with open(source_files['contact_records'], 'w') as f:
+        f.write('[{"id": 1, "owner_id": 1, "contact_nickname": "Mom", "phone": []}]')
+    assert store.store_file(path=str(tmp_path), files=source_files) != first
+
+
+def test_open_store_reuses_ready_store(tmp_path, source_files):
+    assert store.open_store(path=str(tmp_path), files=source_files) is False
+    assert not store.store_is_open_read_only()
+
+    store.mark_store_ready()
+    assert store.store_is_open_read_only()
+    assert db.pragma('journal_mode') == 'wal'
+    assert store.is_store_ready(store.store_file(path=str(tmp_path), files=source_files))
+
+    assert store.open_store(path=str(tmp_path), files=source_files) is True
+    assert store.store_is_open_read_only()
+
+
+def test_open_store_discards_partial_store(tmp_path, source_files):
+    file = store.store_file(path=str(tmp_path), files=source_files)
+    with open(file, 'w') as f:
+        f.write('interrupted ingest')
+
+    assert store.open_store(path=str(tmp_path), files=source_files) is False
+    assert not os.path.exists(file)
+
+
+def test_store_is_built_next_to_its_name_and_renamed_when_ready(tmp_path, source_files):
+    file = store.store_file(path=str(tmp_path), files=source_files)
+    # A build left by a process that is no longer running
+    abandoned = '{}.{}{}'.format(file, 2 ** 22 + 1, store.BUILDING_SUFFIX)
+    open(abandoned, 'w').close()
+
+    assert store.open_store(path=str(tmp_path), files=source_files) is False
+    assert not os.path.exists(abandoned)
+    db.execute_sql('CREATE TABLE person (id INTEGER PRIMARY KEY)')
+    # An interrupted ingest never shows under the store name
+    assert store.bound_store_file() == store.building_file(file)
+    assert not os.path.exists(file)
+
+    store.mark_store_ready()
+    assert store.bound_store_file() == os.path.abspath(file)
+    assert not os.path.exists(store.building_file(file))
+    assert store.is_store_ready(file)
+
+
+def test_collect_stale_stores(tmp_path, source_files):
+    current = store.store_file(path=str(tmp_path), files=source_files)
+    stale = os.path.join(str(tmp_path), store.store_name('0' * 64))
+    for file in (current, stale, stale + '-journal'):
+        open(file, 'w').close()
+
+    removed = store.collect_stale_stores(path=str(tmp_path), keep=[current])
+
+    assert removed == [stale]
+    assert os.path.exists(current)
+    assert not os.path.exists(stale + '-journal')
+
+
+# The tables as written by schema version 1
+SCHEMA_V1 = [
+    'CREATE TABLE "person" ("id" INTEGER NOT NULL PRIMARY KEY, "first_name" VARCHAR(255) NOT NULL, "last_name" VARCHAR(255) NOT NULL, "phone" VARCHAR(255))',
+    'CREATE TABLE "experience" ("id" INTEGER NOT NULL PRIMARY KEY, "title" VARCHAR(255) NOT NULL, "company" VARCHAR(255) NOT NULL, "start_date" DATE NOT NULL, "end_date" DATE, "person_id" INTEGER NOT NULL, FOREIGN KEY ("person_id") REFERENCES "person" ("id"))',
+    'CREATE INDEX "experience_person_id" ON "experience" ("person_id")',
+    'CREATE TABLE "contact" ("id" INTEGER NOT NULL PRIMARY KEY, "nickname" VARCHAR(255) NOT NULL, "owner_id" INTEGER NOT NULL, FOREIGN KEY ("owner_id") REFERENCES "person" ("id"))',
+    'CREATE INDEX "contact_owner_id" ON "contact" ("owner_id")',
+    'CREATE TABLE "phone" ("id" INTEGER NOT NULL PRIMARY KEY, "type" VARCHAR(255) NOT NULL, "number" VARCHAR(255) NOT NULL, "contact_id" INTEGER NOT NULL, FOREIGN KEY ("contact_id") REFERENCES "contact" ("id"))',
+    'CREATE INDEX "phone_contact_id" ON "phone" ("contact_id")',
+    'CREATE TABLE "store_meta" (key TEXT PRIMARY KEY, value TEXT NOT NULL)',
+    "INSERT INTO \"store_meta\" VALUES ('schema_version', '1')",
+    "INSERT INTO \"person\" VALUES (1, 'Jane', 'Doe', '+19173454768')",
+    "INSERT INTO \"contact\" VALUES (1, 'Jane', 1)",
+    "INSERT INTO \"phone\" VALUES (1, 'cell', '9173454768', 1)",
+]
+
+
+def test_open_store_upgrades_older_store_in_place(tmp_path, source_files):
+    older = store.store_file(path=str(tmp_path), files=source_files, schema_version=1)
+    db.init(older)
+    for statement in SCHEMA_V1:
+        db.execute_sql(statement)
+    db.close()
+
+    assert store.open_store(path=str(tmp_path), files=source_files) is True
+    assert not os.path.exists(older)
+    assert store.is_store_ready(store.store_file(path=str(tmp_path), files=source_files))
+
+    indexes = [index.name for table in ('person', 'experience', 'phone') for index in db.get_indexes(table)]
+    assert 'experience_company_start_date_end_date_person_id_title' in indexes
+    assert 'person_phone_key_first_name_last_name' in indexes
+    assert 'phone_number_key_contact_id' in indexes
+    assert db.execute_sql('SELECT phone_key FROM person').fetchone() == (19173454768,)
+    assert db.execute_sql('SELECT number_key FROM phone').fetchone() == (19173454768,)
+    # The only contact phone of person 1 is their own number, which is not a connection
+    assert db.execute_sql('SELECT count(*) FROM person_connection').fetchone() == (0,)
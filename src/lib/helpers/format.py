@@ -2,3 +2,19 @@ def normalize_phone(phone):
     if not phone:
         return None
     return phone.replace('-', '').replace('(', '').replace(')', '').replace(' ', '')
+
+
+def canonical_phone_key(phone, default_country_code=1):
+    # The key is the integer of the number's digits with its country code, as in E.164: a 10 digit
+    # number is national and gets `default_country_code` prepended, 11 to 15 digits already start
+    # with a country code, whose national part can have any length. Only leading zeros are dropped,
+    # so a `00` international prefix gives the key of the number written without it
+    if not phone:
+        return None
+    # Only ASCII digits: str.isdigit() also accepts characters like '²', which int() rejects
+    digits = ''.join(c for c in phone if c in '0123456789')
+    if len(digits) < 10 or len(digits) > 15:
+        return None
+    if len(digits) == 10:
+        return default_country_code * 10**10 + int(digits)
+    return int(digits)
@@ -1,4 +1,4 @@
-from src.lib.helpers.format import normalize_phone
+from src.lib.helpers.format import normalize_phone, canonical_phone_key
 
 def test_normalize_phone():
     # Test case 1: Normal phone number with hyphens, parentheses, and spaces
@@ -14,4 +14,29 @@ def test_normalize_phone():
     assert normalize_phone("(123) 456-7890-") == "1234567890"
 
     # Test case 5: Empty phone number
-    assert normalize_phone("") == None
\ No newline at end of file
+    assert normalize_phone("") == None
+
+def test_canonical_phone_key():
+    # Test case 1: The same number with and without the country code has the same key
+    assert canonical_phone_key("+19173454768") == 19173454768
+    assert canonical_phone_key("19173454768") == 19173454768
+    assert canonical_phone_key("9173454768") == 19173454768
+    assert canonical_phone_key("1-9173454768") == 19173454768
+
+    # Test case 2: Dashes, parentheses and whitespace are ignored
+    assert canonical_phone_key("(917) 345-4768") == 19173454768
+    assert canonical_phone_key(" +1 (917) 345 4768 ") == 19173454768
+
+    # Test case 3: Other country codes are kept
+    assert canonical_phone_key("+55 (62) 9 9322-3016") == 5562993223016
+    assert canonical_phone_key("+442034567890") == 442034567890
+    assert canonical_phone_key("00 44 20 3456 7890") == 442034567890
+
+    # Test case 4: Empty or invalid phone numbers have no key
+    assert canonical_phone_key(None) is None
+    assert canonical_phone_key("") is None
+    assert canonical_phone_key("555-1234") is None
+
+    # Test case 5: Digit-like characters other than the ASCII digits are ignored
+    assert canonical_phone_key("(917) 345-4768²") == 19173454768
+    assert canonical_phone_key("²³¹⁴⁵⁶⁷⁸⁹⁰") is None
@@ -0,0 +1,99 @@
+import json
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+
+
+def iter_json_array(file, chunk_size=1 << 16):
+    """
+    Incrementally parses a JSON file whose root level object is an array, yielding one element at a time.
+
+    Only the elements not yet yielded are kept in memory, so the memory used depends on the size of the largest element and `chunk_size`, not on the size of the file.
+
+    Args:
+        file (str): The path of the JSON file.
+        chunk_size (int, optional): The number of characters read from the file at a time. Defaults to 64KiB.
+
+    Yields:
+        The decoded elements of the root level array, in file order.
+
+    Raises:
+        ValueError: If the root level object is not an array or the file is not valid JSON.
+    """
+    with open(file, 'r') as f:
+        reader = _ChunkReader(f, chunk_size)
+
+        if reader.next_char() != '[':
+            raise ValueError('{}: the root level object is not an array'.format(file))
+        reader.advance(1)
+
+        if reader.next_char() == ']':
+            reader.advance(1)
+            reader.expect_end(file)
+            return
+
+        while True:
+            yield reader.decode(file)
+            separator = reader.next_char()
+            reader.advance(1)
+            if separator == ']':
+                reader.expect_end(file)
+                return
+            if separator != ',':
+                raise ValueError('{}: expected "," or "]" at offset {}'.format(file, reader.offset))
+
+
+class _ChunkReader:
+    """Keeps the unparsed tail of a file in a buffer that grows only as much as the next value needs."""
+
+    def __init__(self, f, chunk_size):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._position = 0
+        self._eof = False
+        self.offset = 0
+
+    def _read(self, size):
+        chunk = self._file.read(size)
+        if not chunk:
+            self._eof = True
+        # Drop the consumed prefix before growing the buffer
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+
+    def next_char(self):
+        """Skips whitespace and returns the next character, or '' at the end of the file."""
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in _whitespace:
+                self._position += 1
+                self.offset += 1
+            if self._position < len(self._buffer) or self._eof:
+                return self._buffer[self._position:self._position + 1]
+            self._read(self._chunk_size)
+
+    def advance(self, count):
+        self._position += count
+        self.offset += count
+
+    def decode(self, file):
+        """Decodes the value starting at the current position, reading more of the file until it is complete."""
+        self.next_char()
+        read_size = self._chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._position)
+                # A number ending at the buffer end may continue in the next chunk
+                if end < len(self._buffer) or self._eof:
+                    self.offset += end - self._position
+                    self._position = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise ValueError('{}: invalid JSON at offset {}: {}'.format(file, self.offset, e.msg))
+            self._read(read_size)
+            read_size *= 2
+
+    def expect_end(self, file):
+        if self.next_char() != '':
+            raise ValueError('{}: unexpected data after the root level array at offset {}'.format(file, self.offset))
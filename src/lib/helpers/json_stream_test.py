@@ -0,0 +1,41 @@
+import json
+import pytest
+from src.lib.helpers.json_stream import iter_json_array
+
+
+def write(tmp_path, text):
+    file = tmp_path / 'records.json'
+    file.write_text(text)
+    return str(file)
+
+
+def test_iter_json_array_matches_json_load(tmp_path):
+    records = [
+        {"id": i, "first": "Jane {}".format(i), "phone": None, "experience": [{"company": "A, [B]", "end": None}]}
+        for i in range(200)
+    ]
+    file = write(tmp_path, json.dumps(records, indent=4))
+
+    # A chunk size smaller than a record forces records to span several reads
+    assert list(iter_json_array(file, chunk_size=7)) == records
+    assert list(iter_json_array(file)) == records
+
+
+def test_iter_json_array_scalars_across_chunks(tmp_path):
+    file = write(tmp_path, '[12345, 678,\n 9 ]')
+    assert list(iter_json_array(file, chunk_size=2)) == [12345, 678, 9]
+
+
+def test_iter_json_array_empty(tmp_path):
+    assert list(iter_json_array(write(tmp_path, ' [ ] \n'))) == []
+
+
+def test_iter_json_array_invalid(tmp_path):
+    with pytest.raises(ValueError):
+        list(iter_json_array(write(tmp_path, '{"persons": []}')))
+
+    with pytest.raises(ValueError):
+        list(iter_json_array(write(tmp_path, '[{"id": 1}, {"id": 2}')))
+
+    with pytest.raises(ValueError):
+        list(iter_json_array(write(tmp_path, '[{"id": 1}] []')))
@@ -0,0 +1,211 @@
+import sys
+import json
+import time
+import functools
+
+# resource is only available on Unix, the peak RSS is reported as None elsewhere
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class _Section:
+    """The timing of one active section, holding the rows it reports."""
+
+    __slots__ = ('name', 'rows', 'started')
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.started = 0.0
+
+    def add_rows(self, rows):
+        self.rows += rows
+
+
+class _NullSection:
+    """Stands in for a section while the profiler is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def add_rows(self, rows):
+        pass
+
+
+_NULL_SECTION = _NullSection()
+
+
+class _ActiveSection:
+
+    __slots__ = ('_profiler', '_section')
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._section = _Section(name)
+
+    def __enter__(self):
+        self._profiler._stack.append(self._section)
+        self._section.started = time.perf_counter()
+        return self._section
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self._section.started
+        self._profiler._stack.pop()
+        self._profiler._record(self._section.name, seconds, self._section.rows)
+        return False
+
+
+class Profiler:
+    """
+    Collects the time spent in named sections of the code and the SQL statements executed in each of them.
+
+    Sections are opened with `with profiler.section('Migration.create_person_records') as section:` and report the rows they processed with `section.add_rows(n)`. Each section accumulates its number of calls, its wall time, the rows it reported, and the number and execution time of the SQL statements executed while it is the innermost open section. Statements executed outside of any section are accounted to the `(unscoped)` section.
+
+    SQL statements are counted by wrapping the `execute_sql` method of the database given to `enable()`, which every peewee query and raw statement goes through. The time of a statement is the time of `execute_sql`, which runs the statement up to its first row; reading the remaining rows is part of the section time only.
+
+    While the profiler is disabled, `section()` returns a shared no-op context manager and the database is left untouched, so the instrumented code runs at full speed.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._database = None
+        self._stack = []
+        self._sections = {}
+        self._statements = 0
+        self._sql_seconds = 0.0
+        self._started = None
+
+    def enable(self, database=None):
+        """
+        Starts collecting, counting the SQL statements executed through `database` when one is given.
+        """
+        self.reset()
+        self.enabled = True
+        self._started = time.perf_counter()
+        if database is not None:
+            self._database = database
+            execute_sql = database.execute_sql
+
+            def profiled_execute_sql(sql, params=None, *args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return execute_sql(sql, params, *args, **kwargs)
+                finally:
+                    self._record_statement(time.perf_counter() - started)
+
+            database.execute_sql = profiled_execute_sql
+
+    def disable(self):
+        """
+        Stops collecting and restores the `execute_sql` method of the database. The collected figures are kept.
+        """
+        self.enabled = False
+        if self._database is not None:
+            del self._database.execute_sql
+            self._database = None
+
+    def reset(self):
+        self._stack = []
+        self._sections = {}
+        self._statements = 0
+        self._sql_seconds = 0.0
+        self._started = time.perf_counter() if self.enabled else None
+
+    def section(self, name):
+        """
+        Returns a context manager timing the named section, which yields an object whose `add_rows(n)` reports the rows processed.
+        """
+        if not self.enabled:
+            return _NULL_SECTION
+        return _ActiveSection(self, name)
+
+    def record(self, name, seconds, rows=0):
+        """
+        Accounts a call of the named section timed by the caller, for work that cannot run in a `with` block, such as the records a generator yields to its consumer. Nothing is recorded while the profiler is disabled.
+        """
+        if self.enabled:
+            self._record(name, seconds, rows)
+
+    def report(self):
+        """
+        Returns the collected figures.
+
+        Returns:
+            dict: The `wall_seconds` since the profiler was enabled, the `sql` totals (`statements` and `seconds`), the `peak_rss_bytes` of the process, and the `sections` keyed by name, each with its `calls`, `seconds`, `rows`, `sql_statements` and `sql_seconds`, in the order they were first closed.
+        """
+        return {
+            'wall_seconds': time.perf_counter() - self._started if self._started is not None else 0.0,
+            'sql': {'statements': self._statements, 'seconds': self._sql_seconds},
+            'peak_rss_bytes': peak_rss_bytes(),
+            'sections': {name: dict(section) for name, section in self._sections.items()},
+        }
+
+    def write_report(self, file=None):
+        """
+        Writes the report as a JSON document to a file, or to the standard error when `file` is None or `-`.
+        """
+        document = json.dumps(self.report(), indent=4)
+        if file is None or file == '-':
+            print(document, file=sys.stderr)
+            return
+        with open(file, 'w') as f:
+            f.write(document + '\n')
+
+    def _entry(self, name):
+        entry = self._sections.get(name)
+        if entry is None:
+            entry = self._sections[name] = {'calls': 0, 'seconds': 0.0, 'rows': 0, 'sql_statements': 0, 'sql_seconds': 0.0}
+        return entry
+
+    def _record(self, name, seconds, rows):
+        entry = self._entry(name)
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        entry['rows'] += rows
+
+    def _record_statement(self, seconds):
+        self._statements += 1
+        self._sql_seconds += seconds
+        entry = self._entry(self._stack[-1].name if self._stack else '(unscoped)')
+        entry['sql_statements'] += 1
+        entry['sql_seconds'] += seconds
+
+
+def profiled(name):
+    """
+    Decorates a function so each call is timed as the named section of the shared profiler, reporting the length of a returned list as its rows.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with profiler.section(name) as section:
+                result = function(*args, **kwargs)
+                if isinstance(result, list):
+                    section.add_rows(len(result))
+                return result
+        return wrapper
+    return decorate
+
+
+def peak_rss_bytes():
+    """
+    Returns the peak resident set size of the process in bytes, or None when it is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# The profiler shared by the instrumented modules, enabled by `main.py --profile`
+profiler = Profiler()
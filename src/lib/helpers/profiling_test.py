@@ -0,0 +1,113 @@
+import json
+import pytest
+from peewee import SqliteDatabase
+from src.lib.helpers.profiling import Profiler, profiler, profiled
+from src.lib.database import store
+from src.lib.database.migration.models.db import db
+from src.lib.database.migration.migration import Migration
+
+
+@pytest.fixture
+def database():
+    database = SqliteDatabase(':memory:')
+    database.connect()
+    database.execute_sql('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+    yield database
+    database.close()
+
+
+def test_sections_count_their_statements_and_rows(database):
+    profiling = Profiler()
+    profiling.enable(database)
+    database.execute_sql('INSERT INTO item (id) VALUES (1), (2), (3)')
+    with profiling.section('outer') as outer:
+        with profiling.section('inner') as inner:
+            inner.add_rows(len(database.execute_sql('SELECT id FROM item').fetchall()))
+        database.execute_sql('SELECT COUNT(*) FROM item')
+        outer.add_rows(1)
+    with profiling.section('inner'):
+        database.execute_sql('SELECT id FROM item WHERE id = 1')
+    profiling.disable()
+    database.execute_sql('SELECT 1')
+
+    report = json.loads(json.dumps(profiling.report()))
+    assert report['sql']['statements'] == 4
+    assert report['sections']['(unscoped)']['sql_statements'] == 1
+    assert report['sections']['outer']['calls'] == 1
+    assert report['sections']['outer']['rows'] == 1
+    assert report['sections']['outer']['sql_statements'] == 1
+    assert report['sections']['inner']['calls'] == 2
+    assert report['sections']['inner']['rows'] == 3
+    assert report['sections']['inner']['sql_statements'] == 2
+    assert report['sections']['outer']['seconds'] >= report['sections']['outer']['sql_seconds']
+    assert report['peak_rss_bytes'] is None or report['peak_rss_bytes'] > 0
+    assert 'execute_sql' not in vars(database)
+
+
+def test_disabled_profiler_is_a_no_op(database):
+    profiling = Profiler()
+    with profiling.section('ignored') as section:
+        section.add_rows(10)
+        database.execute_sql('SELECT 1')
+    assert profiling.report()['sections'] == {}
+    assert 'execute_sql' not in vars(database)
+
+
+def test_profiled_functions_report_their_rows():
+    @profiled('test.items')
+    def items(count):
+        return list(range(count))
+
+    assert items(2) == [0, 1]
+    profiler.enable()
+    try:
+        assert items(3) == [0, 1, 2]
+        assert items(4) == [0, 1, 2, 3]
+    finally:
+        profiler.disable()
+    assert profiler.report()['sections']['test.items']['calls'] == 2
+    assert profiler.report()['sections']['test.items']['rows'] == 7
+
+
+def test_migration_stages_are_profiled(tmp_path):
+    if not db.is_closed():
+        db.close()
+    store.open_store(path=str(tmp_path))
+    profiler.enable(db)
+    try:
+        Migration()
+    finally:
+        profiler.disable()
+        db.close()
+        db.init(None)
+
+    sections = profiler.report()['sections']
+    for stage in ('database_connect', 'migrate_tables', 'load_persons_json_file_data', 'load_contacts_json_file_data',
+                  'consolidate_persons_data', 'consolidate_contacts_data', 'create_person_records', 'create_contact_records'):
+        assert sections['Migration.{}'.format(stage)]['calls'] == 1
+    assert sections['Migration.load_persons_json_file_data']['rows'] == sections['Migration.consolidate_persons_data']['rows'] > 0
+    assert sections['Migration.create_person_records']['rows'] > sections['Migration.consolidate_persons_data']['rows']
+    assert sections['Migration.create_person_records']['sql_statements'] > 0
+
+
+@pytest.mark.parametrize('kwargs, sections', [
+    ({'stream': True}, ('stream_persons_data.parse', 'stream_persons_data.consolidate', 'stream_contacts_data.parse', 'stream_contacts_data.consolidate')),
+    ({'stream': True, 'pipeline': True}, ('create_pipelined_records.persons.parse', 'create_pipelined_records.persons.normalize', 'create_pipelined_records.contacts.write')),
+])
+def test_streamed_migration_times_parse_and_consolidate(tmp_path, kwargs, sections):
+    if not db.is_closed():
+        db.close()
+    store.open_store(path=str(tmp_path))
+    profiler.enable(db)
+    try:
+        Migration(**kwargs)
+    finally:
+        profiler.disable()
+        db.close()
+        db.init(None)
+
+    report = profiler.report()['sections']
+    for section in sections:
+        assert report['Migration.{}'.format(section)]['calls'] == 1
+        assert report['Migration.{}'.format(section)]['rows'] > 0
+    assert 'Migration.load_persons_json_file_data' not in report
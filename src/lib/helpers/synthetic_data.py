@@ -0,0 +1,162 @@
+import json
+import random
+import datetime
+from bisect import bisect_left
+from itertools import accumulate
+
+FIRST_NAMES = ['John', 'Jane', 'Bob', 'Alice', 'Mike', 'Emily', 'Sarah', 'David', 'Linda', 'Chris', 'Maria', 'James', 'Ana', 'Wei', 'Fatima', 'Olga']
+LAST_NAMES = ['Doe', 'Smith', 'Johnson', 'Williams', 'Davis', 'Taylor', 'Lee', 'Hall', 'Brown', 'Silva', 'Garcia', 'Chen', 'Khan', 'Ivanova', 'Santos', 'Martin']
+TITLES = ['Engineer', 'Sales Manager', 'Account Manager', 'Director of Marketing', 'Marketing Manager', 'Analyst', 'Designer', 'Product Manager']
+NICKNAMES = ['Mom', 'Dad', 'Boss', 'Uncle', 'Aunt', 'Friend', 'Neighbour', 'Coworker', 'Dentist', 'Coach']
+PHONE_TYPES = ['cell', 'landline', 'work']
+
+# The formats a 10 digit national number is written in, the last ones with the default country code,
+# so every format of a number has the same `canonical_phone_key`
+PHONE_FORMATS = [
+    '({0}) {1}-{2}',
+    '{0}-{1}-{2}',
+    '{0}.{1}.{2}',
+    '{0}{1}{2}',
+    '+1{0}{1}{2}',
+    '+1 ({0}) {1}-{2}',
+    '1-{0}-{1}-{2}',
+]
+
+# The format of the foreign numbers in contact books, which never match a person
+FOREIGN_PHONE_FORMAT = '+44 {0} {1} {2}'
+
+
+class SyntheticDataGenerator:
+    """
+    Generates person and contact records in the shape of `persons.json` and `contacts.json`, deterministically for a given seed.
+
+    Every person gets a distinct national phone number. Companies are drawn from a Zipf distribution, so a few companies employ most of the persons when `company_skew` is high. Tenures are drawn from a log-normal distribution around `median_tenure_days`, and a share of the experiences is still running (null end date). Phone numbers are written in `PHONE_FORMATS`, the first one only when `phone_format_variety` is 0, with a few foreign numbers in the contact books. Contact books hold a number of contacts drawn around `contacts_per_person`, a share of them pointing at the phone of another generated person.
+
+    Records are produced one at a time, so files of millions of persons are written without holding them in memory.
+
+    Args:
+        persons (int): The number of persons.
+        seed (int, optional): The random seed. Defaults to 0.
+        companies (int, optional): The number of companies. Defaults to one per 10 persons.
+        company_skew (float, optional): The Zipf exponent of the company sizes, 0 for uniform. Defaults to 0.8.
+        experiences_per_person (float, optional): The mean number of experiences per person. Defaults to 2.5.
+        median_tenure_days (int, optional): The median length of an experience in days. Defaults to 720.
+        current_share (float, optional): The share of experiences with a null end date. Defaults to 0.2.
+        phone_format_variety (float, optional): The share of phone numbers not written in the first format. Defaults to 0.5.
+        contacts_per_person (float, optional): The mean number of contacts per person. Defaults to 3.
+        known_contact_share (float, optional): The share of contact phones that are the phone of a generated person. Defaults to 0.5.
+        today (datetime.date, optional): The latest start date. Defaults to today.
+    """
+
+    def __init__(self, persons, seed=0, companies=None, company_skew=0.8, experiences_per_person=2.5,
+                 median_tenure_days=720, current_share=0.2, phone_format_variety=0.5, contacts_per_person=3,
+                 known_contact_share=0.5, today=None):
+        self.persons = persons
+        self.seed = seed
+        self.companies = companies or max(1, persons // 10)
+        self.company_skew = company_skew
+        self.experiences_per_person = experiences_per_person
+        self.median_tenure_days = median_tenure_days
+        self.current_share = current_share
+        self.phone_format_variety = phone_format_variety
+        self.contacts_per_person = contacts_per_person
+        self.known_contact_share = known_contact_share
+        self.today = (today or datetime.date.today()).toordinal()
+        self._company_weights = list(accumulate(1.0 / rank ** company_skew for rank in range(1, self.companies + 1)))
+
+    def national_number(self, person_id):
+        """
+        Returns the distinct 10 digit national number of a person, as three groups of digits.
+        """
+        # A multiplicative permutation spreads consecutive IDs over the number space
+        number = 2000000000 + (person_id * 2654435761) % 7999999999
+        digits = str(number)
+        return digits[:3], digits[3:6], digits[6:]
+
+    def format_phone(self, rng, groups):
+        if rng.random() >= self.phone_format_variety:
+            return PHONE_FORMATS[0].format(*groups)
+        return rng.choice(PHONE_FORMATS[1:]).format(*groups)
+
+    def company(self, rng):
+        index = bisect_left(self._company_weights, rng.random() * self._company_weights[-1])
+        return 'Company{}'.format(min(index, self.companies - 1))
+
+    def experience(self, rng):
+        tenure = max(1, int(rng.lognormvariate(0, 0.8) * self.median_tenure_days))
+        start = self.today - rng.randint(0, 20 * 365)
+        end = None if rng.random() < self.current_share else min(start + tenure, self.today)
+        return {
+            'company': self.company(rng),
+            'title': rng.choice(TITLES),
+            'start': datetime.date.fromordinal(start).isoformat(),
+            'end': None if end is None else datetime.date.fromordinal(end).isoformat(),
+        }
+
+    def iter_persons(self):
+        """
+        Yields the person records, by ID from 1.
+        """
+        rng = random.Random('persons-{}'.format(self.seed))
+        for person_id in range(1, self.persons + 1):
+            experiences = [self.experience(rng) for _ in range(self._count(rng, self.experiences_per_person))]
+            yield {
+                'id': person_id,
+                'first': rng.choice(FIRST_NAMES),
+                'last': rng.choice(LAST_NAMES),
+                'phone': self.format_phone(rng, self.national_number(person_id)),
+                'experience': experiences,
+            }
+
+    def iter_contacts(self):
+        """
+        Yields the contact records, by ID from 1, grouped by owner.
+        """
+        rng = random.Random('contacts-{}'.format(self.seed))
+        contact_id = 0
+        for owner_id in range(1, self.persons + 1):
+            for _ in range(self._count(rng, self.contacts_per_person)):
+                contact_id += 1
+                phones = []
+                for _ in range(1 if rng.random() < 0.8 else 2):
+                    if rng.random() < self.known_contact_share:
+                        number = self.format_phone(rng, self.national_number(rng.randint(1, self.persons)))
+                    elif rng.random() < 0.1:
+                        number = FOREIGN_PHONE_FORMAT.format(*self.national_number(rng.randint(1, 10 * self.persons)))
+                    else:
+                        # Numbers past the persons' numbers belong to nobody generated
+                        number = self.format_phone(rng, self.national_number(self.persons + rng.randint(1, 10 * self.persons)))
+                    phones.append({'number': number, 'type': rng.choice(PHONE_TYPES)})
+                yield {'id': contact_id, 'owner_id': owner_id, 'contact_nickname': rng.choice(NICKNAMES), 'phone': phones}
+
+    def write(self, persons_file, contacts_file):
+        """
+        Writes the persons and contacts JSON files, one record at a time.
+
+        Returns:
+            dict: The number of persons, experiences and contacts written.
+        """
+        stats = {'persons': 0, 'experiences': 0, 'contacts': 0}
+        with open(persons_file, 'w') as f:
+            for person in _write_json_array(f, self.iter_persons()):
+                stats['persons'] += 1
+                stats['experiences'] += len(person['experience'])
+        with open(contacts_file, 'w') as f:
+            for _ in _write_json_array(f, self.iter_contacts()):
+                stats['contacts'] += 1
+        return stats
+
+    @staticmethod
+    def _count(rng, mean):
+        # Geometric-like counts: mostly around the mean, with a long tail
+        return int(rng.expovariate(1.0 / mean) + 0.5) if mean > 0 else 0
+
+
+def _write_json_array(f, records):
+    f.write('[\n')
+    for index, record in enumerate(records):
+        if index:
+            f.write(',\n')
+        f.write(json.dumps(record))
+        yield record
+    f.write('\n]\n')
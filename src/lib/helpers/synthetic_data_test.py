@@ -0,0 +1,57 @@
+import datetime
+from collections import Counter
+from src.lib.helpers.format import canonical_phone_key
+from src.lib.helpers.json_stream import iter_json_array
+from src.lib.helpers.synthetic_data import SyntheticDataGenerator
+
+TODAY = datetime.date(2024, 1, 1)
+
+
+def write(tmp_path, generator):
+    persons_file, contacts_file = str(tmp_path / 'persons.json'), str(tmp_path / 'contacts.json')
+    stats = generator.write(persons_file, contacts_file)
+    return stats, list(iter_json_array(persons_file)), list(iter_json_array(contacts_file))
+
+
+def test_generated_files_are_deterministic_and_well_formed(tmp_path):
+    stats, persons, contacts = write(tmp_path, SyntheticDataGenerator(500, seed=3, today=TODAY))
+
+    assert stats == {'persons': 500, 'experiences': sum(len(p['experience']) for p in persons), 'contacts': len(contacts)}
+    assert [p['id'] for p in persons] == list(range(1, 501))
+    assert [c['id'] for c in contacts] == list(range(1, len(contacts) + 1))
+    assert {c['owner_id'] for c in contacts} <= set(range(1, 501))
+    assert list(SyntheticDataGenerator(500, seed=3, today=TODAY).iter_persons()) == persons
+    assert list(SyntheticDataGenerator(500, seed=4, today=TODAY).iter_persons()) != persons
+
+    for person in persons:
+        for experience in person['experience']:
+            start = datetime.date.fromisoformat(experience['start'])
+            assert start <= TODAY
+            assert experience['end'] is None or start <= datetime.date.fromisoformat(experience['end']) <= TODAY
+
+
+def test_every_person_has_a_distinct_phone_key(tmp_path):
+    generator = SyntheticDataGenerator(2000, today=TODAY)
+    keys = [canonical_phone_key(p['phone']) for p in generator.iter_persons()]
+    assert None not in keys
+    assert len(set(keys)) == len(keys)
+
+    # Known contact phones resolve to persons whatever their format
+    known = set(keys)
+    matched = sum(canonical_phone_key(phone['number']) in known for c in generator.iter_contacts() for phone in c['phone'])
+    assert matched > 0
+
+
+def test_company_skew_and_phone_formats():
+    skewed = Counter(e['company'] for p in SyntheticDataGenerator(2000, companies=40, company_skew=1.5, today=TODAY).iter_persons() for e in p['experience'])
+    uniform = Counter(e['company'] for p in SyntheticDataGenerator(2000, companies=40, company_skew=0, today=TODAY).iter_persons() for e in p['experience'])
+    assert skewed.most_common(1)[0][1] > 3 * uniform.most_common(1)[0][1]
+
+    plain = {p['phone'][0] for p in SyntheticDataGenerator(200, phone_format_variety=0, today=TODAY).iter_persons()}
+    assert plain == {'('}
+
+
+def test_contact_book_size():
+    generator = SyntheticDataGenerator(2000, contacts_per_person=6, today=TODAY)
+    assert 5 < sum(1 for _ in generator.iter_contacts()) / 2000 < 7
+    assert sum(1 for _ in SyntheticDataGenerator(100, contacts_per_person=0, today=TODAY).iter_contacts()) == 0
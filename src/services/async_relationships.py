@@ -0,0 +1,198 @@
+"""Module providing an asyncio API for person relationship lookups over a pool of read-only connections"""
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src.lib.database.conn import ensure_store
+from src.lib.database.store import bound_store_file
+from src.lib.database.pool import ReadOnlyConnectionPool
+from src.services.person_relationships import lookup_relationships
+
+
+class _Lookup:
+    """
+    Tracks the connection a lookup runs on, so a timed out lookup can interrupt its query.
+
+    The connection is attached and detached under a lock, and detached before it goes back to the pool, so an interrupt never reaches the query of another lookup.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def attach(self, connection):
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.connection = connection
+            return True
+
+    def detach(self):
+        with self._lock:
+            self.connection = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self.connection is not None:
+                self.connection.interrupt()
+
+
+class AsyncRelationshipService:
+    """
+    Answers relationship lookups from coroutines, running the queries on a bounded thread pool over a `ReadOnlyConnectionPool`.
+
+    Each lookup takes a connection of the pool for its statements, so there are as many concurrent queries as `workers`. The `sqlite3` module releases the GIL while a statement runs, and the default lookups evaluate the overlaps in SQL (see `FindRelationshipsByPersonId`), but the rows and the document are built in Python holding the GIL, so more workers help only as far as the lookups wait on SQLite. That gain is not measured yet: on a single core, `benchmarks/concurrency_benchmark.py` gives 252 lookups/s with 1 worker and 213 with 2 or 4, the extra workers only adding contention. Size `workers` from that benchmark on the target host.
+
+    Backpressure: at most `max_pending` lookups are submitted to the thread pool at a time, a timed out lookup holding its slot until its thread is done with it. Further `get_relationships()` calls wait for a slot, and `iter_relationships()` stops consuming its IDs, so a burst of requests never queues an unbounded amount of work.
+
+    Timeouts: a lookup that does not finish within its timeout raises `asyncio.TimeoutError`, and its query is interrupted so the connection is freed for the next lookup.
+
+    Args:
+        file (str, optional): The path of a ready store. Defaults to the store of the current JSON files, migrated first if needed.
+        workers (int, optional): The number of threads and connections. Defaults to the number of cores.
+        max_pending (int, optional): The maximum number of lookups submitted at a time. Defaults to four per worker.
+        timeout (float, optional): The default timeout of a lookup in seconds. Defaults to no timeout.
+    """
+
+    def __init__(self, file=None, workers=None, max_pending=None, timeout=None):
+        if file is None:
+            ensure_store()
+            file = bound_store_file()
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 4 * self.workers
+        self.timeout = timeout
+        self.requests = 0
+        self.timeouts = 0
+        self.lookup_seconds = 0.0
+        self.pool = ReadOnlyConnectionPool(file, size=self.workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='relationships')
+        self._slots = None
+        self._slots_loop = None
+
+    def _get_slots(self):
+        # An asyncio.Semaphore belongs to the event loop it is first used in
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_pending)
+            self._slots_loop = loop
+        return self._slots
+
+    def _lookup(self, person_id, lookup):
+        with self.pool.connection() as connection:
+            if not lookup.attach(connection):
+                return None
+            try:
+                return lookup_relationships(connection, person_id)
+            finally:
+                lookup.detach()
+
+    async def get_relationships(self, person_id, timeout=None):
+        """
+        Looks up the relationships of a person.
+
+        Args:
+            person_id (int): The ID of the person.
+            timeout (float, optional): The timeout of this lookup in seconds, including the wait for a slot. Defaults to the timeout of the service.
+
+        Returns:
+            dict: The same document as `PersonRepository.get_person_relationships`, or None if the person does not exist.
+
+        Raises:
+            asyncio.TimeoutError: If the lookup did not finish in time.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        started = time.perf_counter()
+        lookup = _Lookup()
+        try:
+            return await asyncio.wait_for(self._submit(person_id, lookup), timeout)
+        except asyncio.TimeoutError:
+            lookup.cancel()
+            self.timeouts += 1
+            raise
+        finally:
+            self.requests += 1
+            self.lookup_seconds += time.perf_counter() - started
+
+    async def _submit(self, person_id, lookup):
+        slots = self._get_slots()
+        await slots.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._executor.submit(self._lookup, person_id, lookup)
+        except BaseException:
+            slots.release()
+            raise
+
+        def release(_):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(slots.release)
+
+        # The slot is given back once the thread is done with the lookup, not when a timeout cancels the coroutine waiting for it
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    async def iter_relationships(self, person_ids, timeout=None, return_exceptions=False):
+        """
+        Looks up the relationships of many persons concurrently, yielding the results in the order of the IDs.
+
+        The IDs are consumed lazily, at most `max_pending` lookups ahead of the result being yielded, so the IDs can come from an unbounded iterable.
+
+        Args:
+            person_ids (iterable[int]): The IDs of the persons.
+            timeout (float, optional): The timeout of each lookup in seconds. Defaults to the timeout of the service.
+            return_exceptions (bool, optional): Yields the exception of a failed lookup, e.g. an `asyncio.TimeoutError`, in place of its result instead of raising it. Defaults to False.
+
+        Returns:
+            An async generator of `(person_id, person_relation_ships)` tuples, `person_relation_ships` being None for IDs that do not exist.
+        """
+        pending = deque()
+        try:
+            for person_id in person_ids:
+                pending.append((person_id, asyncio.ensure_future(self.get_relationships(person_id, timeout=timeout))))
+                if len(pending) >= self.max_pending:
+                    yield await self._result(*pending.popleft(), return_exceptions)
+            while pending:
+                yield await self._result(*pending.popleft(), return_exceptions)
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    @staticmethod
+    async def _result(person_id, task, return_exceptions):
+        try:
+            return person_id, await task
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return person_id, e
+
+    def metrics(self):
+        """
+        Returns the request and timeout counters of the service.
+        """
+        return {
+            'workers'               :       self.workers,
+            'max_pending'           :       self.max_pending,
+            'requests'              :       self.requests,
+            'timeouts'              :       self.timeouts,
+            'avg_lookup_ms'         :       1000 * self.lookup_seconds / self.requests if self.requests else 0.0,
+        }
+
+    def close(self):
+        """
+        Waits for the running lookups and closes the threads and the connections.
+        """
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,310 @@
+"""Module providing the construction of the person connection graph"""
+import os
+from array import array
+from itertools import groupby
+
+from src.services.experience_overlap import ExperienceOverlapEngine, Interval, MIN_OVERLAP_DAYS, to_day_ordinal
+
+# Reads the experiences one company at a time, walking the company/date interval index
+EXPERIENCES_BY_COMPANY_QUERY = (
+    'SELECT company, person_id, start_date, end_date '
+    'FROM experience '
+    'ORDER BY company'
+)
+
+# Pairs every contact owner with the persons whose phone key is in their contacts
+CONTACT_CONNECTIONS_QUERY = (
+    'SELECT DISTINCT contact.owner_id, person.id '
+    'FROM contact '
+    'JOIN phone ON phone.contact_id = contact.id '
+    'JOIN person ON person.phone_key = phone.number_key '
+    'WHERE person.id <> contact.owner_id'
+)
+
+# The phone keys of the persons and of the contact phones, for the sharded contact rule
+PERSON_PHONE_KEYS_QUERY = 'SELECT phone_key, id FROM person WHERE phone_key IS NOT NULL'
+CONTACT_PHONE_KEYS_QUERY = (
+    'SELECT DISTINCT phone.number_key, contact.owner_id '
+    'FROM phone '
+    'JOIN contact ON contact.id = phone.contact_id '
+    'WHERE phone.number_key IS NOT NULL'
+)
+
+# The number of experiences sent to a worker per task by the parallel build
+EXPERIENCES_PER_TASK = 50000
+
+# The companies where each of a set of persons worked, walking the experience person index
+PERSON_COMPANIES_QUERY = 'SELECT DISTINCT company, person_id FROM experience WHERE person_id IN ({})'
+
+# The experiences of one company, walking the company/date interval index
+COMPANY_EXPERIENCES_QUERY = 'SELECT person_id, start_date, end_date FROM experience WHERE company = ?'
+
+# The contact rule in both directions for a set of persons: the persons in their contacts, and the owners of the contacts holding their phone key
+PERSON_CONTACT_CONNECTIONS_QUERY = (
+    'SELECT contact.owner_id, person.id '
+    'FROM contact '
+    'JOIN phone ON phone.contact_id = contact.id '
+    'JOIN person ON person.phone_key = phone.number_key '
+    'WHERE contact.owner_id IN ({0}) AND person.id <> contact.owner_id '
+    'UNION '
+    'SELECT contact.owner_id, person.id '
+    'FROM person '
+    'JOIN phone ON phone.number_key = person.phone_key '
+    'JOIN contact ON contact.id = phone.contact_id '
+    'WHERE person.id IN ({0}) AND person.id <> contact.owner_id'
+)
+
+# The number of person IDs bound per statement by `person_connections()`
+PERSON_IDS_PER_QUERY = 400
+
+
+def experience_connections(database, min_overlap_days=MIN_OVERLAP_DAYS, today=None):
+    """
+    Computes the pairs of persons connected by the shared company rule.
+
+    Only the experiences of one company are held in memory at a time.
+
+    Args:
+        database (peewee.Database): The database holding the `experience` table.
+        min_overlap_days (int, optional): The minimum overlap in days. Defaults to 90.
+        today (datetime.date, optional): The date used for null end dates. Defaults to today.
+
+    Returns:
+        dict: Maps each `(person_a, person_b)` tuple, with `person_a < person_b`, to the largest overlap in days.
+    """
+    present = to_day_ordinal(today)
+    connections = {}
+    cursor = database.execute_sql(EXPERIENCES_BY_COMPANY_QUERY)
+    for company, rows in groupby(cursor, key=lambda row: row[0]):
+        engine = ExperienceOverlapEngine(
+            (Interval(person_id, company, to_day_ordinal(start_date), to_day_ordinal(end_date, present)) for _, person_id, start_date, end_date in rows),
+            min_overlap_days=min_overlap_days
+        )
+        for (person_a, person_b), overlap in engine.connections().items():
+            if overlap > connections.get((person_a, person_b), -1):
+                connections[(person_a, person_b)] = overlap
+    return connections
+
+
+def contact_connections(database):
+    """
+    Computes the pairs of persons connected by the contact rule, which is symmetric: two persons are connected if at least one has the other's phone number in their contacts.
+
+    Args:
+        database (peewee.Database): The database holding the `contact`, `phone` and `person` tables.
+
+    Returns:
+        set: The `(person_a, person_b)` tuples, with `person_a < person_b`.
+    """
+    connections = set()
+    for owner_id, person_id in database.execute_sql(CONTACT_CONNECTIONS_QUERY):
+        connections.add((owner_id, person_id) if owner_id < person_id else (person_id, owner_id))
+    return connections
+
+
+def build_connections(database, min_overlap_days=MIN_OVERLAP_DAYS, today=None, workers=1):
+    """
+    Combines both rules into the undirected connection graph.
+
+    Args:
+        database (peewee.Database): The database holding the records.
+        min_overlap_days (int, optional): The minimum overlap in days. Defaults to 90.
+        today (datetime.date, optional): The date used for null end dates. Defaults to today.
+        workers (int, optional): The number of worker processes, see `parallel_connections()`. 0 uses every core. Defaults to 1, which computes the graph in this process.
+
+    Returns:
+        dict: Maps each `(person_a, person_b)` tuple, with `person_a < person_b`, to a `(via_experience, via_contact, overlap_days)` tuple.
+    """
+    workers = (os.cpu_count() or 1) if workers == 0 else workers
+    if workers > 1:
+        by_experience, by_contact = parallel_connections(database, workers, min_overlap_days=min_overlap_days, today=today)
+    else:
+        by_experience = experience_connections(database, min_overlap_days=min_overlap_days, today=today)
+        by_contact = contact_connections(database)
+    return {
+        pair: (pair in by_experience, pair in by_contact, by_experience.get(pair))
+        for pair in by_experience.keys() | by_contact
+    }
+
+
+def parallel_connections(database, workers, min_overlap_days=MIN_OVERLAP_DAYS, today=None):
+    """
+    Computes both rules with a pool of worker processes.
+
+    The experiences are read once, grouped by company, and sent to the workers in tasks of whole companies packed into typed arrays. The persons and contact owners are sharded by phone key bucket, so each worker joins one bucket of the contact rule. Each task returns its partial edge set as typed arrays, and the partial sets are merged here, keeping the largest overlap of each pair. Merging is order independent, so the result does not depend on the number of workers or on the order the tasks finish in.
+
+    Args:
+        database (peewee.Database): The database holding the records.
+        workers (int): The number of worker processes.
+        min_overlap_days (int, optional): The minimum overlap in days. Defaults to 90.
+        today (datetime.date, optional): The date used for null end dates. Defaults to today.
+
+    Returns:
+        tuple[dict, set]: The connections by experience, as returned by `experience_connections()`, and by contact, as returned by `contact_connections()`.
+    """
+    # The process pool is only imported by the builds that use it
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    present = to_day_ordinal(today)
+    by_experience = {}
+    by_contact = set()
+
+    def merge_experience(result):
+        person_a, person_b, overlap = (array('q', part) for part in result)
+        for pair in zip(person_a, person_b, overlap):
+            if pair[2] > by_experience.get(pair[:2], -1):
+                by_experience[pair[:2]] = pair[2]
+
+    def merge_contact(result):
+        person_a, person_b = (array('q', part) for part in result)
+        by_contact.update(zip(person_a, person_b))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+
+        def submit(function, task, merge):
+            # Keeps a bounded number of tasks in flight, so the packed inputs are not all held at once
+            while len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.pop(future)(future.result())
+            pending[executor.submit(function, task, min_overlap_days)] = merge
+
+        task, task_size = [], 0
+        cursor = database.execute_sql(EXPERIENCES_BY_COMPANY_QUERY)
+        for company, rows in groupby(cursor, key=lambda row: row[0]):
+            persons, starts, ends = array('q'), array('q'), array('q')
+            for _, person_id, start_date, end_date in rows:
+                persons.append(person_id)
+                starts.append(to_day_ordinal(start_date))
+                ends.append(to_day_ordinal(end_date, present))
+            task.append((persons.tobytes(), starts.tobytes(), ends.tobytes()))
+            task_size += len(persons)
+            if task_size >= EXPERIENCES_PER_TASK:
+                submit(_experience_task, task, merge_experience)
+                task, task_size = [], 0
+        if task:
+            submit(_experience_task, task, merge_experience)
+
+        buckets = 4 * workers
+        persons_by_bucket = [(array('q'), array('q')) for _ in range(buckets)]
+        owners_by_bucket = [(array('q'), array('q')) for _ in range(buckets)]
+        for sharded, query in ((persons_by_bucket, PERSON_PHONE_KEYS_QUERY), (owners_by_bucket, CONTACT_PHONE_KEYS_QUERY)):
+            for key, person_id in database.execute_sql(query):
+                keys, person_ids = sharded[key % buckets]
+                keys.append(key)
+                person_ids.append(person_id)
+        for bucket in range(buckets):
+            task = [part.tobytes() for part in persons_by_bucket[bucket] + owners_by_bucket[bucket]]
+            persons_by_bucket[bucket] = owners_by_bucket[bucket] = None
+            submit(_contact_task, task, merge_contact)
+
+        for future in list(pending):
+            pending.pop(future)(future.result())
+    return by_experience, by_contact
+
+
+def _experience_task(companies, min_overlap_days):
+    # Runs in a worker: the shared company rule over whole companies, packed as typed arrays
+    connections = {}
+    for persons, starts, ends in companies:
+        engine = ExperienceOverlapEngine(
+            (Interval(person_id, None, start, end) for person_id, start, end in zip(array('q', persons), array('q', starts), array('q', ends))),
+            min_overlap_days=min_overlap_days
+        )
+        for pair, overlap in engine.connections().items():
+            if overlap > connections.get(pair, -1):
+                connections[pair] = overlap
+    person_a, person_b, overlap = array('q'), array('q'), array('q')
+    for (first, second), days in connections.items():
+        person_a.append(first)
+        person_b.append(second)
+        overlap.append(days)
+    return person_a.tobytes(), person_b.tobytes(), overlap.tobytes()
+
+
+def _contact_task(bucket, min_overlap_days):
+    # Runs in a worker: the contact rule for one phone key bucket
+    person_keys, person_ids, owner_keys, owner_ids = (array('q', part) for part in bucket)
+    persons_by_key = {}
+    for key, person_id in zip(person_keys, person_ids):
+        persons_by_key.setdefault(key, []).append(person_id)
+    connections = set()
+    for key, owner_id in zip(owner_keys, owner_ids):
+        for person_id in persons_by_key.get(key, ()):
+            if person_id != owner_id:
+                connections.add((owner_id, person_id) if owner_id < person_id else (person_id, owner_id))
+    person_a, person_b = array('q'), array('q')
+    for first, second in connections:
+        person_a.append(first)
+        person_b.append(second)
+    return person_a.tobytes(), person_b.tobytes()
+
+
+def person_connections(database, person_ids, min_overlap_days=MIN_OVERLAP_DAYS, today=None):
+    """
+    Computes the connections of a set of persons only, combining both rules like `build_connections()`.
+
+    Only the experiences of the companies where these persons worked and the contacts they own or appear in are read, so the cost depends on the size of the set, not on the size of the dataset.
+
+    Args:
+        database (peewee.Database): The database holding the `person`, `experience`, `contact` and `phone` tables.
+        person_ids (iterable[int]): The IDs of the persons.
+        min_overlap_days (int, optional): The minimum overlap in days. Defaults to 90.
+        today (datetime.date, optional): The date used for null end dates. Defaults to today.
+
+    Returns:
+        dict: Maps each `(person_a, person_b)` tuple with `person_a < person_b` and at least one of them in `person_ids` to a `(via_experience, via_contact, overlap_days)` tuple.
+    """
+    person_ids = sorted(set(person_ids))
+    chunks = [person_ids[i:i + PERSON_IDS_PER_QUERY] for i in range(0, len(person_ids), PERSON_IDS_PER_QUERY)]
+    present = to_day_ordinal(today)
+
+    # Each company is only searched for the persons who worked there
+    wanted_by_company = {}
+    for chunk in chunks:
+        query = PERSON_COMPANIES_QUERY.format(', '.join('?' * len(chunk)))
+        for company, person_id in database.execute_sql(query, chunk):
+            wanted_by_company.setdefault(company, []).append(person_id)
+
+    by_experience = {}
+    for company in sorted(wanted_by_company):
+        engine = ExperienceOverlapEngine(
+            (Interval(person_id, company, to_day_ordinal(start_date), to_day_ordinal(end_date, present)) for person_id, start_date, end_date in database.execute_sql(COMPANY_EXPERIENCES_QUERY, (company,))),
+            min_overlap_days=min_overlap_days
+        )
+        for person_id in wanted_by_company[company]:
+            for mine, other, overlap in engine.pairs_for(person_id):
+                pair = (person_id, other.person_id) if person_id < other.person_id else (other.person_id, person_id)
+                if overlap > by_experience.get(pair, -1):
+                    by_experience[pair] = overlap
+
+    by_contact = set()
+    for chunk in chunks:
+        query = PERSON_CONTACT_CONNECTIONS_QUERY.format(', '.join('?' * len(chunk)))
+        for owner_id, person_id in database.execute_sql(query, chunk + chunk):
+            by_contact.add((owner_id, person_id) if owner_id < person_id else (person_id, owner_id))
+
+    return {
+        pair: (pair in by_experience, pair in by_contact, by_experience.get(pair))
+        for pair in by_experience.keys() | by_contact
+    }
+
+
+def connection_rows(connections):
+    """
+    Yields the `person_connection` rows of an undirected connection graph, both directions of each connection, ordered by `(person_a, person_b)`.
+    """
+    edges = []
+    for (person_a, person_b), flags in connections.items():
+        edges.append((person_a, person_b, flags))
+        edges.append((person_b, person_a, flags))
+    edges.sort(key=lambda edge: (edge[0], edge[1]))
+    for person_a, person_b, (via_experience, via_contact, overlap_days) in edges:
+        yield {
+            'person_a': person_a,
+            'person_b': person_b,
+            'via_experience': via_experience,
+            'via_contact': via_contact,
+            'overlap_days': overlap_days,
+        }
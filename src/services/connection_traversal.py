@@ -0,0 +1,303 @@
+"""Module providing multi-hop traversals of the person connection graph"""
+import sys
+import json
+from array import array
+from bisect import bisect_left
+
+from src.lib.database.conn import db, ensure_store
+from src.lib.database.migration.models.person_model import Person
+
+# Bit flags of the rules that produced a connection, stored one byte per edge
+RULE_SHARED_COMPANY = 1
+RULE_CONTACT = 2
+RULE_NAMES = ((RULE_SHARED_COMPANY, 'shared_company'), (RULE_CONTACT, 'contact'))
+
+# Reads the stored connections in primary key order, which is already the CSR order
+CONNECTIONS_QUERY = 'SELECT person_a, person_b, via_experience, via_contact FROM person_connection ORDER BY person_a, person_b'
+
+PERSON_IDS_QUERY = 'SELECT id FROM person ORDER BY id'
+
+
+def rule_names(rules):
+    """
+    Returns the names of the rules set in a rule bit mask, e.g. `['shared_company', 'contact']`.
+    """
+    return [name for flag, name in RULE_NAMES if rules & flag]
+
+
+class ConnectionGraph:
+    """
+    A compact, read-only adjacency of the person connection graph in compressed sparse row (CSR) form.
+
+    The persons are numbered by their position in the sorted `ids` array. The neighbours of the person at position `i` are `targets[offsets[i]:offsets[i + 1]]`, and `rules` holds the rule bit mask of each of these edges. The four typed arrays take 8 bytes per person and 9 bytes per edge, so a graph with tens of millions of edges stays in a few hundred megabytes and is walked without creating Python objects per edge.
+
+    When the person IDs are contiguous, a position is computed by subtraction; otherwise it is found by binary search over `ids`.
+
+    Args:
+        ids (array): The sorted person IDs.
+        offsets (array): The `len(ids) + 1` edge offsets.
+        targets (array): The positions of the neighbours.
+        rules (array): The rule bit mask of each edge.
+    """
+
+    def __init__(self, ids, offsets, targets, rules):
+        self.ids = ids
+        self.offsets = offsets
+        self.targets = targets
+        self.rules = rules
+        self._first_id = ids[0] if ids else 0
+        self._contiguous = not ids or ids[-1] - ids[0] + 1 == len(ids)
+
+    @classmethod
+    def from_database(cls, database):
+        """
+        Builds the graph from the `person` and `person_connection` tables with one scan of each.
+
+        Args:
+            database (peewee.Database): The database holding the tables.
+        """
+        return cls.from_rows(
+            (person_id for person_id, in database.execute_sql(PERSON_IDS_QUERY)),
+            database.execute_sql(CONNECTIONS_QUERY)
+        )
+
+    @classmethod
+    def from_rows(cls, person_ids, connections):
+        """
+        Builds the graph from person IDs and connection rows.
+
+        Args:
+            person_ids (iterable[int]): The sorted person IDs.
+            connections (iterable[tuple]): The `(person_a, person_b, via_experience, via_contact)` rows, both directions of each connection, ordered by `(person_a, person_b)`.
+        """
+        ids = array('q', person_ids)
+        graph = cls(ids, array('q', bytes(8 * (len(ids) + 1))), array('q'), array('B'))
+        offsets, targets, rules, index_of = graph.offsets, graph.targets, graph.rules, graph.index_of
+        for person_a, person_b, via_experience, via_contact in connections:
+            offsets[index_of(person_a) + 1] += 1
+            targets.append(index_of(person_b))
+            rules.append((RULE_SHARED_COMPANY if via_experience else 0) | (RULE_CONTACT if via_contact else 0))
+        for i in range(1, len(offsets)):
+            offsets[i] += offsets[i - 1]
+        return graph
+
+    def __len__(self):
+        return len(self.ids)
+
+    def edge_count(self):
+        """
+        Returns the number of stored edges, both directions of each connection included.
+        """
+        return len(self.targets)
+
+    def index_of(self, person_id):
+        """
+        Returns the position of a person in the graph, or None if the person does not exist.
+        """
+        if self._contiguous:
+            index = person_id - self._first_id
+            return index if 0 <= index < len(self.ids) else None
+        index = bisect_left(self.ids, person_id)
+        return index if index < len(self.ids) and self.ids[index] == person_id else None
+
+    def shortest_path(self, source_id, target_id, max_hops=None):
+        """
+        Finds a shortest connection path between two persons with a bidirectional breadth-first search.
+
+        The search grows the smaller of the two frontiers one level at a time, so it visits about the square root of the persons a one-sided search would visit. Among equally short paths, the one through the lowest meeting position is returned, which makes the result deterministic.
+
+        Args:
+            source_id (int): The ID of the first person.
+            target_id (int): The ID of the second person.
+            max_hops (int, optional): Gives up on paths longer than this. Defaults to no limit.
+
+        Returns:
+            list[dict]: The hops of the path, each with `from`, `to` and `rules` keys, empty if both IDs are the same person, or None if the persons are not connected or do not exist.
+        """
+        source, target = self.index_of(source_id), self.index_of(target_id)
+        if source is None or target is None:
+            return None
+        if source == target:
+            return []
+
+        offsets, targets = self.offsets, self.targets
+        # Maps each visited position to (previous position, edge offset, depth) on its side
+        forward = {source: (None, None, 0)}
+        backward = {target: (None, None, 0)}
+        forward_frontier, backward_frontier = [source], [target]
+        hops = 0
+        while forward_frontier and backward_frontier:
+            if max_hops is not None and hops >= max_hops:
+                return None
+            expand_forward = len(forward_frontier) <= len(backward_frontier)
+            visited, other = (forward, backward) if expand_forward else (backward, forward)
+            frontier = forward_frontier if expand_forward else backward_frontier
+
+            next_frontier = []
+            best = None
+            for node in frontier:
+                depth = visited[node][2] + 1
+                for edge in range(offsets[node], offsets[node + 1]):
+                    neighbour = targets[edge]
+                    if neighbour in visited:
+                        continue
+                    visited[neighbour] = (node, edge, depth)
+                    next_frontier.append(neighbour)
+                    if neighbour in other:
+                        candidate = (depth + other[neighbour][2], neighbour)
+                        if best is None or candidate < best:
+                            best = candidate
+            hops += 1
+            if best is not None:
+                if max_hops is not None and best[0] > max_hops:
+                    return None
+                return self._join_path(forward, backward, best[1])
+            if expand_forward:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+        return None
+
+    def within(self, person_id, hops):
+        """
+        Finds every person within `hops` connections of a person with a breadth-first search.
+
+        Args:
+            person_id (int): The ID of the person.
+            hops (int): The maximum number of hops.
+
+        Returns:
+            list[dict]: One entry per reached person, the person itself excluded, ordered by distance then ID, with `id`, `distance`, `via` (the previous person on a shortest path) and `rules` (the rules of the hop from `via`) keys, or None if the person does not exist.
+        """
+        start = self.index_of(person_id)
+        if start is None:
+            return None
+
+        offsets, targets, rules, ids = self.offsets, self.targets, self.rules, self.ids
+        visited = {start}
+        reached = []
+        frontier = [start]
+        for distance in range(1, hops + 1):
+            next_frontier = []
+            for node in frontier:
+                for edge in range(offsets[node], offsets[node + 1]):
+                    neighbour = targets[edge]
+                    if neighbour in visited:
+                        continue
+                    visited.add(neighbour)
+                    next_frontier.append(neighbour)
+                    reached.append({'id': ids[neighbour], 'distance': distance, 'via': ids[node], 'rules': rule_names(rules[edge])})
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        reached.sort(key=lambda entry: (entry['distance'], entry['id']))
+        return reached
+
+    def _join_path(self, forward, backward, meeting):
+        ids, rules = self.ids, self.rules
+        path = []
+        node = meeting
+        while forward[node][0] is not None:
+            previous, edge, _ = forward[node]
+            path.append({'from': ids[previous], 'to': ids[node], 'rules': rule_names(rules[edge])})
+            node = previous
+        path.reverse()
+        node = meeting
+        while backward[node][0] is not None:
+            following, edge, _ = backward[node]
+            # Connections are symmetric, so the rules of the reverse edge are the rules of the hop
+            path.append({'from': ids[node], 'to': ids[following], 'rules': rule_names(rules[edge])})
+            node = following
+        return path
+
+
+def load_connection_graph():
+    """
+    Runs the migration if needed and builds the `ConnectionGraph` of the store.
+    """
+    ensure_store(stored_connections=True)
+    return ConnectionGraph.from_database(db)
+
+
+def open_graph(snapshot=None):
+    """
+    Returns the graph to walk and a function returning the names of a list of person IDs, read from a graph snapshot file when one is given (see `src.services.graph_snapshot`), from the store otherwise.
+    """
+    if snapshot is None:
+        return load_connection_graph(), person_names
+    # Mapping a snapshot does not need the store
+    from src.services.graph_snapshot import GraphSnapshot
+    mapped = GraphSnapshot(snapshot)
+    return mapped.graph, mapped.person_names
+
+
+def person_names(person_ids):
+    """
+    Returns a dict mapping each of the given person IDs to their `First Last` name.
+    """
+    person_ids = list(set(person_ids))
+    names = {}
+    for i in range(0, len(person_ids), 500):
+        query = Person.select(Person.id, Person.first_name, Person.last_name).where(Person.id.in_(person_ids[i:i + 500]))
+        for person_id, first_name, last_name in query.tuples():
+            names[person_id] = '{} {}'.format(first_name, last_name)
+    return names
+
+
+def execute_path(source_id, target_id, max_hops=None, output_format='text', snapshot=None):
+    """
+    Prints a shortest connection path between two persons.
+
+    Parameters:
+    - source_id (int): The ID of the first person.
+    - target_id (int): The ID of the second person.
+    - max_hops (int, optional): Gives up on paths longer than this.
+    - output_format (str, optional): 'text' prints one `ID | First Last` line per person with the rules of each hop, 'json' prints the hops. Defaults to 'text'.
+    - snapshot (str, optional): The path of a graph snapshot to read instead of the store.
+
+    Returns:
+    bool: True if a path was found.
+    """
+    graph, names_of = open_graph(snapshot)
+    path = graph.shortest_path(source_id, target_id, max_hops=max_hops)
+    if path is None:
+        print('No connection path between {} and {}'.format(source_id, target_id), file=sys.stderr)
+        return False
+    if output_format == 'json':
+        print(json.dumps({'from': source_id, 'to': target_id, 'degrees': len(path), 'path': path}))
+        return True
+
+    names = names_of([source_id] + [hop['to'] for hop in path])
+    print(source_id, ' | ', names[source_id])
+    for hop in path:
+        print('  -[{}]->'.format(', '.join(hop['rules'])))
+        print(hop['to'], ' | ', names[hop['to']])
+    return True
+
+
+def execute_within(person_id, hops, output_format='text', snapshot=None):
+    """
+    Prints every person within `hops` connections of a person.
+
+    Parameters:
+    - person_id (int): The ID of the person.
+    - hops (int): The maximum number of hops.
+    - output_format (str, optional): 'text' prints one `ID | First Last | distance | rules` line per person, 'json' prints the entries of `ConnectionGraph.within`. Defaults to 'text'.
+    - snapshot (str, optional): The path of a graph snapshot to read instead of the store.
+
+    Returns:
+    bool: True if the person exists.
+    """
+    graph, names_of = open_graph(snapshot)
+    reached = graph.within(person_id, hops)
+    if reached is None:
+        print('Person {} could not be found'.format(person_id), file=sys.stderr)
+        return False
+    if output_format == 'json':
+        print(json.dumps({'id': person_id, 'hops': hops, 'persons': reached}))
+        return True
+
+    names = names_of([entry['id'] for entry in reached])
+    for entry in reached:
+        print(entry['id'], ' | ', names[entry['id']], ' | ', entry['distance'], ' | ', ', '.join(entry['rules']))
+    return True
@@ -1,7 +1,13 @@
 import json
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from itertools import chain
 
+# numpy is only needed by the vectorized variant of find_connections_via_experiences
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 def load_contacts(contacts_file):
     with open(contacts_file, 'r') as f:
         contacts = json.load(f)
@@ -84,9 +90,148 @@ def find_connections_via_experiences(person_records, person_id):
     return connected_persons
 
 
-def main(person_records, person_id, contact_records):
-    connections_via_contacts = find_connections_via_contacts(person_records, person_id, contact_records)
-    connections_via_experiences = find_connections_via_experiences(person_records, person_id)
+# Experiences converted once into arrays, for find_connections_via_experiences_vectorized.
+# Like find_connections_via_experiences, only the first experience of a person at a company is
+# kept, dates become day ordinals and "present" is resolved once to today's ordinal.
+class ExperienceArrays:
+    def __init__(self, person_records, today=None):
+        if np is None:
+            raise ImportError('find_connections_via_experiences_vectorized requires numpy')
+        present = (today or date.today()).toordinal()
+        company_codes = {}
+        rows = []
+        self.person_ids = [p['id'] for p in person_records]
+        self.person_positions = {}
+        for position, person in enumerate(person_records):
+            self.person_positions.setdefault(person['id'], position)
+            seen = set()
+            for exp in person.get('experience', []):
+                if exp['company'] in seen:
+                    continue
+                seen.add(exp['company'])
+                rows.append((
+                    company_codes.setdefault(exp['company'], len(company_codes)),
+                    position,
+                    date.fromisoformat(exp['start']).toordinal(),
+                    date.fromisoformat(exp['end']).toordinal() if exp['end'] else present,
+                ))
+
+        table = np.array(rows, dtype=np.int64).reshape(-1, 4)
+        # Sorting by company makes every company a contiguous block of the arrays
+        table = table[np.argsort(table[:, 0], kind='stable')]
+        self.company = table[:, 0]
+        self.position = table[:, 1]
+        self.start = table[:, 2]
+        self.end = table[:, 3]
+        self.block_starts = np.searchsorted(self.company, np.arange(len(company_codes)), side='left')
+        self.block_ends = np.searchsorted(self.company, np.arange(len(company_codes)), side='right')
+
+        # Rows of each person position, as offsets into person_rows, to find the companies of the target person without a scan
+        self.person_rows = np.argsort(self.position, kind='stable')
+        self.person_row_offsets = np.searchsorted(self.position[self.person_rows], np.arange(len(person_records) + 1))
+
+
+def find_connections_via_experiences_vectorized(person_records, person_id, arrays=None, min_overlap_days=90):
+    # Same result as find_connections_via_experiences; build `arrays` once to answer many person IDs
+    arrays = ExperienceArrays(person_records) if arrays is None else arrays
+    position = arrays.person_positions.get(person_id)
+    if position is None:
+        return []
+
+    connected = np.zeros(len(arrays.person_ids), dtype=bool)
+    for row in arrays.person_rows[arrays.person_row_offsets[position]:arrays.person_row_offsets[position + 1]]:
+        block = slice(arrays.block_starts[arrays.company[row]], arrays.block_ends[arrays.company[row]])
+        overlap = np.minimum(arrays.end[block], arrays.end[row]) - np.maximum(arrays.start[block], arrays.start[row])
+        connected[arrays.position[block][overlap >= min_overlap_days]] = True
+
+    connected_persons = [person_id]
+    for other_position in np.flatnonzero(connected):
+        other_id = arrays.person_ids[other_position]
+        if other_id != person_id:
+            connected_persons.append(other_id)
+    return connected_persons
+
+
+# Inverted indexes of the loaded records, built once so each lookup costs about the degree of the
+# target person instead of a scan of every person and contact. Lookups through the index return the
+# same IDs, in the same order, as find_connections_via_contacts and find_connections_via_experiences.
+class DirectReadIndex:
+    def __init__(self, person_records, contact_records, today=None):
+        self.person_records = person_records
+        present = (today or date.today()).toordinal()
+
+        # id -> person, and id -> positions of its records, which give the order of the results
+        self.persons = {}
+        self.positions = {}
+        for position, person in enumerate(person_records):
+            self.persons.setdefault(person['id'], person)
+            self.positions.setdefault(person['id'], []).append(position)
+
+        # company -> (position, person id, start, end) of the first experience of each person there,
+        # the only one the experience rule compares
+        self.experiences_by_company = {}
+        for position, person in enumerate(person_records):
+            seen = set()
+            for exp in person.get('experience', []):
+                if exp['company'] in seen:
+                    continue
+                seen.add(exp['company'])
+                self.experiences_by_company.setdefault(exp['company'], []).append((
+                    position,
+                    person['id'],
+                    date.fromisoformat(exp['start']).toordinal(),
+                    date.fromisoformat(exp['end']).toordinal() if exp['end'] else present,
+                ))
+
+        # owner_id -> contact phones, and contact phone -> owners
+        self.contact_phones_by_owner = {}
+        self.owners_by_contact_phone = {}
+        for contact in contact_records:
+            for phone in contact['phone']:
+                number = normalize_phone(phone['number'])
+                self.contact_phones_by_owner.setdefault(contact['owner_id'], []).append(number)
+                self.owners_by_contact_phone.setdefault(number, set()).add(contact['owner_id'])
+
+    def ordered(self, person_ids):
+        # The IDs of the records of these persons, in the order of person_records
+        positions = sorted(position for person_id in person_ids for position in self.positions.get(person_id, ()))
+        return [self.person_records[position]['id'] for position in positions]
+
+
+def find_connections_via_contacts_indexed(index, person_id):
+    if person_id not in index.persons:
+        return []
+
+    connected = set()
+    for number in index.contact_phones_by_owner.get(person_id, ()):
+        connected.update(index.owners_by_contact_phone[number])
+    connected.discard(person_id)
+
+    connected_persons = index.ordered(connected)
+    connected_persons.append(person_id)
+    return connected_persons
+
+
+def find_connections_via_experiences_indexed(index, person_id, min_overlap_days=90):
+    person = index.persons.get(person_id)
+    if not person:
+        return []
+
+    connected = set()
+    position = index.positions[person_id][0]
+    for company in {exp['company'] for exp in person.get('experience', [])}:
+        experiences = index.experiences_by_company[company]
+        _, _, start, end = next(exp for exp in experiences if exp[0] == position)
+        for other_position, other_id, other_start, other_end in experiences:
+            if other_id != person_id and min(end, other_end) - max(start, other_start) >= min_overlap_days:
+                connected.add(other_position)
+    return [person_id] + [index.person_records[other_position]['id'] for other_position in sorted(connected)]
+
+
+def main(person_records, person_id, contact_records, index=None):
+    index = DirectReadIndex(person_records, contact_records) if index is None else index
+    connections_via_contacts = find_connections_via_contacts_indexed(index, person_id)
+    connections_via_experiences = find_connections_via_experiences_indexed(index, person_id)
 
     all_connections = sorted(set(connections_via_contacts + connections_via_experiences))
 
@@ -95,13 +240,18 @@ def main(person_records, person_id, contact_records):
 
     print("Connected persons:")
     for conn_id in all_connections:
-        person = next((p for p in person_records if p['id'] == conn_id), None)
+        person = index.persons.get(conn_id)
         if person:
             print(f"ID: {conn_id} - First/Last: {person['first']} {person['last']}")
 
 if __name__ == "__main__":
+    import os
     import sys
     person_id = int(sys.argv[1])
-    person_records = load_person_records('src/lib/database/migration/data/persons.json')
+    # Run as a script, the repository root is not on the path
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from src.services.person_store import PersonStore
+    # The persons are held in typed columns instead of one dict per record and field
+    person_records = PersonStore.from_json('src/lib/database/migration/data/persons.json')
     contact_records = load_contacts('src/lib/database/migration/data/contacts.json')
     main(person_records, person_id, contact_records)
\ No newline at end of file
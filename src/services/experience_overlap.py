@@ -0,0 +1,160 @@
+"""Module providing a sweep-line engine for the shared company rule"""
+import datetime
+import heapq
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+MIN_OVERLAP_DAYS = 90
+
+# An experience reduced to what the shared company rule needs: day ordinals for its dates and
+# an optional reference to the record it was built from.
+Interval = namedtuple('Interval', ['person_id', 'company', 'start', 'end', 'ref'], defaults=[None])
+
+
+def to_day_ordinal(date, present=None):
+    """
+    Converts a date to its proleptic Gregorian ordinal.
+
+    Args:
+        date (str | datetime.date | None): The date, as an ISO formatted string or a date. None represents the present.
+        present (int, optional): The ordinal used for the present. Defaults to today's ordinal.
+
+    Returns:
+        int: The day ordinal of the date.
+    """
+    if date is None:
+        return datetime.date.today().toordinal() if present is None else present
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date)
+    return date.toordinal()
+
+
+class ExperienceOverlapEngine:
+    """
+    Finds the pairs of experiences at the same company whose employment periods overlap for at least `min_overlap_days` days.
+
+    The overlap of two experiences is `min(end_a, end_b) - max(start_a, start_b)` in days, with a null end date standing for the present, which is resolved once when the engine is built.
+
+    Experiences are grouped by company and sorted by start date once. `pairs()` then runs a sweep over each company: the experiences still running `min_overlap_days` after the current start date are kept in a heap ordered by end date, so every experience left in the heap forms a qualifying pair with the current one and the work done is O(n log n + k) for k pairs.
+
+    Args:
+        intervals (iterable[Interval]): The experiences, see `Interval` and `from_records()`.
+        min_overlap_days (int, optional): The minimum overlap in days. Defaults to 90.
+    """
+
+    def __init__(self, intervals, min_overlap_days=MIN_OVERLAP_DAYS):
+        self.min_overlap_days = min_overlap_days
+        self._by_company = {}
+        self._by_person = {}
+        for interval in intervals:
+            self._by_company.setdefault(interval.company, []).append(interval)
+            self._by_person.setdefault(interval.person_id, []).append(interval)
+        self._starts = {}
+        self._longest = {}
+        for company, company_intervals in self._by_company.items():
+            company_intervals.sort(key=lambda interval: (interval.start, interval.person_id))
+            self._starts[company] = [interval.start for interval in company_intervals]
+            self._longest[company] = max(interval.end - interval.start for interval in company_intervals)
+
+    @classmethod
+    def from_records(cls, records, min_overlap_days=MIN_OVERLAP_DAYS, today=None):
+        """
+        Builds an engine from experience records.
+
+        Args:
+            records (iterable[dict]): Experience records with `person_id`, `company`, `start_date` and `end_date` keys. Each record is kept as the `ref` of its interval.
+            min_overlap_days (int, optional): The minimum overlap in days. Defaults to 90.
+            today (datetime.date, optional): The date used for null end dates. Defaults to today.
+        """
+        present = to_day_ordinal(today)
+        return cls(
+            (
+                Interval(
+                    record['person_id'],
+                    record['company'],
+                    to_day_ordinal(record['start_date']),
+                    to_day_ordinal(record['end_date'], present),
+                    record
+                )
+                for record in records
+            ),
+            min_overlap_days=min_overlap_days
+        )
+
+    def companies(self):
+        """
+        Returns the companies known to the engine.
+        """
+        return list(self._by_company)
+
+    def pairs(self, companies=None):
+        """
+        Yields every pair of experiences of different persons at the same company overlapping for at least `min_overlap_days` days.
+
+        Args:
+            companies (iterable[str], optional): Restricts the sweep to these companies. Defaults to every company.
+
+        Yields:
+            tuple[Interval, Interval, int]: The earlier starting experience, the other experience and their overlap in days. Each pair is yielded once.
+        """
+        threshold = self.min_overlap_days
+        for company in (self._by_company if companies is None else companies):
+            active = []
+            for interval in self._by_company.get(company, []):
+                # An experience shorter than the threshold cannot overlap enough with any other
+                if interval.end - interval.start < threshold:
+                    continue
+                # Experiences ending before `start + threshold` cannot overlap enough with this or any later start
+                while active and active[0][0] < interval.start + threshold:
+                    heapq.heappop(active)
+                for _, _, other in active:
+                    if other.person_id != interval.person_id:
+                        yield other, interval, min(other.end, interval.end) - interval.start
+                heapq.heappush(active, (interval.end, id(interval), interval))
+
+    def pairs_for(self, person_id):
+        """
+        Yields the experiences of other persons overlapping for at least `min_overlap_days` days with an experience of `person_id`, once per other person and company.
+
+        For each experience of the person, only the experiences of the same company whose start date lies in a window found by binary search over the sorted start dates are examined: an experience starting after `end - min_overlap_days` cannot overlap enough, and neither can one starting before `start + min_overlap_days` minus the longest experience of the company, as it ends too early. The scan is therefore bounded by the experiences running around the person's, not by the size of the company.
+
+        When the person has several experiences at a company, or the other person has, the pair with the largest overlap is kept.
+
+        Args:
+            person_id (int): The ID of the person.
+
+        Yields:
+            tuple[Interval, Interval, int]: The experience of the person, the other experience and their overlap in days.
+        """
+        threshold = self.min_overlap_days
+        best = {}
+        for interval in self._by_person.get(person_id, []):
+            if interval.end - interval.start < threshold:
+                continue
+            company_intervals = self._by_company[interval.company]
+            starts = self._starts[interval.company]
+            first = bisect_left(starts, interval.start + threshold - self._longest[interval.company])
+            last = bisect_right(starts, interval.end - threshold)
+            for index in range(first, last):
+                other = company_intervals[index]
+                if other.person_id == person_id:
+                    continue
+                overlap = min(interval.end, other.end) - max(interval.start, other.start)
+                key = (other.person_id, interval.company)
+                if overlap >= threshold and overlap > best.get(key, (None, None, -1))[2]:
+                    best[key] = (interval, other, overlap)
+        yield from best.values()
+
+    def connections(self):
+        """
+        Returns the pairs of connected persons over the whole dataset.
+
+        Returns:
+            dict: Maps each `(person_a, person_b)` tuple, with `person_a < person_b`, to the largest overlap in days over their shared companies.
+        """
+        connections = {}
+        for first, second, overlap in self.pairs():
+            key = (first.person_id, second.person_id) if first.person_id < second.person_id else (second.person_id, first.person_id)
+            if overlap > connections.get(key, -1):
+                connections[key] = overlap
+        return connections
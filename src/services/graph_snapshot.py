@@ -0,0 +1,287 @@
+"""Module providing a memory-mappable binary snapshot of the person connection graph"""
+import os
+import sys
+import mmap
+import zlib
+import struct
+from array import array
+from bisect import bisect_left
+
+from src.lib.database.conn import db, ensure_store
+from src.lib.database.store import current_data_version
+from src.services.connection_traversal import ConnectionGraph, RULE_SHARED_COMPANY, RULE_CONTACT, rule_names
+
+SNAPSHOT_MAGIC = b'ALLARIGR'
+
+# Bump whenever the layout of the header or of a section changes
+SNAPSHOT_VERSION = 1
+
+# Magic, format version, section count, person count, edge count and the data version of the source store
+HEADER = struct.Struct('<8sIIQQ32s')
+
+# Offset, length and CRC-32 of a section
+SECTION = struct.Struct('<QQI4x')
+
+# CRC-32 of the header and the section table
+HEADER_CHECKSUM = struct.Struct('<I4x')
+
+# The sections in file order, with the typecode of their items
+SECTIONS = (
+    ('ids', 'q'),
+    ('offsets', 'q'),
+    ('targets', 'i'),
+    ('rules', 'B'),
+    ('overlap_days', 'i'),
+    ('name_offsets', 'q'),
+    ('names', 'B'),
+)
+
+HEADER_SIZE = HEADER.size + SECTION.size * len(SECTIONS) + HEADER_CHECKSUM.size
+
+# Stored in `overlap_days` for the edges not produced by the shared company rule
+NO_OVERLAP = -1
+
+SNAPSHOT_PERSONS_QUERY = 'SELECT id, first_name, last_name FROM person ORDER BY id'
+
+SNAPSHOT_CONNECTIONS_QUERY = (
+    'SELECT person_a, person_b, via_experience, via_contact, overlap_days '
+    'FROM person_connection ORDER BY person_a, person_b'
+)
+
+
+def write_snapshot(file, persons, connections, data_version=''):
+    """
+    Writes a graph snapshot file.
+
+    The file starts with a fixed size header: the `SNAPSHOT_MAGIC`, the `SNAPSHOT_VERSION`, the person and edge counts, the data version of the store the graph was read from, and the offset, length and CRC-32 of each section, the header itself being covered by a last CRC-32. The sections follow, each aligned on 8 bytes and stored as little-endian typed arrays, in the CSR layout of `ConnectionGraph`:
+
+    - `ids` (int64): the sorted person IDs.
+    - `offsets` (int64): the `persons + 1` edge offsets, the edges of the person at position `i` being `offsets[i]` to `offsets[i + 1]`.
+    - `targets` (int32): the position of the neighbour of each edge.
+    - `rules` (uint8): the rule bit mask of each edge.
+    - `overlap_days` (int32): the overlap of each edge, `NO_OVERLAP` when it does not come from a shared company.
+    - `name_offsets` (int64) and `names` (UTF-8): the `First Last` name of the person at position `i` is `names[name_offsets[i]:name_offsets[i + 1]]`.
+
+    The file is written next to its final path and renamed once complete, so readers never map a partial snapshot and the readers of a previous snapshot keep their mapping.
+
+    Args:
+        file (str): The path of the snapshot.
+        persons (iterable[tuple]): The `(id, first_name, last_name)` of every person, by ID.
+        connections (iterable[tuple]): The `(person_a, person_b, via_experience, via_contact, overlap_days)` rows, both directions of each connection, ordered by `(person_a, person_b)`.
+        data_version (str, optional): The version of the data the graph was computed from, at most 32 ASCII characters.
+
+    Returns:
+        dict: The number of `persons` and `edges`, and the `bytes` of the file.
+    """
+    ids, name_offsets, names = array('q'), array('q', [0]), bytearray()
+    for person_id, first_name, last_name in persons:
+        ids.append(person_id)
+        names += '{} {}'.format(first_name, last_name).encode('utf-8')
+        name_offsets.append(len(names))
+
+    contiguous = not ids or ids[-1] - ids[0] + 1 == len(ids)
+
+    def index_of(person_id):
+        index = person_id - ids[0] if contiguous else bisect_left(ids, person_id)
+        if not 0 <= index < len(ids) or ids[index] != person_id:
+            msg = 'write_snapshot({}): Connection of unknown person {}'.format(file, person_id)
+            print(msg)
+            raise Exception(msg)
+        return index
+
+    offsets, targets, rules, overlap_days = array('q', bytes(8 * (len(ids) + 1))), array('i'), array('B'), array('i')
+    for person_a, person_b, via_experience, via_contact, overlap in connections:
+        offsets[index_of(person_a) + 1] += 1
+        targets.append(index_of(person_b))
+        rules.append((RULE_SHARED_COMPANY if via_experience else 0) | (RULE_CONTACT if via_contact else 0))
+        overlap_days.append(NO_OVERLAP if overlap is None else overlap)
+    for i in range(1, len(offsets)):
+        offsets[i] += offsets[i - 1]
+
+    sections = {'ids': ids, 'offsets': offsets, 'targets': targets, 'rules': rules, 'overlap_days': overlap_days, 'name_offsets': name_offsets, 'names': names}
+    blobs = [_little_endian(sections[name]) for name, _ in SECTIONS]
+
+    table = []
+    position = HEADER_SIZE
+    for blob in blobs:
+        table.append(SECTION.pack(position, len(blob), zlib.crc32(blob)))
+        position += _padded(len(blob))
+    header = HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(SECTIONS), len(ids), len(targets), data_version.encode('ascii')[:32]) + b''.join(table)
+    header += HEADER_CHECKSUM.pack(zlib.crc32(header))
+
+    partial = '{}.partial'.format(file)
+    with open(partial, 'wb') as f:
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+            f.write(bytes(_padded(len(blob)) - len(blob)))
+    os.replace(partial, file)
+    return {'persons': len(ids), 'edges': len(targets), 'bytes': position}
+
+
+def export_snapshot(file, database, data_version=''):
+    """
+    Writes the snapshot of the graph stored in the `person` and `person_connection` tables, with one scan of each.
+
+    Returns:
+        dict: The counts returned by `write_snapshot()`.
+    """
+    return write_snapshot(file, database.execute_sql(SNAPSHOT_PERSONS_QUERY), database.execute_sql(SNAPSHOT_CONNECTIONS_QUERY), data_version=data_version)
+
+
+class GraphSnapshot:
+    """
+    A read-only graph snapshot mapped in memory, as written by `write_snapshot()`.
+
+    The file is mapped with `mmap` and each section is exposed as a typed `memoryview` over the mapping, so opening a snapshot neither parses nor copies it: the pages are read from the OS page cache on first use and shared by every process mapping the same file. `graph` is a `ConnectionGraph` over these views, so `shortest_path()` and `within()` run unchanged, without SQLite.
+
+    Opening a snapshot checks the header, its checksum, which also covers the section table, and that every section lies within the file, so it only reads the first page. With `verify=True` the CRC-32 of every section is checked as well, which reads the whole file once: `python main.py snapshot PATH --verify` does it once for a file, instead of every reader on every open.
+
+    Args:
+        file (str): The path of the snapshot.
+        verify (bool, optional): Whether to check the section checksums. Defaults to False.
+
+    Raises:
+        Exception: If the file is not a snapshot of the supported version, or a checksum does not match.
+    """
+
+    def __init__(self, file, verify=False):
+        if sys.byteorder != 'little':
+            self._fail(file, 'Snapshots can only be mapped on little-endian hosts')
+        self.file = file
+        with open(file, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []
+        try:
+            self._open(verify)
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self, verify):
+        if len(self._mmap) < HEADER_SIZE:
+            self._fail(self.file, 'The file is too short to be a snapshot')
+        magic, version, section_count, persons, edges, data_version = HEADER.unpack_from(self._mmap, 0)
+        if magic != SNAPSHOT_MAGIC:
+            self._fail(self.file, 'The file is not a graph snapshot')
+        if version != SNAPSHOT_VERSION or section_count != len(SECTIONS):
+            self._fail(self.file, 'Snapshot version {} is not supported, expected {}'.format(version, SNAPSHOT_VERSION))
+        checksum, = HEADER_CHECKSUM.unpack_from(self._mmap, HEADER_SIZE - HEADER_CHECKSUM.size)
+        if zlib.crc32(self._mmap[:HEADER_SIZE - HEADER_CHECKSUM.size]) != checksum:
+            self._fail(self.file, 'The header checksum does not match')
+        self.data_version = data_version.rstrip(b'\0').decode('ascii')
+
+        whole = memoryview(self._mmap)
+        self._views.append(whole)
+        for index, (name, typecode) in enumerate(SECTIONS):
+            offset, length, crc = SECTION.unpack_from(self._mmap, HEADER.size + index * SECTION.size)
+            if offset + length > len(self._mmap):
+                self._fail(self.file, 'The {} section is truncated'.format(name))
+            view = whole[offset:offset + length]
+            self._views.append(view)
+            if verify and zlib.crc32(view) != crc:
+                self._fail(self.file, 'The {} section checksum does not match'.format(name))
+            if typecode != 'B':
+                view = view.cast(typecode)
+                self._views.append(view)
+            setattr(self, name, view)
+
+        if len(self.ids) != persons or len(self.targets) != edges:
+            self._fail(self.file, 'The section lengths do not match the header counts')
+        self.graph = ConnectionGraph(self.ids, self.offsets, self.targets, self.rules)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        Releases the section views and unmaps the file. The views handed out before must not be used afterwards.
+        """
+        self.graph = None
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if not self._mmap.closed:
+            self._mmap.close()
+
+    def person_name(self, person_id):
+        """
+        Returns the `First Last` name of a person, or None if the person does not exist.
+        """
+        index = self.graph.index_of(person_id)
+        if index is None:
+            return None
+        return bytes(self.names[self.name_offsets[index]:self.name_offsets[index + 1]]).decode('utf-8')
+
+    def person_names(self, person_ids):
+        """
+        Returns a dict mapping each of the given person IDs that exists to their `First Last` name.
+        """
+        names = {}
+        for person_id in person_ids:
+            name = self.person_name(person_id)
+            if name is not None:
+                names[person_id] = name
+        return names
+
+    def connections(self, person_id):
+        """
+        Returns the direct connections of a person, by connected person ID.
+
+        Returns:
+            list[dict]: The `id`, `rules` and `overlap_days` (None when the connection does not come from a shared company) of each connection, or None if the person does not exist.
+        """
+        index = self.graph.index_of(person_id)
+        if index is None:
+            return None
+        return [
+            {
+                'id': self.ids[self.targets[edge]],
+                'rules': rule_names(self.rules[edge]),
+                'overlap_days': None if self.overlap_days[edge] == NO_OVERLAP else self.overlap_days[edge],
+            }
+            for edge in range(self.offsets[index], self.offsets[index + 1])
+        ]
+
+    @staticmethod
+    def _fail(file, reason):
+        msg = 'GraphSnapshot({}): {}'.format(file, reason)
+        print(msg)
+        raise Exception(msg)
+
+
+def execute_snapshot(file, verify=False):
+    """
+    Writes the snapshot of the graph of the store of the current JSON files, migrating it first if needed, and prints its size.
+
+    Parameters:
+    - file (str): The path of the snapshot.
+    - verify (bool, optional): Instead of writing the snapshot, check the checksums of every section of the existing file. Defaults to False.
+    """
+    if verify:
+        with GraphSnapshot(file, verify=True) as snapshot:
+            print('Verified {} persons and {} edges in {}'.format(len(snapshot), len(snapshot.targets), file))
+        return
+    ensure_store(stored_connections=True)
+    stats = export_snapshot(file, db, data_version=current_data_version())
+    print('Wrote {persons} persons and {edges} edges ({bytes} bytes) to {file}'.format(file=file, **stats))
+
+
+def _little_endian(values):
+    if isinstance(values, bytearray):
+        return bytes(values)
+    if values.itemsize > 1 and sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _padded(length):
+    return (length + 7) & ~7
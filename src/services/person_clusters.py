@@ -0,0 +1,372 @@
+"""Module providing the connected components (clusters) of the person connection graph"""
+from array import array
+from bisect import bisect_left
+
+from src.lib.database.conn import db
+from src.lib.database.migration.models.person_cluster_model import Cluster, PersonCluster
+from src.services.connection_graph import PERSON_IDS_PER_QUERY
+
+PERSON_IDS_QUERY = 'SELECT id FROM person ORDER BY id'
+
+# Each connection once, in primary key order
+CONNECTED_PAIRS_QUERY = 'SELECT person_a, person_b FROM person_connection WHERE person_a < person_b'
+
+CLUSTER_MEMBER_IDS_QUERY = 'SELECT person_id FROM person_cluster WHERE cluster_id IN ({})'
+
+CLUSTER_SIZES_QUERY = 'SELECT id, size FROM cluster WHERE id IN ({})'
+
+PERSON_MEMBERSHIPS_QUERY = 'SELECT person_id, cluster_id FROM person_cluster WHERE person_id IN ({})'
+
+EXISTING_PERSON_IDS_QUERY = 'SELECT id FROM person WHERE id IN ({})'
+
+# The connections of a set of persons, each once, in one range read of the primary key per person
+MEMBER_CONNECTIONS_QUERY = 'SELECT person_a, person_b FROM person_connection WHERE person_a IN ({}) AND person_a < person_b'
+
+# Moves the members of a cluster to the cluster it merged into, walking the `(cluster_id, person_id)` index
+RELABEL_CLUSTER_QUERY = 'UPDATE person_cluster SET cluster_id = ? WHERE cluster_id = ?'
+
+
+class UnionFind:
+    """
+    A disjoint-set forest over the positions `0` to `size - 1`, with path compression and union by rank, so a sequence of operations runs in nearly constant amortized time per operation.
+
+    The parents are kept in a typed array and the ranks in a byte array, which take 9 bytes per element.
+
+    Args:
+        size (int): The number of elements.
+    """
+
+    def __init__(self, size):
+        self.parent = array('q', range(size))
+        self.rank = bytearray(size)
+
+    def find(self, element):
+        """
+        Returns the root of the set holding `element`, pointing every element on the way directly at the root.
+        """
+        parent = self.parent
+        root = element
+        while parent[root] != root:
+            root = parent[root]
+        while parent[element] != root:
+            parent[element], element = root, parent[element]
+        return root
+
+    def union(self, first, second):
+        """
+        Merges the sets holding `first` and `second`, attaching the root of lower rank under the other.
+
+        Returns:
+            bool: True if the elements were in different sets.
+        """
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return False
+        rank = self.rank
+        if rank[first] < rank[second]:
+            first, second = second, first
+        self.parent[second] = first
+        if rank[first] == rank[second]:
+            rank[first] += 1
+        return True
+
+
+def compute_clusters(person_ids, connections):
+    """
+    Computes the connected components of a graph with a `UnionFind`.
+
+    Args:
+        person_ids (iterable[int]): The sorted IDs of the persons.
+        connections (iterable[tuple]): The `(person_a, person_b)` connected pairs. Pairs with a person outside `person_ids` are ignored.
+
+    Returns:
+        tuple[array, array, dict]: The person IDs, the cluster ID of each of them, and the size of each cluster. The ID of a cluster is the lowest ID of its members, so it does not depend on the order of the connections.
+    """
+    ids = array('q', person_ids)
+    contiguous = not ids or ids[-1] - ids[0] + 1 == len(ids)
+
+    def position(person_id):
+        if contiguous:
+            index = person_id - ids[0]
+            return index if 0 <= index < len(ids) else None
+        index = bisect_left(ids, person_id)
+        return index if index < len(ids) and ids[index] == person_id else None
+
+    forest = UnionFind(len(ids))
+    for person_a, person_b in connections:
+        first, second = position(person_a), position(person_b)
+        if first is not None and second is not None:
+            forest.union(first, second)
+
+    cluster_ids = array('q', bytes(8 * len(ids)))
+    cluster_of_root = {}
+    sizes = {}
+    for index in range(len(ids)):
+        root = forest.find(index)
+        # Positions are visited in ID order, so the first member seen has the lowest ID
+        cluster_id = cluster_of_root.setdefault(root, ids[index])
+        cluster_ids[index] = cluster_id
+        sizes[cluster_id] = sizes.get(cluster_id, 0) + 1
+    return ids, cluster_ids, sizes
+
+
+def cluster_rows(ids, cluster_ids, sizes):
+    """
+    Yields the `(model, row)` tuples of computed clusters: every `cluster` row first, then the `person_cluster` rows in person ID order.
+    """
+    for cluster_id in sorted(sizes):
+        yield Cluster, {'id': cluster_id, 'size': sizes[cluster_id]}
+    for person_id, cluster_id in zip(ids, cluster_ids):
+        yield PersonCluster, {'person_id': person_id, 'cluster_id': cluster_id}
+
+
+def build_clusters(database):
+    """
+    Computes the clusters of every person from the `person` and `person_connection` tables.
+
+    Returns:
+        generator: The `(model, row)` tuples of `cluster_rows()`.
+    """
+    ids, cluster_ids, sizes = compute_clusters(
+        (person_id for person_id, in database.execute_sql(PERSON_IDS_QUERY)),
+        database.execute_sql(CONNECTED_PAIRS_QUERY)
+    )
+    return cluster_rows(ids, cluster_ids, sizes)
+
+
+def update_clusters(database, added, removed, person_ids=(), cluster_ids=()):
+    """
+    Updates the clusters after the connections of some persons changed.
+
+    A cluster is only recomputed when it lost a connection or a member: its members and their connections are read in bulk and split into components. Added connections can only merge clusters, so they are applied afterwards as unions of whole clusters, the merged clusters being relabelled in place with one statement per cluster, without reading their members.
+
+    Args:
+        database (peewee.Database): The database holding the tables, in a transaction, with the connections already updated.
+        added (iterable[tuple]): The `(person_a, person_b)` pairs connected by the change.
+        removed (iterable[tuple]): The `(person_a, person_b)` pairs no longer connected, the connections of the deleted persons included.
+        person_ids (iterable[int], optional): The IDs of the persons whose connections changed, so the added persons get a cluster even without connections.
+        cluster_ids (iterable[int], optional): The previous clusters of the deleted persons, whose memberships are already removed.
+
+    Returns:
+        int: The number of persons whose cluster was recomputed or relabelled.
+    """
+    added = set(added)
+    removed = set(removed)
+    persons = sorted({person_id for pair in added | removed for person_id in pair} | set(person_ids))
+    cluster_of = {}
+    existing = set()
+    for chunk in _chunks(persons):
+        binds = ', '.join('?' * len(chunk))
+        cluster_of.update(database.execute_sql(PERSON_MEMBERSHIPS_QUERY.format(binds), chunk))
+        existing.update(person_id for person_id, in database.execute_sql(EXISTING_PERSON_IDS_QUERY.format(binds), chunk))
+
+    # The clusters that lost a connection or a member may split, so their components are recomputed
+    split = sorted({cluster_of[person_id] for pair in removed for person_id in pair if person_id in cluster_of} | set(cluster_ids))
+    members = []
+    for chunk in _chunks(split):
+        members.extend(person_id for person_id, in database.execute_sql(CLUSTER_MEMBER_IDS_QUERY.format(', '.join('?' * len(chunk))), chunk))
+    # Added persons are recomputed as well, alone unless they are connected to someone in the split clusters
+    members = sorted(set(members) | (existing - cluster_of.keys()))
+    connections = []
+    for chunk in _chunks(members):
+        connections.extend(database.execute_sql(MEMBER_CONNECTIONS_QUERY.format(', '.join('?' * len(chunk))), chunk))
+    ids, piece_ids, sizes = compute_clusters(members, connections)
+    piece_of = dict(zip(ids, piece_ids))
+
+    # The other clusters only merge, through the added connections
+    kept = sorted({cluster_of[person_id] for pair in added for person_id in pair if person_id in cluster_of} - set(split))
+    for chunk in _chunks(kept):
+        sizes.update(database.execute_sql(CLUSTER_SIZES_QUERY.format(', '.join('?' * len(chunk))), chunk))
+    pieces = sorted(sizes)
+    position = {piece_id: index for index, piece_id in enumerate(pieces)}
+    forest = UnionFind(len(pieces))
+    for person_a, person_b in added:
+        first, second = piece_of.get(person_a, cluster_of.get(person_a)), piece_of.get(person_b, cluster_of.get(person_b))
+        if first in position and second in position:
+            forest.union(position[first], position[second])
+    groups = {}
+    for piece_id in pieces:
+        groups.setdefault(forest.find(position[piece_id]), []).append(piece_id)
+
+    kept = set(kept)
+    updated = len(members)
+    relabelled = []
+    clusters = []
+    for group in groups.values():
+        # The pieces are visited in ID order, so the first one holds the lowest member ID
+        cluster_id = group[0]
+        if len(group) == 1 and cluster_id in kept:
+            continue
+        clusters.append({'id': cluster_id, 'size': sum(sizes[piece_id] for piece_id in group)})
+        for piece_id in group:
+            if piece_id in kept and piece_id != cluster_id:
+                relabelled.append((cluster_id, piece_id))
+                updated += sizes[piece_id]
+    final = {piece_id: group[0] for group in groups.values() for piece_id in group}
+
+    # The memberships always reference an existing cluster row
+    for chunk in _chunks(members):
+        PersonCluster.delete().where(PersonCluster.person.in_(chunk)).execute()
+    for chunk in _chunks(clusters):
+        Cluster.insert_many(chunk).on_conflict(conflict_target=[Cluster.id], preserve=[Cluster.size]).execute()
+    if relabelled:
+        database.cursor().executemany(RELABEL_CLUSTER_QUERY, relabelled)
+    rows = [{'person_id': person_id, 'cluster_id': final[piece_of[person_id]]} for person_id in members]
+    for chunk in _chunks(rows):
+        PersonCluster.insert_many(chunk).execute()
+    stale = sorted((set(split) | {piece_id for _, piece_id in relabelled}) - {cluster['id'] for cluster in clusters})
+    for chunk in _chunks(stale):
+        Cluster.delete().where(Cluster.id.in_(chunk)).execute()
+    return updated
+
+
+class FindClusterByPersonId:
+    """
+    Retrieves the cluster of a person and its size, with a single primary key lookup on `person_cluster` and `cluster`.
+    
+    Args:
+        person_id (int): The ID of the person.
+    """
+    
+    __query = ""
+    __query_result = None
+    __person_id = 0
+    
+    def __init__(self, person_id):
+        """
+        Initializes a new instance of the `FindClusterByPersonId` class with the specified `person_id`.
+        """
+        self.__person_id            =       person_id
+        self.__query                =       ""
+        self.__query_result         =       None
+    
+    def set_query(self):
+        """
+        Sets the SQL query selecting the cluster of the person.
+        """
+        self.__query = ""
+        self.__query +=    "SELECT "
+        self.__query +=        "cluster.id, "
+        self.__query +=        "cluster.size "
+        self.__query +=    "FROM "
+        self.__query +=        "person_cluster "
+        self.__query +=    "JOIN "
+        self.__query +=        "cluster ON cluster.id = person_cluster.cluster_id "
+        self.__query +=    "WHERE "
+        self.__query +=        "person_cluster.person_id = ?"
+    
+    def execute_query(self):
+        """
+        Executes the SQL query and stores a dictionary with the `cluster_id` and `size` keys, or None if the person does not exist, in the `__query_result` attribute.
+        """
+        row = db.execute_sql(self.__query, (self.__person_id,)).fetchone()
+        self.__query_result = None if row is None else {'cluster_id': row[0], 'size': row[1]}
+        return self.__query_result
+    
+    def get_query_result(self):
+        """
+        Sets and executes the query, and returns the query result stored in the `__query_result` attribute.
+        """
+        self.set_query()
+        return self.execute_query()
+    
+    def get_query(self):
+        """
+        Returns the SQL query and its binds, as executed by `get_query_result`.
+        """
+        self.set_query()
+        return self.__query, (self.__person_id,)
+
+
+class FindClusterMembers:
+    """
+    Retrieves one page of the members of a cluster, in person ID order.
+    
+    Pages are addressed by the last person ID of the previous page, so each page is a range read of the `(cluster_id, person_id)` index whose cost does not depend on how deep the page is.
+    
+    Args:
+        cluster_id (int): The ID of the cluster.
+        after_person_id (int, optional): Only the members with a greater person ID are returned. Defaults to the start of the cluster.
+        page_size (int, optional): The maximum number of members returned. Defaults to 100.
+    """
+    
+    __query = ""
+    __query_result = []
+    __binds = ()
+    
+    def __init__(self, cluster_id, after_person_id=None, page_size=100):
+        """
+        Initializes a new instance of the `FindClusterMembers` class.
+        """
+        self.__binds                =       (cluster_id, after_person_id if after_person_id is not None else -1 << 63, page_size)
+        self.__query                =       ""
+        self.__query_result         =       []
+    
+    def set_query(self):
+        """
+        Sets the SQL query selecting the page of members.
+        """
+        self.__query = ""
+        self.__query +=    "SELECT "
+        self.__query +=        "person.id, "
+        self.__query +=        "person.first_name, "
+        self.__query +=        "person.last_name "
+        self.__query +=    "FROM "
+        self.__query +=        "person_cluster "
+        self.__query +=    "JOIN "
+        self.__query +=        "person ON person.id = person_cluster.person_id "
+        self.__query +=    "WHERE "
+        self.__query +=        "person_cluster.cluster_id = ? "
+        self.__query +=        "AND person_cluster.person_id > ? "
+        self.__query +=    "ORDER BY "
+        self.__query +=        "person_cluster.person_id ASC "
+        self.__query +=    "LIMIT ?"
+    
+    def execute_query(self):
+        """
+        Executes the SQL query and populates the `__query_result` attribute with a dictionary per member.
+        """
+        self.__query_result = [
+            {'id': id, 'first_name': first_name, 'last_name': last_name}
+            for id, first_name, last_name in db.execute_sql(self.__query, self.__binds)
+        ]
+        return self.__query_result
+    
+    def get_query_result(self):
+        """
+        Sets and executes the query, and returns the query result stored in the `__query_result` attribute.
+        """
+        self.set_query()
+        return self.execute_query()
+    
+    def get_query(self):
+        """
+        Returns the SQL query and its binds, as executed by `get_query_result`.
+        """
+        self.set_query()
+        return self.__query, self.__binds
+
+
+def get_person_cluster(person_id, after_person_id=None, page_size=100):
+    """
+    Returns the cluster of a person with one page of its members.
+    
+    Args:
+        person_id (int): The ID of the person.
+        after_person_id (int, optional): The last person ID of the previous page. Defaults to the first page.
+        page_size (int, optional): The maximum number of members per page. Defaults to 100.
+    
+    Returns:
+        dict: The `cluster_id`, `size`, `members` and `next_after_person_id` keys, the last being None on the last page, or None if the person does not exist.
+    """
+    cluster = FindClusterByPersonId(person_id).get_query_result()
+    if cluster is None:
+        return None
+    members = FindClusterMembers(cluster['cluster_id'], after_person_id=after_person_id, page_size=page_size).get_query_result()
+    cluster['members'] = members
+    cluster['next_after_person_id'] = members[-1]['id'] if len(members) == page_size else None
+    return cluster
+
+
+def _chunks(values):
+    return [values[i:i + PERSON_IDS_PER_QUERY] for i in range(0, len(values), PERSON_IDS_PER_QUERY)]
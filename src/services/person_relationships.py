@@ -1,10 +1,119 @@
 """Module providing a person relationships"""
+import sys
 import json
 import datetime
-from src.lib.database.conn import db
+from itertools import groupby
+from collections import namedtuple
+from src.lib.database.conn import db, ensure_store
+from src.lib.database.pool import read_transaction
+from src.lib.database.store import STORE_META_TABLE, CONNECTIONS_DATE_KEY
 from src.lib.database.migration.models.person_model import Person
 from src.lib.database.migration.models.experience_model import Experience
-from src.lib.database.migration.migration import Migration
+from src.services.experience_overlap import ExperienceOverlapEngine, MIN_OVERLAP_DAYS
+from src.lib.helpers.profiling import profiler, profiled
+from src.services.connection_traversal import rule_names
+
+
+class FindPersonById:
+    """
+    Reads the columns of a person as a plain dictionary, without building a `Person` model instance.
+    
+    The same row carries the date the stored connections were computed for, read from the store metadata, so a lookup knows whether it can serve them without another statement (see `PersonRepository.stored_connections_are_current`).
+    
+    Args:
+        person_id (int): The ID of the person.
+    """
+    
+    __query = ""
+    __query_result = None
+    __connections_date = None
+    __person_id = 0
+    
+    def __init__(self, person_id):
+        """
+        Initializes a new instance of the `FindPersonById` class with the specified `person_id`.
+        """
+        self.__person_id            =       person_id
+        self.__query                =       ""
+        self.__query_result         =       None
+        self.__connections_date     =       None
+    
+    def set_query(self):
+        """
+        Sets the SQL query selecting the person by primary key.
+        """
+        self.__query = ""
+        self.__query +=    "SELECT "
+        self.__query +=        "id, "
+        self.__query +=        "first_name, "
+        self.__query +=        "last_name, "
+        self.__query +=        "phone, "
+        self.__query +=        "phone_key, "
+        self.__query +=        "(SELECT value FROM {} WHERE key = '{}') ".format(STORE_META_TABLE, CONNECTIONS_DATE_KEY)
+        self.__query +=    "FROM "
+        self.__query +=        "person "
+        self.__query +=    "WHERE "
+        self.__query +=        "id = ?"
+    
+    def execute_query(self):
+        """
+        Executes the SQL query stored in the `__query` attribute and sets the `__query_result` attribute to the person dictionary, or None if the person does not exist.
+        """
+        self.__query_result = None
+        self.__connections_date = None
+        with profiler.section('FindPersonById.execute_query') as section:
+            value = db.execute_sql(self.__query, (self.__person_id,)).fetchone()
+            if value is not None:
+                section.add_rows(1)
+                self.__query_result = self.row_to_dict(value)
+                self.__connections_date = self.row_connections_date(value)
+        return self.__query_result
+    
+    @staticmethod
+    def row_to_dict(value):
+        """
+        Maps a row of the query to the dictionary returned by `get_query_result`, which has the keys of `Person.__data__`.
+        """
+        id, first_name, last_name, phone, phone_key, _ = value
+        return {
+            'id'                    :       id,
+            'first_name'            :       first_name,
+            'last_name'             :       last_name,
+            'phone'                 :       phone,
+            'phone_key'             :       phone_key
+        }
+    
+    @staticmethod
+    def row_connections_date(value):
+        """
+        Returns the date the stored connections were computed for, as an ISO date, from a row of the query. None for stores that do not record it.
+        """
+        return value[-1]
+    
+    def get_connections_date(self):
+        """
+        Returns the date the stored connections were computed for, as read by the last `get_query_result`.
+        """
+        return self.__connections_date
+    
+    def get_query_result(self):
+        """
+        Sets and executes the query, and returns the person dictionary.
+        
+        Raises:
+            Person.DoesNotExist: If the person does not exist, as `Person.get_by_id` does.
+        """
+        self.set_query()
+        if self.execute_query() is None:
+            raise Person.DoesNotExist('Person {} does not exist'.format(self.__person_id))
+        return self.__query_result
+    
+    def get_query(self):
+        """
+        Returns the SQL query and its binds, as executed by `get_query_result`.
+        """
+        self.set_query()
+        return self.__query, (self.__person_id,)
 
 
 class FindContactsByPersonId:
@@ -50,7 +159,7 @@ class FindContactsByPersonId:
         - phone_number_person.id
         - phone_number_person.first_name || ' ' || phone_number_person.last_name AS 'contact_person_name'
         
-        The query joins the person, contact, and phone tables, and optionally joins the person table again to filter to only include contacts that match the person.
+        The query joins the person, contact, and phone tables, and optionally joins the person table again to filter to only include contacts that match the person. Phone numbers are matched by equality of their canonical integer keys (see `canonical_phone_key`), so `+19173454768` and `(917) 345-4768` match and the join uses the `person.phone_key` index.
         
         Args:
             show_only_contacts_matching_person (bool): If True, the query will only include contacts that match the person. If False, the query will include all contacts associated with the person.
@@ -76,12 +185,13 @@ class FindContactsByPersonId:
         else:
             self.__query +=  "LEFT JOIN "
         
-        self.__query +=      "person as phone_number_person ON phone_number_person.phone LIKE phone.number "
+        self.__query +=      "person as phone_number_person ON phone_number_person.phone_key = phone.number_key "
         self.__query +=  "WHERE "
         self.__query +=      "person.id = ? "
         self.__query +=  "ORDER BY "
         self.__query +=      "person.id, phone.contact_id ASC"
     
+    @profiled('FindContactsByPersonId.execute_query')
     def execute_query(self):
         """
         Executes the SQL query stored in the `__query` attribute and populates the `__query_result` attribute with the results.
@@ -122,6 +232,13 @@ class FindContactsByPersonId:
         self.execute_query()
         return self.__query_result
     
+    def get_query(self, show_only_contacts_matching_person = False):
+        """
+        Returns the SQL query and its binds, as executed by `get_query_result`.
+        """
+        self.set_query(show_only_contacts_matching_person)
+        return self.__query, (self.__person_id, self.__person_id)
+    
 
 class FindExperiencesWithPermanenceDays:
     """
@@ -194,7 +311,7 @@ class FindExperiencesWithPermanenceDays:
         - `e.end_date`: The end date for the experience record.
         
         The query filters the results to only include experiences where:
-        - The company name matches the provided `company_name` (using a LIKE query with wildcards).
+        - The company name is equal to the provided `company_name`, so the company/date interval index is used.
         - The permanence days are greater than or equal to the provided `min_permanence_days`.
         - The person ID is not equal to the provided `person_id`.
         - The start date is less than or equal to the provided `end_date` minus the `min_permanence_days`.
@@ -213,7 +330,7 @@ class FindExperiencesWithPermanenceDays:
         self.__query +=    "FROM  "
         self.__query +=        "experience as e "
         self.__query +=    "WHERE "
-        self.__query +=        "e.company like ? "
+        self.__query +=        "e.company = ? "
         self.__query +=    "AND "
         self.__query +=        "permanence_days >= ? "
         self.__query +=    "AND "
@@ -228,20 +345,21 @@ class FindExperiencesWithPermanenceDays:
         Constructs the query binds for the SQL query executed in the `execute_query` method.
         
         The binds include:
-        - `company`: A wildcard-enclosed version of the `company_name` attribute, used for a LIKE query.
+        - `company`: The `company_name` attribute.
         - `permanence_days`: The `min_permanence_days` attribute, converted to an integer.
         - `person_id`: The `person_id` attribute, converted to an integer.
         - `start_date`: The `end_date` attribute minus `permanence_days` days, converted to a string.
         
         These binds are used to parameterize the SQL query and provide the necessary values for the query execution.
         """
-        company = "%{}%".format(self.company_name)
+        company = self.company_name
         permanence_days = int(self.min_permanence_days)
         person_id = int(self.person_id)
         start_date = datetime.date.fromisoformat(str(self.end_date)) - datetime.timedelta(days=permanence_days)
         start_date = str(start_date)
         return (company, permanence_days, person_id, start_date)
     
+    @profiled('FindExperiencesWithPermanenceDays.execute_query')
     def execute_query(self):
         """
         Executes the query and populates the `__query_result` attribute with the results.
@@ -285,6 +403,13 @@ class FindExperiencesWithPermanenceDays:
         self.execute_query()
         return self.__query_result
     
+    def get_query(self):
+        """
+        Returns the SQL query and its binds, as executed by `get_query_result`.
+        """
+        self.set_query()
+        return self.__query, self.get_query_binds()
+    
     def __repr__(self):
         """
         Provides a string representation of the `FindExperiencesWithPermanenceDays` object, displaying its key attributes such as company name, minimum permanence days, person ID, start date, end date, and query results.
@@ -303,6 +428,777 @@ class FindExperiencesWithPermanenceDays:
 
 
 
+class FindExperiencesAtPersonCompanies:
+    """
+    Retrieves, in a single query, every experience at the companies a person worked for, including the person's own experiences.
+    
+    The rows feed the `ExperienceOverlapEngine`, which computes the pairwise overlaps in memory instead of issuing one query per experience of the person.
+    
+    Args:
+        person_id (int): The ID of the person whose companies are looked up.
+    """
+    
+    __query = ""
+    __query_result = []
+    __person_id = 0
+    
+    def __init__(self, person_id):
+        """
+        Initializes a new instance of the `FindExperiencesAtPersonCompanies` class with the specified `person_id`.
+        """
+        self.__person_id            =       person_id
+        self.__query                =       ""
+        self.__query_result         =       []
+    
+    def set_query(self):
+        """
+        Sets the SQL query selecting the experiences whose company appears in the experiences of the person, joined with the person of each experience.
+        
+        The subquery uses the `experience.person_id` index, the outer query searches the company/date interval index once per company, and the persons are read by primary key in the same statement, so the related persons never need a query of their own.
+        """
+        self.__query = ""
+        self.__query +=    "SELECT "
+        self.__query +=        "e.id, "
+        self.__query +=        "e.person_id, "
+        self.__query +=        "e.company, "
+        self.__query +=        "e.title, "
+        self.__query +=        "e.start_date, "
+        self.__query +=        "e.end_date, "
+        self.__query +=        "person.first_name, "
+        self.__query +=        "person.last_name, "
+        self.__query +=        "person.phone, "
+        self.__query +=        "person.phone_key "
+        self.__query +=    "FROM "
+        self.__query +=        "experience as e "
+        self.__query +=    "JOIN "
+        self.__query +=        "person ON person.id = e.person_id "
+        self.__query +=    "WHERE "
+        self.__query +=        "e.company IN (SELECT company FROM experience WHERE person_id = ?) "
+        self.__query +=    "ORDER BY "
+        self.__query +=        "e.id ASC"
+    
+    @profiled('FindExperiencesAtPersonCompanies.execute_query')
+    def execute_query(self):
+        """
+        Executes the SQL query stored in the `__query` attribute and populates the `__query_result` attribute with a dictionary per row, the columns of the person of the experience being under the 'person' key.
+        """
+        self.__query_result = []
+        cursor = db.execute_sql(self.__query, (self.__person_id,))
+        for value in cursor:
+            self.__query_result.append(self.row_to_dict(value))
+        return self.__query_result
+    
+    @staticmethod
+    def row_to_dict(value):
+        """
+        Maps a row of the query to the dictionary returned by `get_query_result`, so the rows of `get_query` executed on another connection are shaped the same way.
+        """
+        id, person_id, company, title, start_date, end_date, first_name, last_name, phone, phone_key = value
+        return {
+            'id'                    :       id,
+            'person_id'             :       person_id,
+            'company'               :       company,
+            'title'                 :       title,
+            'start_date'            :       start_date,
+            'end_date'              :       end_date,
+            'person'                :       {
+                'id'                :       person_id,
+                'first_name'        :       first_name,
+                'last_name'         :       last_name,
+                'phone'             :       phone,
+                'phone_key'         :       phone_key
+            }
+        }
+    
+    def get_query_result(self):
+        """
+        Sets and executes the query, and returns the query result stored in the `__query_result` attribute.
+        """
+        self.set_query()
+        self.execute_query()
+        return self.__query_result
+    
+    def get_query(self):
+        """
+        Returns the SQL query and its binds, as executed by `get_query_result`.
+        """
+        self.set_query()
+        return self.__query, (self.__person_id,)
+
+
+class FindConnectionsByPersonId:
+    """
+    Retrieves the materialized connections of a person from the `person_connection` table, joined with the connected persons.
+    
+    The table is clustered on `(person_a, person_b)`, so the query is a single range read whose cost is proportional to the number of connections of the person.
+    
+    Args:
+        person_id (int): The ID of the person to retrieve connections for.
+    """
+    
+    __query = ""
+    __query_result = []
+    __person_id = 0
+    
+    def __init__(self, person_id):
+        """
+        Initializes a new instance of the `FindConnectionsByPersonId` class with the specified `person_id`.
+        """
+        self.__person_id            =       person_id
+        self.__query                =       ""
+        self.__query_result         =       []
+    
+    def set_query(self):
+        """
+        Sets the SQL query selecting the edges starting from the person, ordered by the connected person ID.
+        """
+        self.__query = ""
+        self.__query +=    "SELECT "
+        self.__query +=        "person.id, "
+        self.__query +=        "person.first_name, "
+        self.__query +=        "person.last_name, "
+        self.__query +=        "person.phone, "
+        self.__query +=        "pc.via_experience, "
+        self.__query +=        "pc.via_contact, "
+        self.__query +=        "pc.overlap_days "
+        self.__query +=    "FROM "
+        self.__query +=        "person_connection as pc "
+        self.__query +=    "JOIN "
+        self.__query +=        "person ON person.id = pc.person_b "
+        self.__query +=    "WHERE "
+        self.__query +=        "pc.person_a = ? "
+        self.__query +=    "ORDER BY "
+        self.__query +=        "pc.person_b ASC"
+    
+    @profiled('FindConnectionsByPersonId.execute_query')
+    def execute_query(self):
+        """
+        Executes the SQL query stored in the `__query` attribute and populates the `__query_result` attribute with a dictionary per connection.
+        """
+        self.__query_result = []
+        cursor = db.execute_sql(self.__query, (self.__person_id,))
+        for value in cursor:
+            self.__query_result.append(self.row_to_dict(value))
+        return self.__query_result
+    
+    @staticmethod
+    def row_to_dict(value):
+        """
+        Maps a row of the query to the dictionary returned by `get_query_result`, so the rows of `get_query` executed on another connection are shaped the same way.
+        """
+        id, first_name, last_name, phone, via_experience, via_contact, overlap_days = value
+        return {
+            'id'                    :       id,
+            'first_name'            :       first_name,
+            'last_name'             :       last_name,
+            'phone'                 :       phone,
+            'via_experience'        :       bool(via_experience),
+            'via_contact'           :       bool(via_contact),
+            'overlap_days'          :       overlap_days
+        }
+    
+    def get_query_result(self):
+        """
+        Sets and executes the query, and returns the query result stored in the `__query_result` attribute.
+        """
+        self.set_query()
+        self.execute_query()
+        return self.__query_result
+    
+    def get_query(self):
+        """
+        Returns the SQL query and its binds, as executed by `get_query_result`.
+        """
+        self.set_query()
+        return self.__query, (self.__person_id,)
+
+
+class FindContactRelationsByPersonId:
+    """
+    Retrieves the contact phones relating a person to other persons, in both directions of the contact rule, in a single statement.
+    
+    The rows are the phones of the person's contacts, matched with the person holding the same canonical phone key, followed by the phones holding the person's phone key in the contacts of other persons, matched with the owner of the contact. In both cases the matched person is the related one, and the contact columns describe the contact phone relating them.
+    
+    Args:
+        person_id (int): The ID of the person.
+    """
+    
+    # The rows of both directions, without their order, shared with `FindRelationshipsByPersonId`
+    SELECTS = (
+        "SELECT "
+            "phone.id, "
+            "owner.first_name || ' ' || owner.last_name AS contact_owner_name, "
+            "contact.nickname, "
+            "phone.type, "
+            "phone.number, "
+            "phone.contact_id, "
+            "related.id, "
+            "related.first_name, "
+            "related.last_name, "
+            "related.phone, "
+            "related.phone_key "
+        "FROM "
+            "contact "
+        "JOIN "
+            "person AS owner ON owner.id = contact.owner_id "
+        "JOIN "
+            "phone ON phone.contact_id = contact.id "
+        "{join} "
+            "person AS related ON related.phone_key = phone.number_key AND related.id <> :person_id "
+        "WHERE "
+            "contact.owner_id = :person_id "
+        "UNION ALL "
+        "SELECT "
+            "phone.id, "
+            "owner.first_name || ' ' || owner.last_name, "
+            "contact.nickname, "
+            "phone.type, "
+            "phone.number, "
+            "phone.contact_id, "
+            "owner.id, "
+            "owner.first_name, "
+            "owner.last_name, "
+            "owner.phone, "
+            "owner.phone_key "
+        "FROM "
+            "person AS own "
+        "JOIN "
+            "phone ON phone.number_key = own.phone_key "
+        "JOIN "
+            "contact ON contact.id = phone.contact_id "
+        "JOIN "
+            "person AS owner ON owner.id = contact.owner_id "
+        "WHERE "
+            "own.id = :person_id AND contact.owner_id <> :person_id"
+    )
+    
+    QUERY = SELECTS + " ORDER BY 6, 1"
+    
+    # The statement texts, with and without the contact phones matching no person
+    QUERIES = {
+        True                :       QUERY.format(join='JOIN'),
+        False               :       QUERY.format(join='LEFT JOIN'),
+    }
+    
+    __query = ""
+    __query_result = []
+    __person_id = 0
+    
+    def __init__(self, person_id):
+        """
+        Initializes a new instance of the `FindContactRelationsByPersonId` class with the specified `person_id`.
+        """
+        self.__person_id            =       person_id
+        self.__query                =       ""
+        self.__query_result         =       []
+    
+    def set_query(self, show_only_contacts_matching_person = True):
+        """
+        Sets the query to the shared statement text.
+        
+        Args:
+            show_only_contacts_matching_person (bool, optional): If False, the phones of the person's contacts matching no person are included too, with None for the related person. Defaults to True.
+        """
+        self.__query = FindContactRelationsByPersonId.QUERIES[bool(show_only_contacts_matching_person)]
+    
+    def get_query_binds(self):
+        """
+        Returns the named binds of the query.
+        """
+        return {'person_id': self.__person_id}
+    
+    @profiled('FindContactRelationsByPersonId.execute_query')
+    def execute_query(self):
+        """
+        Executes the SQL query stored in the `__query` attribute and populates the `__query_result` attribute with a dictionary per contact phone.
+        """
+        self.__query_result = []
+        cursor = db.execute_sql(self.__query, self.get_query_binds())
+        for value in cursor:
+            self.__query_result.append(self.row_to_dict(value))
+        return self.__query_result
+    
+    @staticmethod
+    def row_to_dict(value):
+        """
+        Maps a row of the query to an entry of the 'by_contacts' list of `PersonRepository.get_person_relationships`: the keys of the `FindContactsByPersonId` rows, 'id' and 'contact_person_name' being those of the related person, and the related 'person' itself.
+        """
+        id, contact_owner_name, nickname, type, number, contact_id, related_id, first_name, last_name, phone, phone_key = value
+        person = None
+        if related_id is not None:
+            person = {
+                'id'                :       related_id,
+                'first_name'        :       first_name,
+                'last_name'         :       last_name,
+                'phone'             :       phone,
+                'phone_key'         :       phone_key
+            }
+        return {
+            'id'                    :       related_id,
+            'contact_owner_name'    :       contact_owner_name,
+            'nickname'              :       nickname,
+            'type'                  :       type,
+            'number'                :       number,
+            'contact_id'            :       contact_id,
+            'contact_person_name'   :       None if person is None else '{} {}'.format(first_name, last_name),
+            'person'                :       person
+        }
+    
+    def get_query_result(self, show_only_contacts_matching_person = True):
+        """
+        Sets and executes the query, and returns the query result stored in the `__query_result` attribute.
+        """
+        self.set_query(show_only_contacts_matching_person)
+        self.execute_query()
+        return self.__query_result
+    
+    def get_query(self, show_only_contacts_matching_person = True):
+        """
+        Returns the SQL query and its binds, as executed by `get_query_result`.
+        """
+        self.set_query(show_only_contacts_matching_person)
+        return self.__query, self.get_query_binds()
+
+
+# A person related to another by `FindRelatedPersons`, with the names of the rules relating them
+RelatedPerson = namedtuple('RelatedPerson', ['id', 'first_name', 'last_name', 'rules'])
+
+
+class RelatedExperience(namedtuple('RelatedExperience', ['person', 'company', 'title', 'start_date', 'end_date', 'overlap_days'])):
+    """
+    An experience of another person overlapping an experience of a person, as found by `RelatedExperiencesFromExperience`, with the columns of that other person in `person` and the overlap of both experiences in `overlap_days`.
+    """
+    
+    __slots__ = ()
+    
+    @property
+    def person_id(self):
+        """
+        Returns the ID of the person of the experience.
+        """
+        return self.person['id']
+    
+    def to_dict(self):
+        """
+        Returns the entry of the 'by_experiences' list of `PersonRepository.get_person_relationships`.
+        """
+        return self._asdict()
+
+
+class FindRelationshipsByPersonId:
+    """
+    Reads both lists of `PersonRepository.get_person_relationships` in a single statement, the related experiences coming from the materialized `person_connection` table.
+    
+    The experience edges of the person are a range read of the `person_connection` primary key, so only the connected persons and their experiences are read, by primary key and by the `experience.person_id` index, instead of every experience at the person's companies. Each experience is matched with the person's experiences at the same company, read once, and the overlaps are evaluated in SQL. `rows_to_relationships()` keeps the pairs overlapping enough and per connected person and company the pair overlapping the most, with the tie-breaks of `ExperienceOverlapEngine.pairs_for`. The rows of `FindContactRelationsByPersonId` follow, in the same columns.
+    
+    The stored edges are the ones of the default minimum overlap, with the null end dates resolved to the date the connections were computed for, so `today` must be that date (see `PersonRepository.stored_connections_are_current`).
+    
+    Args:
+        person_id (int): The ID of the person.
+        today (datetime.date, optional): The date the stored connections were computed for. Defaults to today.
+    """
+    
+    # The overlap of an experience of a connected person with an experience of the person, in days
+    OVERLAP = "CAST(MIN(JULIANDAY(COALESCE(e.end_date, :today)), own.end_day) - MAX(JULIANDAY(e.start_date), own.start_day) AS INTEGER)"
+    
+    QUERY = (
+        "WITH "
+            "own AS MATERIALIZED ("
+                "SELECT id, company, JULIANDAY(start_date) AS start_day, JULIANDAY(COALESCE(end_date, :today)) AS end_day "
+                "FROM experience "
+                "WHERE person_id = :person_id"
+            ") "
+        "SELECT "
+            "0, "
+            "e.id, "
+            "own.id, "
+            "e.company, "
+            "e.title, "
+            "e.start_date, "
+            "e.end_date, "
+            + OVERLAP + ", "
+            "person.id, "
+            "person.first_name, "
+            "person.last_name, "
+            "person.phone, "
+            "person.phone_key "
+        "FROM "
+            "person_connection AS pc "
+        # CROSS JOIN keeps the edges as the outer loop, the planner would otherwise read the experiences by company
+        "CROSS JOIN "
+            "person ON person.id = pc.person_b "
+        "CROSS JOIN "
+            "experience AS e ON e.person_id = pc.person_b "
+        "CROSS JOIN "
+            "own ON +own.company = e.company "
+        "WHERE "
+            "pc.person_a = :person_id AND pc.via_experience "
+        "UNION ALL "
+        "SELECT "
+            "1, "
+            "contacts.contact_id, "
+            "contacts.* "
+        "FROM "
+            "(" + FindContactRelationsByPersonId.SELECTS + ") AS contacts "
+        "ORDER BY "
+            "1, 2, 3"
+    )
+    
+    # The statement texts, with and without the contact phones matching no person
+    QUERIES = {
+        True                :       QUERY.format(join='JOIN'),
+        False               :       QUERY.format(join='LEFT JOIN'),
+    }
+    
+    __query = ""
+    __query_result = None
+    __person_id = 0
+    
+    def __init__(self, person_id, today=None):
+        """
+        Initializes a new instance of the `FindRelationshipsByPersonId` class with the specified `person_id`.
+        """
+        self.__person_id            =       person_id
+        self.__today                =       today or datetime.date.today()
+        self.__query                =       ""
+        self.__query_result         =       None
+    
+    def set_query(self, show_only_contacts_matching_person = True):
+        """
+        Sets the query to the shared statement text.
+        
+        Args:
+            show_only_contacts_matching_person (bool, optional): If False, the phones of the person's contacts matching no person are included too, as by `FindContactRelationsByPersonId`. Defaults to True.
+        """
+        self.__query = FindRelationshipsByPersonId.QUERIES[bool(show_only_contacts_matching_person)]
+    
+    def get_query_binds(self):
+        """
+        Returns the named binds of the query: the `person_id` and `today` as an ISO date.
+        """
+        return {
+            'person_id'             :       self.__person_id,
+            'today'                 :       self.__today.isoformat(),
+        }
+    
+    def execute_query(self):
+        """
+        Executes the SQL query stored in the `__query` attribute and sets the `__query_result` attribute to the 'relationships' dictionary.
+        """
+        with profiler.section('FindRelationshipsByPersonId.execute_query') as section:
+            self.__query_result = self.rows_to_relationships(db.execute_sql(self.__query, self.get_query_binds()))
+            section.add_rows(len(self.__query_result['by_experiences']) + len(self.__query_result['by_contacts']))
+        return self.__query_result
+    
+    @staticmethod
+    def rows_to_relationships(rows):
+        """
+        Maps the rows of the query to the 'relationships' dictionary of `PersonRepository.get_person_relationships`, so the rows of `get_query` executed on another connection give the same document.
+        
+        The pairs overlapping less than the default minimum overlap are dropped here rather than in SQL, where the filter costs more than the pairs it removes. A connected person related at a company by several pairs of experiences is kept once, by the pair overlapping the most, the earliest experience of the person and the earliest starting experience of theirs breaking ties, as in `ExperienceOverlapEngine.pairs_for`.
+        """
+        best = {}
+        contacts = []
+        for value in rows:
+            if value[0] == 0:
+                _, id, own_id, company, title, start_date, end_date, overlap_days, person_id, first_name, last_name, phone, phone_key = value
+                if overlap_days < MIN_OVERLAP_DAYS:
+                    continue
+                key = (person_id, company)
+                rank = (-overlap_days, own_id, start_date, id)
+                if key not in best or rank < best[key][0]:
+                    person = {
+                        'id'            :       person_id,
+                        'first_name'    :       first_name,
+                        'last_name'     :       last_name,
+                        'phone'         :       phone,
+                        'phone_key'     :       phone_key
+                    }
+                    best[key] = (rank, id, RelatedExperience(person, company, title, start_date, end_date, overlap_days))
+            else:
+                contacts.append(FindContactRelationsByPersonId.row_to_dict(value[2:]))
+        return {
+            'by_experiences': [related.to_dict() for _, _, related in sorted(best.values(), key=lambda best: best[1])],
+            'by_contacts': contacts,
+        }
+    
+    def get_query_result(self, show_only_contacts_matching_person = True):
+        """
+        Sets and executes the query, and returns the 'relationships' dictionary.
+        """
+        self.set_query(show_only_contacts_matching_person)
+        self.execute_query()
+        return self.__query_result
+    
+    def get_query(self, show_only_contacts_matching_person = True):
+        """
+        Returns the SQL query and its binds, as executed by `get_query_result`.
+        """
+        self.set_query(show_only_contacts_matching_person)
+        return self.__query, self.get_query_binds()
+
+
+class ScanAllRelationships:
+    """
+    Reads the relationships of every person with one set of ordered scans, instead of the statements of `FindRelationshipsByPersonId` per person.
+
+    The persons are scanned by ID, the experience edges in the order of the `person_connection` primary key, which needs no sort, and the contact phones relating persons, in both directions, sorted by person. The three scans are merged as they are read: a person's rows are the group of each scan starting with their ID, built into the document by `FindRelationshipsByPersonId.rows_to_relationships`, and the document is yielded as soon as the group ends, so only the rows of one person are held at a time.
+
+    As for `FindRelationshipsByPersonId`, the stored connections must be current (see `PersonRepository.stored_connections_are_current`), and only the contact phones matching a person are read.
+
+    Args:
+        today (datetime.date, optional): The date the stored connections were computed for. Defaults to today.
+    """
+
+    PERSONS_QUERY = "SELECT id, first_name, last_name, phone, phone_key, NULL FROM person ORDER BY id"
+
+    EXPERIENCES_QUERY = (
+        "SELECT "
+            "pc.person_a, "
+            "0, "
+            "e.id, "
+            "own.id, "
+            "e.company, "
+            "e.title, "
+            "e.start_date, "
+            "e.end_date, "
+            "CAST(MIN(JULIANDAY(COALESCE(e.end_date, :today)), JULIANDAY(COALESCE(own.end_date, :today))) - MAX(JULIANDAY(e.start_date), JULIANDAY(own.start_date)) AS INTEGER), "
+            "person.id, "
+            "person.first_name, "
+            "person.last_name, "
+            "person.phone, "
+            "person.phone_key "
+        "FROM "
+            "person_connection AS pc "
+        # CROSS JOIN keeps the edges as the outer loop, so the rows come in primary key order
+        "CROSS JOIN "
+            "person ON person.id = pc.person_b "
+        "CROSS JOIN "
+            "experience AS e ON e.person_id = pc.person_b "
+        "CROSS JOIN "
+            "experience AS own ON own.person_id = pc.person_a AND +own.company = e.company "
+        "WHERE "
+            "pc.via_experience "
+        "ORDER BY "
+            "pc.person_a"
+    )
+
+    CONTACTS_QUERY = (
+        "SELECT "
+            "contact.owner_id, "
+            "1, "
+            "phone.contact_id, "
+            "phone.id, "
+            "owner.first_name || ' ' || owner.last_name, "
+            "contact.nickname, "
+            "phone.type, "
+            "phone.number, "
+            "phone.contact_id, "
+            "related.id, "
+            "related.first_name, "
+            "related.last_name, "
+            "related.phone, "
+            "related.phone_key "
+        "FROM "
+            "contact "
+        "JOIN "
+            "person AS owner ON owner.id = contact.owner_id "
+        "JOIN "
+            "phone ON phone.contact_id = contact.id "
+        "JOIN "
+            "person AS related ON related.phone_key = phone.number_key AND related.id <> contact.owner_id "
+        "UNION ALL "
+        "SELECT "
+            "own.id, "
+            "1, "
+            "phone.contact_id, "
+            "phone.id, "
+            "owner.first_name || ' ' || owner.last_name, "
+            "contact.nickname, "
+            "phone.type, "
+            "phone.number, "
+            "phone.contact_id, "
+            "owner.id, "
+            "owner.first_name, "
+            "owner.last_name, "
+            "owner.phone, "
+            "owner.phone_key "
+        "FROM "
+            "person AS own "
+        "JOIN "
+            "phone ON phone.number_key = own.phone_key "
+        "JOIN "
+            "contact ON contact.id = phone.contact_id "
+        "JOIN "
+            "person AS owner ON owner.id = contact.owner_id "
+        "WHERE "
+            "contact.owner_id <> own.id "
+        "ORDER BY "
+            "1, 3, 4"
+    )
+
+    def __init__(self, today=None):
+        """
+        Initializes a new instance of the `ScanAllRelationships` class.
+        """
+        self.__today                =       today or datetime.date.today()
+
+    def get_query_binds(self):
+        """
+        Returns the named binds of the experience scan: `today` as an ISO date.
+        """
+        return {'today': self.__today.isoformat()}
+
+    def get_query_result(self):
+        """
+        Runs the scans in one read transaction, so they read the same snapshot of the store.
+
+        Returns:
+        A generator of dictionaries shaped as the result of `PersonRepository.get_person_relationships`, in person ID order.
+        """
+        with db.atomic():
+            persons = db.execute_sql(ScanAllRelationships.PERSONS_QUERY)
+            experiences = db.execute_sql(ScanAllRelationships.EXPERIENCES_QUERY, self.get_query_binds())
+            contacts = db.execute_sql(ScanAllRelationships.CONTACTS_QUERY)
+            yield from self.merge_rows(persons, experiences, contacts)
+
+    @staticmethod
+    def merge_rows(persons, *scans):
+        """
+        Merges the person rows with the rows of the scans, each ordered by the person ID in their first column, into one document per person.
+        """
+        groups = [groupby(scan, key=lambda value: value[0]) for scan in scans]
+        heads = [next(group, None) for group in groups]
+        for value in persons:
+            person = FindPersonById.row_to_dict(value)
+            rows = []
+            for index, group in enumerate(groups):
+                while heads[index] is not None and heads[index][0] < person['id']:
+                    heads[index] = next(group, None)
+                if heads[index] is not None and heads[index][0] == person['id']:
+                    rows.extend(row[1:] for row in heads[index][1])
+                    heads[index] = next(group, None)
+            person['relationships'] = FindRelationshipsByPersonId.rows_to_relationships(rows)
+            yield person
+
+
+class FindRelatedPersons:
+    """
+    Resolves both connection rules for a person from the `experience`, `contact` and `phone` tables in a single parameterized statement, without the materialized `person_connection` table, so any minimum overlap can be used.
+    
+    The statement text is a class constant built once, so `sqlite3` finds it in the prepared statement cache of the connection on every call after the first and only the binds change. Its CTEs compute:
+    
+    - `own_experience`: the experiences of the person, a null end date standing for `today`.
+    - `by_experience`: the persons whose experience at one of these companies overlaps it for at least `min_permanence_days` days, the overlap being `min(end) - max(start)` as in `ExperienceOverlapEngine`. The start date bound walks the company/date interval index.
+    - `by_contact`: the persons whose phone key is in the contacts of the person, and the owners of the contacts holding the phone key of the person.
+    
+    The union of both is grouped by person, which deduplicates the persons related by several experiences or by both rules, and ordered by ID.
+    
+    Args:
+        person_id (int): The ID of the person.
+        min_permanence_days (int, optional): The minimum overlap in days of two experiences at the same company. Defaults to 90.
+        today (datetime.date, optional): The date used for null end dates. Defaults to today.
+    """
+    
+    QUERY = (
+        "WITH "
+            "own_experience AS ("
+                "SELECT company, start_date, COALESCE(end_date, :today) AS end_date "
+                "FROM experience "
+                "WHERE person_id = :person_id"
+            "), "
+            "by_experience AS ("
+                "SELECT e.person_id AS id, 1 AS rules "
+                "FROM own_experience AS own "
+                "JOIN experience AS e ON e.company = own.company "
+                "WHERE e.person_id <> :person_id "
+                "AND e.start_date <= date(own.end_date, '-' || :min_permanence_days || ' days') "
+                "AND JULIANDAY(MIN(COALESCE(e.end_date, :today), own.end_date)) - JULIANDAY(MAX(e.start_date, own.start_date)) >= :min_permanence_days"
+            "), "
+            "by_contact AS ("
+                "SELECT person.id AS id, 2 AS rules "
+                "FROM contact "
+                "JOIN phone ON phone.contact_id = contact.id "
+                "JOIN person ON person.phone_key = phone.number_key "
+                "WHERE contact.owner_id = :person_id AND person.id <> :person_id "
+                "UNION "
+                "SELECT contact.owner_id AS id, 2 AS rules "
+                "FROM person "
+                "JOIN phone ON phone.number_key = person.phone_key "
+                "JOIN contact ON contact.id = phone.contact_id "
+                "WHERE person.id = :person_id AND contact.owner_id <> :person_id"
+            ") "
+        "SELECT "
+            "person.id, "
+            "person.first_name, "
+            "person.last_name, "
+            "MAX(related.rules & 1) | MAX(related.rules & 2) AS rules "
+        "FROM "
+            "(SELECT id, rules FROM by_experience UNION ALL SELECT id, rules FROM by_contact) AS related "
+        "JOIN "
+            "person ON person.id = related.id "
+        "GROUP BY "
+            "person.id "
+        "ORDER BY "
+            "person.id ASC"
+    )
+    
+    __query = ""
+    __query_result = []
+    
+    def __init__(self, person_id, min_permanence_days=MIN_OVERLAP_DAYS, today=None):
+        """
+        Initializes a new instance of the `FindRelatedPersons` class for a person and a minimum overlap.
+        """
+        self.__person_id            =       person_id
+        self.__min_permanence_days  =       int(min_permanence_days)
+        self.__today                =       today or datetime.date.today()
+        self.__query                =       ""
+        self.__query_result         =       []
+    
+    def set_query(self):
+        """
+        Sets the query to the shared `QUERY` text.
+        """
+        self.__query = FindRelatedPersons.QUERY
+    
+    def get_query_binds(self):
+        """
+        Returns the named binds of the query: the `person_id`, the `min_permanence_days` and `today` as an ISO date.
+        """
+        return {
+            'person_id'             :       self.__person_id,
+            'min_permanence_days'   :       self.__min_permanence_days,
+            'today'                 :       self.__today.isoformat(),
+        }
+    
+    @profiled('FindRelatedPersons.execute_query')
+    def execute_query(self):
+        """
+        Executes the query and populates the `__query_result` attribute with a `RelatedPerson` per related person, the rules being named as in `rule_names`.
+        """
+        self.__query_result = []
+        cursor = db.execute_sql(self.__query, self.get_query_binds())
+        for id, first_name, last_name, rules in cursor:
+            self.__query_result.append(RelatedPerson(id, first_name, last_name, rule_names(rules)))
+        return self.__query_result
+    
+    def get_query_result(self):
+        """
+        Sets and executes the query, and returns the `RelatedPerson` rows ordered by ID.
+        """
+        self.set_query()
+        self.execute_query()
+        return self.__query_result
+    
+    def get_query(self):
+        """
+        Returns the SQL query and its binds, as executed by `get_query_result`.
+        """
+        self.set_query()
+        return self.__query, self.get_query_binds()
+
+
 class RelatedExperiencesFromExperience():
     """
     A class that provides methods to retrieve related experiences from a person's experiences.
@@ -317,7 +1213,7 @@ class RelatedExperiencesFromExperience():
     - `get_related_experiences_from_person_experiences`: Returns the list of related experiences based on the person's experiences and the minimum permanence days.
     """
     
-    _related_from_experiences:list[Experience] = []
+    _related_from_experiences:list[RelatedExperience] = []
     _person_id = 0
     _person:Person = None
     
@@ -329,7 +1225,7 @@ class RelatedExperiencesFromExperience():
             person_id (int): The ID of the person. Defaults to 0 if not provided.
         
         Attributes:
-            _related_from_experiences (list[Experience]): A list of related experiences for the person.
+            _related_from_experiences (list[RelatedExperience]): A list of related experiences for the person.
             _person_id (int): The ID of the person.
         """
         self._related_from_experiences = []
@@ -350,7 +1246,9 @@ class RelatedExperiencesFromExperience():
         if self._person is not None and self._person.id == person_id:
             return self
         
-        self._person = Person.get_by_id(self._person_id)
+        with profiler.section('PersonRepository.load_person') as section:
+            self._person = Person.get_by_id(person_id)
+            section.add_rows(1)
         return self
     
     def get_person_by_id(self, person_id=None) -> Person:
@@ -380,46 +1278,64 @@ class RelatedExperiencesFromExperience():
         if person_id is None:
             person_id = self._person_id
         person = self.get_person_by_id(person_id=person_id)
-        return person.experiences
+        with profiler.section('PersonRepository.load_person_experiences') as section:
+            experiences = list(person.experiences)
+            section.add_rows(len(experiences))
+        return experiences
     
     
-    def set_related_experiences_from_person_experiences(self, person_id=None, min_permanence_days=90) -> list[Experience]:
+    def set_related_experiences_from_person_experiences(self, person_id=None, min_permanence_days=90) -> list[RelatedExperience]:
         """
-        Sets the related experiences for a person based on their existing experiences, filtering for a minimum number of permanence days.
+        Sets the related experiences for a person based on their existing experiences, keeping the experiences of other persons at the same company that overlap one of the person's experiences for a minimum number of days.
+        
+        All the experiences at the person's companies are read, with their persons, by a single `FindExperiencesAtPersonCompanies` query, and the overlaps are computed by the `ExperienceOverlapEngine`, so the number of queries does not depend on the number of related experiences.
         
         Args:
             person_id (int, optional): The ID of the person to get related experiences for. If not provided, the `_person_id` attribute will be used.
-            min_permanence_days (int, optional): The minimum number of days a person must have been in an experience for it to be considered related. Defaults to 90 days.
+            min_permanence_days (int, optional): The minimum number of days two experiences must overlap for them to be considered related. Defaults to 90 days.
         
         Returns:
-            list[Experience]: A list of related experiences for the person.
+            list[RelatedExperience]: A list of related experiences for the person.
         """
         if person_id is None:
             person_id = self._person_id
-
-        self._related_from_experiences = []
         
-        person_exp = self.get_person_experiences_by_person_id(person_id)
+        experiences = FindExperiencesAtPersonCompanies(person_id).get_query_result()
+        self._related_from_experiences = self.related_experiences(person_id, experiences, min_permanence_days=min_permanence_days)
+        return self
+    
+    @staticmethod
+    def related_experiences(person_id, experiences, min_permanence_days=MIN_OVERLAP_DAYS, today=None):
+        """
+        Computes the related experiences of a person from the rows of `FindExperiencesAtPersonCompanies`.
         
-        for exp in person_exp:
-            find_experiences_with_permanence_days = FindExperiencesWithPermanenceDays(
-                company_name=exp.company,
-                start_date=exp.start_date,
-                end_date=exp.end_date,
-                min_permanence_days=min_permanence_days,
-                person_id=exp.person.id
-            )
-            related_by_experience = find_experiences_with_permanence_days.get_query_result()
-            for related in related_by_experience:
-                self._related_from_experiences.append(Experience(
-                    person=related['person_id'],
-                    company=related['company'],
-                    title=related['title'],
-                    start_date=related['start_date'],
-                    end_date=related['end_date']
-                ))
+        A null end date stands for `today`, resolved when the lookup runs, so the overlaps with ongoing experiences are always current. Each other person is related once per shared company, by their experience overlapping the person's the most.
         
-        return self
+        Args:
+            person_id (int): The ID of the person.
+            experiences (list[dict]): The rows of `FindExperiencesAtPersonCompanies` for the person.
+            min_permanence_days (int, optional): The minimum number of days two experiences must overlap for them to be considered related. Defaults to 90 days.
+            today (datetime.date, optional): The date used for null end dates. Defaults to today.
+        
+        Returns:
+            list[RelatedExperience]: The related experiences, ordered by experience ID.
+        """
+        engine = ExperienceOverlapEngine.from_records(experiences, min_overlap_days=min_permanence_days, today=today)
+        related_by_experience = sorted(
+            ((other.ref, overlap) for _, other, overlap in engine.pairs_for(person_id)),
+            key=lambda related: related[0]['id']
+        )
+        return [
+            RelatedExperience(
+                person=related['person'],
+                company=related['company'],
+                title=related['title'],
+                start_date=related['start_date'],
+                end_date=related['end_date'],
+                overlap_days=overlap
+            )
+            for related, overlap in related_by_experience
+        ]
             
     def get_related_experiences_from_person_experiences(self, person_id=None, min_permanence_days=90):
         """
@@ -508,38 +1424,137 @@ class PersonRepository(RelatedExperiencesFromExperience):
         """
         person = self.get_person(person_id=person_id)
         return FindContactsByPersonId(person.id).get_query_result(only_contacts_with_related_person)
-    def get_person_relationships(self, person_id=None, min_permanence_days=90, only_contacts_with_related_person=True):
+    
+    def get_person_related_people_by_connections(self, person_id=None):
+        """
+        Retrieves the materialized connections of a person, computed once at ingest.
+        
+        Parameters:
+        - person_id (int, optional): The ID of the person to retrieve connections for.
+        
+        Returns:
+        A list of dictionaries with the connected person and the rules that connect them, ordered by the connected person ID.
+        """
+        if person_id is None:
+            person_id = self._person_id
+        return FindConnectionsByPersonId(person_id).get_query_result()
+    
+    def get_person_related_people(self, person_id=None, min_permanence_days=MIN_OVERLAP_DAYS):
+        """
+        Resolves both rules for a person with the single statement of `FindRelatedPersons`, for any minimum overlap.
+        
+        Parameters:
+        - person_id (int, optional): The ID of the person to resolve.
+        - min_permanence_days (int, optional): The minimum number of days two experiences must overlap for them to be considered related. Defaults to 90.
+        
+        Returns:
+        A list of `RelatedPerson` tuples `(id, first_name, last_name, rules)`, ordered by ID.
+        """
+        if person_id is None:
+            person_id = self._person_id
+        return FindRelatedPersons(person_id, min_permanence_days=min_permanence_days).get_query_result()
+    
+    @staticmethod
+    def relationships_from_rows(person_id, experiences, contacts, min_permanence_days=MIN_OVERLAP_DAYS):
+        """
+        Builds the 'relationships' of `get_person_relationships` from the rows of its queries, so the rows read on another connection give the same document.
+        
+        Parameters:
+        - person_id (int): The ID of the person.
+        - experiences (list[dict]): The rows of `FindExperiencesAtPersonCompanies` for the person.
+        - contacts (list[dict]): The rows of `FindContactRelationsByPersonId` for the person.
+        - min_permanence_days (int, optional): The minimum number of days two experiences must overlap for them to be considered related. Defaults to 90.
+        
+        Returns:
+        A dictionary with the 'by_experiences' and 'by_contacts' lists.
+        """
+        related_from_experiences = RelatedExperiencesFromExperience.related_experiences(person_id, experiences, min_permanence_days=min_permanence_days)
+        return {
+            'by_experiences': [related.to_dict() for related in related_from_experiences],
+            'by_contacts': contacts,
+        }
+    
+    @staticmethod
+    def stored_connections_are_current(connections_date, min_permanence_days=MIN_OVERLAP_DAYS, today=None):
+        """
+        Checks whether the relationships of a lookup can be read from the stored connections by `FindRelationshipsByPersonId`: they were computed for the default minimum overlap, and for today, so their ongoing experiences overlap as they do when the lookup runs.
+        
+        Parameters:
+        - connections_date (str): The date the stored connections were computed for, as read by `FindPersonById`, or None.
+        - min_permanence_days (int, optional): The minimum overlap of the lookup. Defaults to 90.
+        - today (datetime.date, optional): Defaults to today.
+        """
+        return min_permanence_days == MIN_OVERLAP_DAYS and connections_date == (today or datetime.date.today()).isoformat()
+    
+    def get_all_person_relationships(self):
+        """
+        Retrieves the relationships of every person, in person ID order.
+
+        With connections computed for today, the relationships are read by the merged scans of `ScanAllRelationships`, whatever the number of persons. Otherwise each person is resolved from the records by `get_person_relationships`.
+
+        Returns:
+        A generator of dictionaries shaped as the result of `get_person_relationships`, yielded as soon as each person is resolved.
+        """
+        value = db.execute_sql("SELECT value FROM {} WHERE key = ?".format(STORE_META_TABLE), (CONNECTIONS_DATE_KEY,)).fetchone()
+        if self.stored_connections_are_current(None if value is None else value[0]):
+            yield from ScanAllRelationships().get_query_result()
+            return
+        for person_id, in db.execute_sql('SELECT id FROM person ORDER BY id').fetchall():
+            yield self.get_person_relationships(person_id=person_id)
+    
+    def get_person_relationships(self, person_id=None, min_permanence_days=MIN_OVERLAP_DAYS, only_contacts_with_related_person=True):
         """
         Retrieves the relationships of a person based on shared experiences and contacts.
+        
+        A null end date stands for today, so the relationships of persons in ongoing experiences never go stale. With the default minimum overlap, and connections computed for today (see `stored_connections_are_current`), both lists are read from the stored connections by a single `FindRelationshipsByPersonId` statement after the person, in time proportional to the number of related persons. Otherwise both rules are evaluated from the records: the experiences at the person's companies and the contact phones relating the person to others are read by two more queries. Either way, the number of queries does not depend on how many persons are related.
 
         Parameters:
         - person_id (int, optional): The ID of the person to retrieve relationships for. Defaults to None.
-        - min_permanence_days (int, optional): The minimum number of days a person must have been in an experience for it to be considered related. Defaults to 90.
+        - min_permanence_days (int, optional): The minimum number of days two experiences must overlap for them to be considered related. Defaults to 90.
         - only_contacts_with_related_person (bool, optional): A flag indicating whether to only include contacts with related people. Defaults to True.
 
         Returns:
-        A dictionary containing two lists: 'by_experiences' and 'by_contacts'. Each list contains dictionaries representing related people based on shared experiences and contacts, respectively.
+        A dictionary with the person data and a 'relationships' key containing two lists, whose entries have the same keys whatever the options:
+        - 'by_experiences': one entry per related person and shared company, with the related 'person', the 'company', 'title', 'start_date' and 'end_date' of their experience overlapping the person's the most, and the 'overlap_days'.
+        - 'by_contacts': one entry per contact phone relating the person to another, in either direction, with the related person 'id', 'contact_person_name' and 'person', and the 'contact_owner_name', 'nickname', 'type', 'number' and 'contact_id' of the contact phone. With `only_contacts_with_related_person=False`, the phones of the person's contacts matching nobody are included with None for 'id', 'contact_person_name' and 'person'.
         """
-        person_relationship = {
-            'by_experiences': [],
-            'by_contacts': [],
-        }
-        # print('get_person_related_people_by_experiences')
-        person_experiences = self.get_person_related_people_by_experiences(person_id=person_id, min_permanence_days=min_permanence_days)
-        for related_from_experience in person_experiences:
-            related_from_experience.__data__['person'] = related_from_experience.person.__data__
-            person_relationship['by_experiences'].append(related_from_experience.__data__)
-            # print2(related_from_experience.__data__)
-        
-        # print('get_person_related_people_by_contacts')
-        person_contacts = self.get_person_related_people_by_contacts(person_id=person_id, only_contacts_with_related_person=only_contacts_with_related_person)
-        for related_from_contact in person_contacts:
-            person_relationship['by_contacts'].append(related_from_contact)
-            # print2(related_from_contact)
-        
-        person = self.get_person(person_id=person_id)
-        person.__data__['relationships'] = person_relationship
-        return person.__data__;
+        if person_id is None:
+            person_id = self._person_id
+        find_person = FindPersonById(person_id)
+        person = find_person.get_query_result()
+        if self.stored_connections_are_current(find_person.get_connections_date(), min_permanence_days):
+            person['relationships'] = FindRelationshipsByPersonId(person_id).get_query_result(only_contacts_with_related_person)
+            return person
+        experiences = FindExperiencesAtPersonCompanies(person_id).get_query_result()
+        contacts = FindContactRelationsByPersonId(person_id).get_query_result(only_contacts_with_related_person)
+        person['relationships'] = self.relationships_from_rows(person_id, experiences, contacts, min_permanence_days=min_permanence_days)
+        return person
+
+def lookup_relationships(connection, person_id):
+    """
+    Reads the relationships of a person on a given SQLite connection.
+
+    Parameters:
+    - connection (sqlite3.Connection): A connection to a ready store.
+    - person_id (int): The ID of the person.
+
+    Returns:
+    dict: The same document as `PersonRepository.get_person_relationships`, or None if the person does not exist.
+    """
+    # The statements read one snapshot, even while a delta is committed
+    with read_transaction(connection):
+        row = connection.execute(*FindPersonById(person_id).get_query()).fetchone()
+        if row is None:
+            return None
+        person = FindPersonById.row_to_dict(row)
+        if PersonRepository.stored_connections_are_current(FindPersonById.row_connections_date(row)):
+            person['relationships'] = FindRelationshipsByPersonId.rows_to_relationships(connection.execute(*FindRelationshipsByPersonId(person_id).get_query()))
+            return person
+        experiences = [FindExperiencesAtPersonCompanies.row_to_dict(value) for value in connection.execute(*FindExperiencesAtPersonCompanies(person_id).get_query())]
+        contacts = [FindContactRelationsByPersonId.row_to_dict(value) for value in connection.execute(*FindContactRelationsByPersonId(person_id).get_query())]
+    person['relationships'] = PersonRepository.relationships_from_rows(person_id, experiences, contacts)
+    return person
+
 
 def print2(data):
     """
@@ -561,9 +1576,25 @@ def print2(data):
 
 
 
+def print_relationships(person_relation_ships):
+    """
+    Prints a person and their related people, one `ID | First Last` line per person.
+    
+    Parameters:
+    - person_relation_ships (dict): The person relationships, as returned by `PersonRepository.get_person_relationships`.
+    """
+    print('-'*64)
+    print(person_relation_ships['id'], ' | ', person_relation_ships['first_name'], person_relation_ships['last_name'])
+    for relationships_by_experience in person_relation_ships['relationships']['by_experiences']:
+        print(relationships_by_experience['person']['id'], ' | ', relationships_by_experience['person']['first_name'], relationships_by_experience['person']['last_name'])
+    
+    for relationships_by_contacts in person_relation_ships['relationships']['by_contacts']:
+        print(relationships_by_contacts['id'], ' | ', relationships_by_contacts['contact_person_name'])
+
+
 def execute(person_id):
     """
-    Executes a migration and retrieves the person relationships for the given person ID. Prints the person's relationships by experiences and contacts.
+    Opens the store, migrating it first if needed, and retrieves the person relationships for the given person ID. Prints the person's relationships by experiences and contacts.
     
     Parameters:
     - person_id (int): The ID of the person to retrieve relationships for.
@@ -571,13 +1602,90 @@ def execute(person_id):
     Returns:
     None
     """
-    Migration()
+    ensure_store()
     person_relation_ships = PersonRepository(person_id=person_id).get_person_relationships(person_id=person_id)
     print2(person_relation_ships)
-    print('-'*64)
-    print(person_relation_ships['id'], ' | ', person_relation_ships['first_name'], person_relation_ships['last_name'])
-    for relationships_by_experience in person_relation_ships['relationships']['by_experiences']:
-        print(relationships_by_experience['person']['id'], ' | ', relationships_by_experience['person']['first_name'], relationships_by_experience['person']['last_name'])
+    print_relationships(person_relation_ships)
+
+
+def resolve_relationships(person_ids=None):
+    """
+    Resolves the relationships of many persons with a single migration and a shared repository.
     
-    for relationships_by_contacts in person_relation_ships['relationships']['by_contacts']:
-        print(relationships_by_contacts['id'], ' | ', relationships_by_contacts['contact_person_name'])
+    Parameters:
+    - person_ids (iterable[int], optional): The IDs of the persons, consumed lazily. If None, every person is resolved, by person ID.
+    
+    Returns:
+    A generator of `(person_id, person_relation_ships)` tuples, yielded as soon as each person is resolved, in the order of `person_ids` or by person ID. `person_relation_ships` is None for IDs that do not exist.
+    """
+    ensure_store()
+    repository = PersonRepository()
+    if person_ids is None:
+        for person_relation_ships in repository.get_all_person_relationships():
+            yield person_relation_ships['id'], person_relation_ships
+        return
+    
+    for person_id in person_ids:
+        try:
+            person_relation_ships = repository.get_person_relationships(person_id=person_id)
+        except Person.DoesNotExist:
+            person_relation_ships = None
+        yield person_id, person_relation_ships
+
+
+def execute_many(person_ids=None, output_format='text'):
+    """
+    Resolves and prints the relationships of many persons, streaming the output person by person.
+    
+    Parameters:
+    - person_ids (iterable[int], optional): The IDs of the persons. If None, every person is printed.
+    - output_format (str, optional): 'text' prints the `ID | First Last` lines of `print_relationships`, 'jsonl' prints one JSON document per person. Defaults to 'text'.
+    
+    Returns:
+    int: The number of IDs that do not exist.
+    """
+    missing = 0
+    for person_id, person_relation_ships in resolve_relationships(person_ids):
+        if person_relation_ships is None:
+            missing += 1
+            print('Person {} could not be found'.format(person_id), file=sys.stderr)
+            continue
+        if output_format == 'jsonl':
+            print(json.dumps(person_relation_ships), flush=True)
+        else:
+            print_relationships(person_relation_ships)
+            sys.stdout.flush()
+    return missing
+
+
+def execute_cluster(person_id, after_person_id=None, page_size=100, output_format='text'):
+    """
+    Prints the cluster of a person and one page of its members.
+    
+    Parameters:
+    - person_id (int): The ID of the person.
+    - after_person_id (int, optional): The last person ID of the previous page. Defaults to the first page.
+    - page_size (int, optional): The maximum number of members per page. Defaults to 100.
+    - output_format (str, optional): 'text' prints one `ID | First Last` line per member, 'json' prints the result of `get_person_cluster`. Defaults to 'text'.
+    
+    Returns:
+    bool: True if the person exists.
+    """
+    # The cluster queries are imported by the cluster lookups only
+    from src.services.person_clusters import get_person_cluster
+    ensure_store(stored_connections=True)
+    cluster = get_person_cluster(person_id, after_person_id=after_person_id, page_size=page_size)
+    if cluster is None:
+        print('Person {} could not be found'.format(person_id), file=sys.stderr)
+        return False
+    if output_format == 'json':
+        print(json.dumps(cluster))
+        return True
+    
+    print('Cluster {} | {} persons'.format(cluster['cluster_id'], cluster['size']))
+    print('-'*64)
+    for member in cluster['members']:
+        print(member['id'], ' | ', member['first_name'], member['last_name'])
+    if cluster['next_after_person_id'] is not None:
+        print('Next page: --after {}'.format(cluster['next_after_person_id']))
+    return True
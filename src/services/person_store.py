@@ -0,0 +1,311 @@
+"""Module providing a compact, column oriented store of person records"""
+import datetime
+from array import array
+
+from src.lib.helpers.format import canonical_phone_key
+from src.lib.helpers.json_stream import iter_json_array
+
+# numpy is optional, only `PersonStore.numpy_column()` needs it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Stored in place of a missing phone key or end date
+MISSING = 0
+
+
+class _InternedStrings:
+    """Keeps each distinct string once and hands out its integer code."""
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value):
+        return self._codes.get(value)
+
+
+class _PackedStrings:
+    """Keeps mostly distinct strings back to back in one UTF-8 buffer, addressed by offsets."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array('q', [0])
+        self.present = bytearray()
+
+    def append(self, value):
+        self.present.append(value is not None)
+        if value is not None:
+            self.buffer += value.encode('utf-8')
+        self.offsets.append(len(self.buffer))
+
+    def __getitem__(self, index):
+        if not self.present[index]:
+            return None
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+
+
+class PersonStore:
+    """
+    Holds person records and their experiences in typed columns instead of one dict per record and field.
+
+    Persons are stored in load order. Their IDs and canonical phone keys (see `canonical_phone_key`) are `array('q')` columns, first and last names are codes into interned string tables, and the raw phone numbers are packed into one UTF-8 buffer. Experiences are stored in the same way, in person order: the experiences of the person at position `i` are the rows `experience_offsets[i]` to `experience_offsets[i + 1]`, with interned company and title codes and start and end dates as day ordinals, `MISSING` standing for a null end date.
+
+    Records are read through `PersonView` and `ExperienceView`, `__slots__` objects created on access that expose the columns as attributes. The views also answer the keys of the JSON records (`person['id']`, `person.get('experience', [])`, `experience['start']`...), so the store can stand in for the list of records loaded from `persons.json`.
+
+    Args:
+        records (iterable[dict], optional): Person records in the shape of `persons.json`.
+    """
+
+    def __init__(self, records=()):
+        self.ids = array('q')
+        self.phone_keys = array('q')
+        self.first_names = array('i')
+        self.last_names = array('i')
+        self.phones = _PackedStrings()
+        self.names = _InternedStrings()
+
+        self.experience_offsets = array('q', [0])
+        self.companies = array('i')
+        self.titles = array('i')
+        self.starts = array('i')
+        self.ends = array('i')
+        self.company_names = _InternedStrings()
+        self.title_names = _InternedStrings()
+
+        self._positions = None
+        for record in records:
+            self.append(record)
+
+    @classmethod
+    def from_json(cls, file):
+        """
+        Builds a store from a JSON file in the shape of `persons.json`, parsing it one record at a time, so only the columns are held in memory.
+        """
+        return cls(iter_json_array(file))
+
+    def append(self, record):
+        """
+        Appends a person record in the shape of `persons.json`.
+        """
+        self.ids.append(record['id'])
+        self.first_names.append(self.names.code(record['first']))
+        self.last_names.append(self.names.code(record['last']))
+        self.phones.append(record.get('phone'))
+        phone_key = canonical_phone_key(record.get('phone'))
+        self.phone_keys.append(MISSING if phone_key is None else phone_key)
+        for experience in record.get('experience', []):
+            self.companies.append(self.company_names.code(experience['company']))
+            self.titles.append(self.title_names.code(experience['title']))
+            self.starts.append(datetime.date.fromisoformat(experience['start']).toordinal())
+            self.ends.append(datetime.date.fromisoformat(experience['end']).toordinal() if experience['end'] else MISSING)
+        self.experience_offsets.append(len(self.companies))
+        self._positions = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self.ids)
+        if not 0 <= position < len(self.ids):
+            raise IndexError('person position out of range')
+        return PersonView(self, position)
+
+    def __iter__(self):
+        for position in range(len(self.ids)):
+            yield PersonView(self, position)
+
+    def get(self, person_id):
+        """
+        Returns the view of the first person with this ID, or None.
+        """
+        if self._positions is None:
+            # Built on first use: the position of each ID, the first one for repeated IDs
+            self._positions = {}
+            for position, stored_id in enumerate(self.ids):
+                self._positions.setdefault(stored_id, position)
+        position = self._positions.get(person_id)
+        return None if position is None else PersonView(self, position)
+
+    def company_code(self, company):
+        """
+        Returns the interned code of a company, or None if no experience is at that company.
+        """
+        return self.company_names.lookup(company)
+
+    def numpy_column(self, name):
+        """
+        Returns a column, e.g. `ids`, `starts` or `companies`, as a NumPy array sharing its memory.
+
+        Raises:
+            ImportError: If NumPy is not installed.
+        """
+        if np is None:
+            raise ImportError('PersonStore.numpy_column requires numpy')
+        column = getattr(self, name)
+        return np.frombuffer(column, dtype=np.dtype(column.typecode))
+
+    def nbytes(self):
+        """
+        Returns the number of bytes used by the columns and the string tables.
+        """
+        columns = (
+            self.ids, self.phone_keys, self.first_names, self.last_names, self.phones.offsets,
+            self.experience_offsets, self.companies, self.titles, self.starts, self.ends,
+        )
+        size = sum(column.itemsize * len(column) for column in columns)
+        size += len(self.phones.buffer) + len(self.phones.present)
+        for table in (self.names, self.company_names, self.title_names):
+            size += sum(len(value.encode('utf-8')) for value in table.values)
+        return size
+
+
+class PersonView:
+    """
+    A read-only view of the person at a position of a `PersonStore`.
+    """
+
+    __slots__ = ('_store', '_position')
+
+    _keys = ('id', 'first', 'last', 'phone', 'experience')
+
+    def __init__(self, store, position):
+        self._store = store
+        self._position = position
+
+    @property
+    def id(self):
+        return self._store.ids[self._position]
+
+    @property
+    def first_name(self):
+        return self._store.names.values[self._store.first_names[self._position]]
+
+    @property
+    def last_name(self):
+        return self._store.names.values[self._store.last_names[self._position]]
+
+    @property
+    def phone(self):
+        return self._store.phones[self._position]
+
+    @property
+    def phone_key(self):
+        phone_key = self._store.phone_keys[self._position]
+        return None if phone_key == MISSING else phone_key
+
+    @property
+    def experiences(self):
+        offsets = self._store.experience_offsets
+        return [ExperienceView(self._store, row) for row in range(offsets[self._position], offsets[self._position + 1])]
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return self.id
+        if key == 'first':
+            return self.first_name
+        if key == 'last':
+            return self.last_name
+        if key == 'phone':
+            return self.phone
+        if key == 'experience':
+            return self.experiences
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self._keys else default
+
+    def to_record(self):
+        """
+        Returns the person as a record in the shape of `persons.json`.
+        """
+        return {
+            'id': self.id,
+            'first': self.first_name,
+            'last': self.last_name,
+            'phone': self.phone,
+            'experience': [experience.to_record() for experience in self.experiences],
+        }
+
+    def __repr__(self):
+        return 'PersonView(id={}, first_name={!r}, last_name={!r})'.format(self.id, self.first_name, self.last_name)
+
+
+class ExperienceView:
+    """
+    A read-only view of an experience row of a `PersonStore`.
+    """
+
+    __slots__ = ('_store', '_row')
+
+    _keys = ('company', 'title', 'start', 'end')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    @property
+    def company(self):
+        return self._store.company_names.values[self._store.companies[self._row]]
+
+    @property
+    def company_code(self):
+        return self._store.companies[self._row]
+
+    @property
+    def title(self):
+        return self._store.title_names.values[self._store.titles[self._row]]
+
+    @property
+    def start_ordinal(self):
+        return self._store.starts[self._row]
+
+    @property
+    def end_ordinal(self):
+        """
+        The day ordinal of the end date, or None for a current experience.
+        """
+        end = self._store.ends[self._row]
+        return None if end == MISSING else end
+
+    @property
+    def start_date(self):
+        return datetime.date.fromordinal(self.start_ordinal)
+
+    @property
+    def end_date(self):
+        end = self.end_ordinal
+        return None if end is None else datetime.date.fromordinal(end)
+
+    def __getitem__(self, key):
+        if key == 'company':
+            return self.company
+        if key == 'title':
+            return self.title
+        if key == 'start':
+            return self.start_date.isoformat()
+        if key == 'end':
+            end = self.end_date
+            return None if end is None else end.isoformat()
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self._keys else default
+
+    def to_record(self):
+        """
+        Returns the experience as a record in the shape of `persons.json`.
+        """
+        return {key: self[key] for key in self._keys}
+
+    def __repr__(self):
+        return 'ExperienceView(company={!r}, title={!r}, start={}, end={})'.format(self.company, self.title, self['start'], self['end'])
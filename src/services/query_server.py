@@ -0,0 +1,249 @@
+"""Module providing a long-lived HTTP query server for person relationships"""
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingUnixStreamServer
+
+from src.lib.database.conn import ensure_store, build_store
+from src.lib.database.store import current_data_version, bound_store_file
+from src.lib.database.pool import PublishedConnectionPool
+from src.services.person_relationships import lookup_relationships
+
+
+class LRUCache:
+    """
+    A thread-safe least recently used cache with hit and miss counters.
+
+    Args:
+        max_size (int): The maximum number of entries kept.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached value of `key`, marking it as recently used, or None on a miss.
+        """
+        with self._lock:
+            value = self._entries.get(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Stores `value` under `key`, evicting the least recently used entry when the cache is full.
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RelationshipService:
+    """
+    Answers relationship lookups from an opened store, with an LRU cache of the encoded answers.
+
+    The store is opened once (running the migration if it is not built yet) and published through a `PublishedConnectionPool`, whose read-only connections are shared by the request threads instead of being opened for each request. `check_data_version()` compares the data version of the current JSON files and of the deltas applied to their store with the served one and, when it changed, builds the new store in another process while the lookups keep reading the published one, then publishes the new store. No lookup waits for an ingest, and the cached answers of the previous store are never served again.
+
+    Args:
+        cache_size (int, optional): The maximum number of cached answers. Defaults to 10000.
+        connections (int, optional): The number of connections to the store, which bounds the concurrent lookups. Defaults to 4.
+    """
+
+    def __init__(self, cache_size=10000, connections=4):
+        self.cache = LRUCache(cache_size)
+        self.connections = PublishedConnectionPool(size=connections)
+        self.data_version = None
+        self.started_at = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.reloads = 0
+        self.lookup_seconds = 0.0
+        self._reload_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """
+        Opens the store of the current JSON files, migrating it first if needed, publishes it and clears the cache.
+        """
+        ensure_store()
+        self.connections.publish(bound_store_file())
+        self.data_version = current_data_version()
+        self.cache.clear()
+
+    def check_data_version(self):
+        """
+        Builds and publishes the store of the current JSON files if their data version changed.
+
+        Returns:
+            bool: True if a new store was published.
+        """
+        if current_data_version() == self.data_version:
+            return False
+        with self._reload_lock:
+            data_version = current_data_version()
+            if data_version == self.data_version:
+                return False
+            file = build_store()
+            self.connections.publish(file)
+            self.data_version = data_version
+            self.cache.clear()
+            self.reloads += 1
+            return True
+
+    def get_relationships(self, person_id):
+        """
+        Returns the JSON encoded relationships of a person, as returned by `PersonRepository.get_person_relationships`, or None if the person does not exist.
+        """
+        started = time.perf_counter()
+        try:
+            # Answers are cached per store generation, so a lookup finishing on the previous store cannot be served after a reload
+            body = self.cache.get((self.connections.generation, person_id))
+            if body is None:
+                generation, body = self._lookup(person_id)
+                if body is not None:
+                    self.cache.put((generation, person_id), body)
+            return body
+        finally:
+            with self._counters_lock:
+                self.requests += 1
+                self.lookup_seconds += time.perf_counter() - started
+
+    def _lookup(self, person_id):
+        with self.connections.connection() as (generation, connection):
+            person_relation_ships = lookup_relationships(connection, person_id)
+        if person_relation_ships is None:
+            return generation, None
+        return generation, json.dumps(person_relation_ships).encode('utf-8')
+
+    def record_error(self):
+        """
+        Counts a request that failed with an internal error.
+        """
+        with self._counters_lock:
+            self.errors += 1
+
+    def health(self):
+        """
+        Returns the health document of the service.
+        """
+        return {'status': 'ok', 'data_version': self.data_version}
+
+    def metrics(self):
+        """
+        Returns the request, cache and reload counters of the service.
+        """
+        return {
+            'data_version'          :       self.data_version,
+            'uptime_seconds'        :       time.time() - self.started_at,
+            'requests'              :       self.requests,
+            'errors'                :       self.errors,
+            'reloads'               :       self.reloads,
+            'cache_size'            :       len(self.cache),
+            'cache_hits'            :       self.cache.hits,
+            'cache_misses'          :       self.cache.misses,
+            'avg_lookup_ms'         :       1000 * self.lookup_seconds / self.requests if self.requests else 0.0,
+        }
+
+
+class RelationshipRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves `GET /persons/<id>/relationships`, `GET /health` and `GET /metrics`.
+    """
+
+    service: RelationshipService = None
+    protocol_version = 'HTTP/1.1'
+    relationships_path = re.compile(r'^/persons/(-?\d+)/relationships/?$')
+
+    def do_GET(self):
+        match = self.relationships_path.match(self.path)
+        try:
+            if match:
+                body = self.service.get_relationships(int(match.group(1)))
+                if body is None:
+                    self.send_json(404, {'error': 'Person {} could not be found'.format(match.group(1))})
+                else:
+                    self.send_body(200, body)
+            elif self.path == '/health':
+                self.send_json(200, self.service.health())
+            elif self.path == '/metrics':
+                self.send_json(200, self.service.metrics())
+            else:
+                self.send_json(404, {'error': 'Not found'})
+        except Exception as e:
+            self.service.record_error()
+            self.send_json(500, {'error': str(e)})
+
+    def send_json(self, status, data):
+        self.send_body(status, json.dumps(data).encode('utf-8'))
+
+    def send_body(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPServer(ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(service, host='127.0.0.1', port=8080, socket_path=None):
+    """
+    Creates a threaded HTTP server for a `RelationshipService`, listening on a TCP port or on a Unix socket.
+
+    Args:
+        service (RelationshipService): The service answering the requests.
+        host (str, optional): The TCP host. Defaults to 127.0.0.1.
+        port (int, optional): The TCP port, 0 picks a free port. Defaults to 8080.
+        socket_path (str, optional): The Unix socket path. If set, `host` and `port` are ignored.
+    """
+    handler = type('BoundRelationshipRequestHandler', (RelationshipRequestHandler,), {'service': service})
+    if socket_path is not None:
+        return _UnixHTTPServer(socket_path, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def watch_data_version(service, interval, stop_event):
+    """
+    Calls `service.check_data_version()` every `interval` seconds until `stop_event` is set.
+    """
+    while not stop_event.wait(interval):
+        try:
+            service.check_data_version()
+        except Exception as e:
+            print('Data version check failed: {}'.format(e))
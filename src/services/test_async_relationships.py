@@ -0,0 +1,116 @@
+import asyncio
+import sqlite3
+import threading
+import pytest
+from src.lib.database.conn import db, ensure_store
+from src.lib.database.store import bound_store_file
+from src.lib.database.pool import ReadOnlyConnectionPool
+from src.services import async_relationships
+from src.services.async_relationships import AsyncRelationshipService
+from src.services.person_relationships import PersonRepository
+
+# Runs until interrupted
+ENDLESS_QUERY = 'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c'
+
+
+@pytest.fixture(scope='module')
+def store_file():
+    ensure_store()
+    return bound_store_file()
+
+
+def collect(service, person_ids, **kwargs):
+    async def run():
+        return [result async for result in service.iter_relationships(person_ids, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_pool_connections_are_read_only_and_bounded(store_file):
+    with ReadOnlyConnectionPool(store_file, size=2) as pool:
+        assert pool.journal_mode() == 'wal'
+        first, second = pool.acquire(), pool.acquire()
+        with pytest.raises(sqlite3.OperationalError, match='readonly'):
+            first.execute('DELETE FROM person')
+        with pytest.raises(Exception, match='No connection was released'):
+            pool.acquire(timeout=0.01)
+        pool.release(first)
+        assert pool.acquire(timeout=0.01) is first
+        pool.release(first)
+        pool.release(second)
+
+
+def test_lookups_match_the_repository(store_file):
+    person_ids = [person_id for person_id, in db.execute_sql('SELECT id FROM person ORDER BY id')] + [10 ** 9]
+    repository = PersonRepository()
+    with AsyncRelationshipService(file=store_file, workers=3, max_pending=5) as service:
+        results = collect(service, person_ids)
+        assert [person_id for person_id, _ in results] == person_ids
+        for person_id, person_relation_ships in results[:-1]:
+            assert person_relation_ships == repository.get_person_relationships(person_id=person_id)
+        assert results[-1] == (10 ** 9, None)
+        assert service.metrics()['requests'] == len(person_ids)
+
+
+def test_ids_are_consumed_with_backpressure(store_file):
+    consumed = []
+
+    def person_ids():
+        for person_id in range(1, 30):
+            consumed.append(person_id)
+            yield person_id
+
+    async def run(service):
+        ahead = []
+        async for person_id, _ in service.iter_relationships(person_ids()):
+            ahead.append(consumed[-1] - person_id)
+        return ahead
+
+    with AsyncRelationshipService(file=store_file, workers=2, max_pending=3) as service:
+        ahead = asyncio.run(run(service))
+    assert len(ahead) == 29
+    assert max(ahead) < 3
+
+
+def test_timed_out_lookups_are_interrupted(store_file, monkeypatch):
+    lookup_relationships = async_relationships.lookup_relationships
+
+    def slow_lookup(connection, person_id):
+        if person_id == 1:
+            connection.execute(ENDLESS_QUERY).fetchone()
+        return lookup_relationships(connection, person_id)
+
+    monkeypatch.setattr(async_relationships, 'lookup_relationships', slow_lookup)
+    with AsyncRelationshipService(file=store_file, workers=1, timeout=0.2) as service:
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(service.get_relationships(1))
+        # The only connection was freed by the interrupt
+        assert asyncio.run(service.get_relationships(2))['id'] == 2
+        [(_, error)] = collect(service, [1], return_exceptions=True)
+        assert isinstance(error, asyncio.TimeoutError)
+        assert service.metrics()['timeouts'] == 2
+
+
+def test_timed_out_lookups_hold_their_slot_until_the_thread_is_done(store_file, monkeypatch):
+    lookup_relationships = async_relationships.lookup_relationships
+    unblock = threading.Event()
+
+    def blocked_lookup(connection, person_id):
+        if person_id == 1:
+            # Not a query, so the timeout cannot interrupt it
+            unblock.wait(5)
+        return lookup_relationships(connection, person_id)
+
+    async def run(service):
+        with pytest.raises(asyncio.TimeoutError):
+            await service.get_relationships(1, timeout=0.1)
+        slots = service._get_slots()
+        assert slots.locked()
+        with pytest.raises(asyncio.TimeoutError):
+            await service.get_relationships(2, timeout=0.1)
+        unblock.set()
+        assert (await service.get_relationships(2, timeout=5))['id'] == 2
+        assert not slots.locked()
+
+    monkeypatch.setattr(async_relationships, 'lookup_relationships', blocked_lookup)
+    with AsyncRelationshipService(file=store_file, workers=1, max_pending=1) as service:
+        asyncio.run(run(service))
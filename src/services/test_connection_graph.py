@@ -0,0 +1,52 @@
+import random
+import datetime
+import pytest
+from peewee import SqliteDatabase
+from src.services.connection_graph import build_connections, person_connections
+
+TODAY = datetime.date(2024, 6, 1)
+
+SCHEMA = [
+    'CREATE TABLE person (id INTEGER PRIMARY KEY, phone_key INTEGER)',
+    'CREATE TABLE experience (id INTEGER PRIMARY KEY, person_id INTEGER, company TEXT, start_date DATE, end_date DATE)',
+    'CREATE INDEX experience_company ON experience (company, start_date)',
+    'CREATE TABLE contact (id INTEGER PRIMARY KEY, owner_id INTEGER)',
+    'CREATE TABLE phone (id INTEGER PRIMARY KEY, contact_id INTEGER, number_key INTEGER)',
+]
+
+
+@pytest.fixture(scope='module')
+def random_database(tmp_path_factory):
+    rng = random.Random(7)
+    database = SqliteDatabase(str(tmp_path_factory.mktemp('graph') / 'graph.db'))
+    for statement in SCHEMA:
+        database.execute_sql(statement)
+    with database.atomic():
+        for person_id in range(1, 301):
+            database.execute_sql('INSERT INTO person VALUES (?, ?)', (person_id, 15550000000 + rng.randrange(250)))
+            for _ in range(rng.randint(0, 3)):
+                start = rng.randint(735000, 738500)
+                end = None if rng.random() < 0.2 else datetime.date.fromordinal(start + rng.randint(0, 900)).isoformat()
+                database.execute_sql(
+                    'INSERT INTO experience (person_id, company, start_date, end_date) VALUES (?, ?, ?, ?)',
+                    (person_id, 'Company{}'.format(rng.randrange(25)), datetime.date.fromordinal(start).isoformat(), end)
+                )
+            contact_id = database.execute_sql('INSERT INTO contact (owner_id) VALUES (?)', (person_id,)).lastrowid
+            for _ in range(rng.randint(0, 2)):
+                database.execute_sql('INSERT INTO phone (contact_id, number_key) VALUES (?, ?)', (contact_id, 15550000000 + rng.randrange(400)))
+    yield database
+    database.close()
+
+
+def test_parallel_build_matches_serial_build(random_database):
+    serial = build_connections(random_database, today=TODAY)
+    assert any(flags[0] for flags in serial.values()) and any(flags[1] for flags in serial.values())
+    for workers in (2, 3):
+        assert build_connections(random_database, today=TODAY, workers=workers) == serial
+
+
+def test_person_connections_match_full_build(random_database):
+    serial = build_connections(random_database, today=TODAY)
+    person_ids = list(range(1, 301, 7))
+    expected = {pair: flags for pair, flags in serial.items() if pair[0] in person_ids or pair[1] in person_ids}
+    assert person_connections(random_database, person_ids, today=TODAY) == expected
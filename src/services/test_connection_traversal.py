@@ -0,0 +1,101 @@
+import random
+from collections import deque
+import pytest
+from src.lib.database.conn import db
+from src.lib.database.migration.migration import Migration
+from src.services.connection_graph import build_connections, connection_rows
+from src.services.connection_traversal import ConnectionGraph, RULE_SHARED_COMPANY, RULE_CONTACT
+
+
+def random_graph(seed, persons=60, connections=90, contiguous=True):
+    rng = random.Random(seed)
+    person_ids = list(range(1, persons + 1)) if contiguous else sorted(rng.sample(range(1, persons * 10), persons))
+    graph = {}
+    for _ in range(connections):
+        person_a, person_b = sorted(rng.sample(person_ids, 2))
+        graph[(person_a, person_b)] = (rng.random() < 0.6, rng.random() < 0.6, None)
+    graph = {pair: flags if flags[0] or flags[1] else (True, False, None) for pair, flags in graph.items()}
+    rows = [(row['person_a'], row['person_b'], row['via_experience'], row['via_contact']) for row in connection_rows(graph)]
+    return person_ids, graph, ConnectionGraph.from_rows(person_ids, rows)
+
+
+def bfs_distances(graph, source_id):
+    neighbours = {}
+    for person_a, person_b in graph:
+        neighbours.setdefault(person_a, set()).add(person_b)
+        neighbours.setdefault(person_b, set()).add(person_a)
+    distances = {source_id: 0}
+    queue = deque([source_id])
+    while queue:
+        node = queue.popleft()
+        for neighbour in neighbours.get(node, ()):
+            if neighbour not in distances:
+                distances[neighbour] = distances[node] + 1
+                queue.append(neighbour)
+    return distances
+
+
+def expected_rules(flags):
+    return [name for flag, name in ((flags[0], 'shared_company'), (flags[1], 'contact')) if flag]
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('contiguous', [True, False])
+def test_shortest_path_matches_bfs(seed, contiguous):
+    person_ids, graph, connection_graph = random_graph(seed, contiguous=contiguous)
+    for source_id in person_ids[:10]:
+        distances = bfs_distances(graph, source_id)
+        for target_id in person_ids:
+            path = connection_graph.shortest_path(source_id, target_id)
+            if target_id not in distances:
+                assert path is None
+                continue
+            assert len(path) == distances[target_id]
+            node = source_id
+            for hop in path:
+                assert hop['from'] == node
+                pair = tuple(sorted((hop['from'], hop['to'])))
+                assert hop['rules'] == expected_rules(graph[pair])
+                node = hop['to']
+            assert node == target_id
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_within_matches_bfs(seed):
+    person_ids, graph, connection_graph = random_graph(seed)
+    for hops in (1, 2, 3):
+        distances = bfs_distances(graph, person_ids[0])
+        reached = connection_graph.within(person_ids[0], hops)
+        assert {entry['id']: entry['distance'] for entry in reached} == {
+            person_id: distance for person_id, distance in distances.items() if 0 < distance <= hops
+        }
+        for entry in reached:
+            pair = tuple(sorted((entry['via'], entry['id'])))
+            assert entry['rules'] == expected_rules(graph[pair])
+            assert entry['distance'] == distances[entry['via']] + 1
+
+
+def test_max_hops_and_missing_persons():
+    connection_graph = ConnectionGraph.from_rows([1, 2, 3, 4], [
+        (1, 2, 1, 0), (2, 1, 1, 0), (2, 3, 0, 1), (3, 2, 0, 1),
+    ])
+    assert connection_graph.edge_count() == 4
+    assert connection_graph.rules[0] == RULE_SHARED_COMPANY and connection_graph.rules[-1] == RULE_CONTACT
+    assert len(connection_graph.shortest_path(1, 3)) == 2
+    assert connection_graph.shortest_path(1, 3, max_hops=1) is None
+    assert connection_graph.shortest_path(1, 4) is None
+    assert connection_graph.shortest_path(1, 99) is None
+    assert connection_graph.shortest_path(2, 2) == []
+    assert connection_graph.within(4, 3) == []
+    assert connection_graph.within(99, 1) is None
+
+
+def test_graph_from_store_matches_stored_connections():
+    Migration(stream=True)
+    connection_graph = ConnectionGraph.from_database(db)
+    connections = build_connections(db)
+    assert connection_graph.edge_count() == 2 * len(connections)
+    for (person_a, person_b), flags in connections.items():
+        assert connection_graph.shortest_path(person_a, person_b) == [
+            {'from': person_a, 'to': person_b, 'rules': expected_rules(flags)}
+        ]
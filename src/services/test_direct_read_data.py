@@ -0,0 +1,76 @@
+import random
+import datetime
+import pytest
+from src.lib.database.store import FILES
+from src.services.direct_read_data import (
+    load_person_records, load_contacts, find_connections_via_experiences, find_connections_via_contacts,
+    DirectReadIndex, find_connections_via_experiences_indexed, find_connections_via_contacts_indexed
+)
+
+
+def random_person_records(seed, persons=80, companies=6):
+    rng = random.Random(seed)
+    records = []
+    for person_id in range(1, persons + 1):
+        experiences = []
+        for _ in range(rng.randint(0, 4)):
+            start = rng.randint(730000, 739000)
+            end = start + rng.randint(0, 2000)
+            experiences.append({
+                'company': 'Company{}'.format(rng.randrange(companies)),
+                'title': 'Title',
+                'start': '{:%Y-%m-%d}'.format(datetime.date.fromordinal(start)),
+                'end': None if rng.random() < 0.2 else '{:%Y-%m-%d}'.format(datetime.date.fromordinal(end)),
+            })
+        records.append({'id': person_id, 'first': 'First', 'last': 'Last', 'phone': None, 'experience': experiences})
+    return records
+
+
+def random_contact_records(seed, persons=80, contacts=120, numbers=40):
+    rng = random.Random(seed)
+    return [
+        {'id': contact_id, 'owner_id': rng.randint(1, persons + 5), 'contact_nickname': 'Nickname', 'phone': [
+            {'number': '(555) 000-{:04d}'.format(rng.randrange(numbers)), 'type': 'cell'} for _ in range(rng.randint(1, 2))
+        ]}
+        for contact_id in range(1, contacts + 1)
+    ]
+
+
+def test_indexed_lookups_match_loops_on_dataset():
+    person_records = load_person_records(FILES['person_records'])
+    contact_records = load_contacts(FILES['contact_records'])
+    index = DirectReadIndex(person_records, contact_records)
+    for person_id in [p['id'] for p in person_records] + [999]:
+        assert find_connections_via_experiences_indexed(index, person_id) == find_connections_via_experiences(person_records, person_id)
+        assert find_connections_via_contacts_indexed(index, person_id) == find_connections_via_contacts(person_records, person_id, contact_records)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_indexed_lookups_match_loops_on_random_records(seed):
+    person_records = random_person_records(seed)
+    contact_records = random_contact_records(seed)
+    index = DirectReadIndex(person_records, contact_records)
+    assert index.persons[1] is person_records[0]
+    for person in person_records:
+        assert find_connections_via_experiences_indexed(index, person['id']) == find_connections_via_experiences(person_records, person['id'])
+        assert find_connections_via_contacts_indexed(index, person['id']) == find_connections_via_contacts(person_records, person['id'], contact_records)
+
+
+def test_vectorized_matches_loop_on_dataset():
+    pytest.importorskip('numpy')
+    from src.services.direct_read_data import ExperienceArrays, find_connections_via_experiences_vectorized
+    person_records = load_person_records(FILES['person_records'])
+    arrays = ExperienceArrays(person_records)
+    for person_id in [p['id'] for p in person_records] + [999]:
+        assert find_connections_via_experiences_vectorized(person_records, person_id, arrays) == find_connections_via_experiences(person_records, person_id)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_vectorized_matches_loop_on_random_records(seed):
+    pytest.importorskip('numpy')
+    from src.services.direct_read_data import ExperienceArrays, find_connections_via_experiences_vectorized
+    person_records = random_person_records(seed)
+    arrays = ExperienceArrays(person_records)
+    for person in person_records:
+        expected = find_connections_via_experiences(person_records, person['id'])
+        assert find_connections_via_experiences_vectorized(person_records, person['id'], arrays) == expected
@@ -0,0 +1,91 @@
+import random
+import datetime
+import pytest
+from src.services.experience_overlap import ExperienceOverlapEngine, Interval, to_day_ordinal
+
+
+def random_intervals(seed, persons=60, companies=5):
+    rng = random.Random(seed)
+    intervals = []
+    for person_id in range(persons):
+        for company in rng.sample(range(companies), rng.randint(0, 3)):
+            start = rng.randint(0, 1500)
+            intervals.append(Interval(person_id, 'company-{}'.format(company), start, start + rng.randint(0, 600)))
+    return intervals
+
+
+def brute_force_pairs(intervals, min_overlap_days):
+    pairs = set()
+    for first in intervals:
+        for second in intervals:
+            if first.company != second.company or first.person_id >= second.person_id:
+                continue
+            overlap = min(first.end, second.end) - max(first.start, second.start)
+            if overlap >= min_overlap_days:
+                pairs.add((first.person_id, second.person_id, first.company, overlap))
+    return pairs
+
+
+def normalized(pairs):
+    return {
+        (min(a.person_id, b.person_id), max(a.person_id, b.person_id), a.company, overlap)
+        for a, b, overlap in pairs
+    }
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('min_overlap_days', [0, 1, 90, 365])
+def test_pairs_match_brute_force(seed, min_overlap_days):
+    intervals = random_intervals(seed)
+    engine = ExperienceOverlapEngine(intervals, min_overlap_days=min_overlap_days)
+
+    pairs = list(engine.pairs())
+
+    assert len(pairs) == len(normalized(pairs))
+    assert normalized(pairs) == brute_force_pairs(intervals, min_overlap_days)
+
+
+def largest_overlaps(pairs):
+    largest = {}
+    for person_a, person_b, company, overlap in pairs:
+        largest[(person_a, person_b, company)] = max(overlap, largest.get((person_a, person_b, company), overlap))
+    return {key + (overlap,) for key, overlap in largest.items()}
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('repeat', [False, True])
+def test_pairs_for_match_brute_force(seed, repeat):
+    intervals = random_intervals(seed)
+    if repeat:
+        # A second experience of some persons at a company where they already worked
+        intervals += [interval._replace(start=interval.start + 200, end=interval.end + 300) for interval in intervals[::3]]
+    engine = ExperienceOverlapEngine(intervals)
+    expected = largest_overlaps(brute_force_pairs(intervals, 90))
+
+    for person_id in range(60):
+        pairs = list(engine.pairs_for(person_id))
+        assert len(pairs) == len({(other.person_id, other.company) for _, other, _ in pairs})
+        assert normalized(pairs) == {pair for pair in expected if person_id in pair[:2]}
+
+
+def test_overlap_threshold_is_inclusive():
+    engine = ExperienceOverlapEngine([
+        Interval(1, 'OrangeCart', 0, 200),
+        Interval(2, 'OrangeCart', 110, 400),
+        Interval(3, 'OrangeCart', 111, 400),
+        Interval(4, 'GreenTech', 0, 200),
+    ])
+
+    assert engine.connections() == {(1, 2): 90, (2, 3): 289}
+
+
+def test_from_records_resolves_present():
+    today = datetime.date(2024, 1, 1)
+    engine = ExperienceOverlapEngine.from_records([
+        {'person_id': 1, 'company': 'OrangeCart', 'start_date': '2023-01-01', 'end_date': None},
+        {'person_id': 2, 'company': 'OrangeCart', 'start_date': '2023-06-01', 'end_date': None},
+    ], today=today)
+
+    [(first, second, overlap)] = engine.pairs_for(1)
+    assert second.ref['person_id'] == 2
+    assert overlap == to_day_ordinal(today) - to_day_ordinal('2023-06-01')
@@ -0,0 +1,108 @@
+import os
+import pytest
+from src.lib.database.conn import db
+from src.lib.database.migration.migration import Migration
+from src.services.connection_graph import build_connections
+from src.services.connection_traversal import ConnectionGraph
+from src.services.graph_snapshot import GraphSnapshot, write_snapshot, export_snapshot, execute_snapshot, HEADER_SIZE
+from src.services.test_connection_traversal import random_graph, expected_rules
+
+
+def snapshot_rows(person_ids, graph):
+    persons = [(person_id, 'First{}'.format(person_id), 'Last') for person_id in person_ids]
+    connections = []
+    for (person_a, person_b), (via_experience, via_contact, _) in graph.items():
+        overlap = 100 + person_a if via_experience else None
+        connections.append((person_a, person_b, via_experience, via_contact, overlap))
+        connections.append((person_b, person_a, via_experience, via_contact, overlap))
+    return persons, sorted(connections)
+
+
+@pytest.mark.parametrize('contiguous', [True, False])
+def test_snapshot_walks_like_the_graph(tmp_path, contiguous):
+    person_ids, graph, connection_graph = random_graph(5, contiguous=contiguous)
+    file = str(tmp_path / 'graph.snap')
+    stats = write_snapshot(file, *snapshot_rows(person_ids, graph), data_version='abc-v5')
+    assert stats['bytes'] == os.path.getsize(file)
+
+    with GraphSnapshot(file, verify=True) as snapshot:
+        assert snapshot.data_version == 'abc-v5'
+        assert len(snapshot) == len(person_ids)
+        assert snapshot.graph.edge_count() == connection_graph.edge_count() == stats['edges']
+        for source_id in person_ids[:10]:
+            assert snapshot.graph.within(source_id, 3) == connection_graph.within(source_id, 3)
+            for target_id in person_ids[-10:]:
+                assert snapshot.graph.shortest_path(source_id, target_id) == connection_graph.shortest_path(source_id, target_id)
+
+        person_a, person_b = next(iter(graph))
+        via_experience, via_contact, _ = graph[(person_a, person_b)]
+        assert {'id': person_b, 'rules': expected_rules(graph[(person_a, person_b)]), 'overlap_days': 100 + person_a if via_experience else None} in snapshot.connections(person_a)
+        assert snapshot.person_name(person_a) == 'First{} Last'.format(person_a)
+        assert snapshot.person_name(-1) is None
+        assert snapshot.connections(-1) is None
+
+
+def test_snapshot_of_store_matches_stored_connections(tmp_path):
+    Migration(stream=True)
+    file = str(tmp_path / 'graph.snap')
+    export_snapshot(file, db)
+    connections = build_connections(db)
+    stored = ConnectionGraph.from_database(db)
+
+    with GraphSnapshot(file) as snapshot:
+        assert snapshot.graph.edge_count() == 2 * len(connections)
+        for (person_a, person_b), (via_experience, via_contact, overlap_days) in connections.items():
+            assert {'id': person_b, 'rules': expected_rules((via_experience, via_contact)), 'overlap_days': overlap_days} in snapshot.connections(person_a)
+        for person_id in stored.ids:
+            assert snapshot.graph.within(person_id, 2) == stored.within(person_id, 2)
+
+
+def test_corrupted_snapshots_are_rejected(tmp_path):
+    person_ids, graph, _ = random_graph(7)
+    file = str(tmp_path / 'graph.snap')
+    write_snapshot(file, *snapshot_rows(person_ids, graph))
+    content = open(file, 'rb').read()
+
+    def rewrite(data):
+        with open(file, 'wb') as f:
+            f.write(data)
+
+    # A flipped byte in a section fails its checksum when the checksums are verified, opening only checks the header
+    rewrite(content[:HEADER_SIZE + 3] + bytes([content[HEADER_SIZE + 3] ^ 1]) + content[HEADER_SIZE + 4:])
+    with pytest.raises(Exception, match='checksum'):
+        GraphSnapshot(file, verify=True)
+    with pytest.raises(Exception, match='checksum'):
+        execute_snapshot(file, verify=True)
+    GraphSnapshot(file).close()
+
+    # A flipped byte in the header always fails
+    rewrite(content[:20] + bytes([content[20] ^ 1]) + content[21:])
+    with pytest.raises(Exception, match='header checksum'):
+        GraphSnapshot(file)
+
+    rewrite(content[:8] + b'\x02\x00\x00\x00' + content[12:])
+    with pytest.raises(Exception, match='version'):
+        GraphSnapshot(file)
+
+    rewrite(b'not a snapshot' * 40)
+    with pytest.raises(Exception, match='not a graph snapshot'):
+        GraphSnapshot(file)
+
+    rewrite(content[:HEADER_SIZE + 16])
+    with pytest.raises(Exception, match='truncated'):
+        GraphSnapshot(file)
+
+
+def test_snapshot_is_replaced_atomically(tmp_path):
+    person_ids, graph, _ = random_graph(9)
+    file = str(tmp_path / 'graph.snap')
+    write_snapshot(file, *snapshot_rows(person_ids, graph))
+
+    # A reader keeps the snapshot it mapped when a new one replaces the file
+    with GraphSnapshot(file) as old:
+        write_snapshot(file, *snapshot_rows(person_ids[:5], {}))
+        assert len(old) == len(person_ids)
+        with GraphSnapshot(file) as new:
+            assert len(new) == 5
+            assert new.graph.edge_count() == 0
+    assert os.listdir(str(tmp_path)) == ['graph.snap']
@@ -0,0 +1,82 @@
+import random
+import pytest
+from src.lib.database.conn import db
+from src.lib.database.migration.migration import Migration
+from src.services.connection_graph import build_connections
+from src.services.person_clusters import (
+    UnionFind, compute_clusters, FindClusterByPersonId, FindClusterMembers, get_person_cluster
+)
+
+
+@pytest.fixture(scope='module')
+def store():
+    Migration(stream=True)
+    return db
+
+
+def components(person_ids, connections):
+    # Oracle: repeatedly merges the components of connected persons
+    component_of = {person_id: {person_id} for person_id in person_ids}
+    for person_a, person_b in connections:
+        if component_of[person_a] is not component_of[person_b]:
+            merged = component_of[person_a] | component_of[person_b]
+            for person_id in merged:
+                component_of[person_id] = merged
+    return {person_id: min(component) for person_id, component in component_of.items()}
+
+
+def test_union_find_compresses_paths_and_unions_by_rank():
+    forest = UnionFind(8)
+    for first, second in [(0, 1), (2, 3), (0, 2), (4, 5), (6, 7), (4, 6), (0, 4)]:
+        assert forest.union(first, second)
+    assert not forest.union(1, 7)
+    root = forest.find(7)
+    assert all(forest.find(element) == root for element in range(8))
+    # Every element points at the root once it was found
+    assert all(forest.parent[element] == root for element in range(8))
+    assert forest.rank[root] == 3
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_compute_clusters_matches_oracle(seed):
+    rng = random.Random(seed)
+    person_ids = sorted(rng.sample(range(1, 1000), 120))
+    connections = [tuple(rng.sample(person_ids, 2)) for _ in range(90)]
+    ids, cluster_ids, sizes = compute_clusters(person_ids, connections)
+
+    expected = components(person_ids, connections)
+    assert dict(zip(ids, cluster_ids)) == expected
+    assert sizes == {cluster_id: list(expected.values()).count(cluster_id) for cluster_id in set(expected.values())}
+
+
+def test_stored_clusters_match_connections(store):
+    person_ids = [person_id for person_id, in db.execute_sql('SELECT id FROM person ORDER BY id')]
+    expected = components(person_ids, build_connections(db))
+    for person_id in person_ids:
+        cluster = FindClusterByPersonId(person_id).get_query_result()
+        assert cluster['cluster_id'] == expected[person_id]
+        assert cluster['size'] == list(expected.values()).count(expected[person_id])
+    assert FindClusterByPersonId(999).get_query_result() is None
+
+
+def test_cluster_members_are_paged(store):
+    cluster = get_person_cluster(3, page_size=1000)
+    assert cluster['next_after_person_id'] is None
+    assert len(cluster['members']) == cluster['size']
+    all_members = [member['id'] for member in cluster['members']]
+
+    paged, after = [], None
+    while True:
+        page = get_person_cluster(3, after_person_id=after, page_size=2)
+        paged.extend(member['id'] for member in page['members'])
+        after = page['next_after_person_id']
+        if after is None:
+            break
+    assert paged == all_members
+    assert get_person_cluster(999) is None
+
+
+def test_cluster_queries_use_indexes(store):
+    for query, binds in (FindClusterByPersonId(1).get_query(), FindClusterMembers(1, after_person_id=3).get_query()):
+        for detail in (row[-1] for row in db.execute_sql('EXPLAIN QUERY PLAN {}'.format(query), binds)):
+            assert not detail.startswith('SCAN') or 'INDEX' in detail, detail
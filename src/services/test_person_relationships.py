@@ -0,0 +1,279 @@
+import os
+import sys
+import subprocess
+import pytest
+from src.lib.database.conn import db
+from src.lib.database.migration.migration import Migration
+from src.lib.database.migration.models.person_model import Person
+from src.lib.database.migration.models.experience_model import Experience
+from src.lib.database.store import FILES, open_store
+from src.lib.helpers.format import canonical_phone_key
+from src.services.direct_read_data import load_person_records, load_contacts, find_connections_via_experiences
+from src.services.person_relationships import (
+    FindContactsByPersonId, FindExperiencesWithPermanenceDays, FindExperiencesAtPersonCompanies, FindConnectionsByPersonId, PersonRepository,
+    FindRelatedPersons, FindContactRelationsByPersonId, FindRelationshipsByPersonId, resolve_relationships
+)
+from src.lib.helpers.profiling import Profiler, profiler
+from src.lib.helpers.synthetic_data import SyntheticDataGenerator
+
+
+@pytest.fixture(scope='module')
+def store():
+    Migration(stream=True)
+    return db
+
+
+def query_plan(query, binds):
+    return [row[-1] for row in db.execute_sql('EXPLAIN QUERY PLAN {}'.format(query), binds)]
+
+
+def assert_uses_indexes(plan):
+    assert plan
+    for detail in plan:
+        if detail.startswith('SCAN'):
+            assert 'INDEX' in detail, plan
+
+
+@pytest.mark.parametrize('show_only_contacts_matching_person', [True, False])
+def test_contacts_query_uses_indexes(store, show_only_contacts_matching_person):
+    query, binds = FindContactsByPersonId(1).get_query(show_only_contacts_matching_person)
+    assert_uses_indexes(query_plan(query, binds))
+
+
+def test_experiences_query_uses_indexes(store):
+    query, binds = FindExperiencesWithPermanenceDays(
+        company_name='OrangeCart', start_date='2017-01-01', person_id=1
+    ).get_query()
+    plan = query_plan(query, binds)
+    assert_uses_indexes(plan)
+    assert any('experience_company_start_date_end_date_person_id_title' in detail for detail in plan)
+
+
+def test_orm_lookups_use_indexes(store):
+    for query in (Person.select().where(Person.id == 1), Experience.select().where(Experience.person == 1)):
+        sql, binds = query.sql()
+        assert_uses_indexes(query_plan(sql, binds))
+
+
+def test_contacts_match_phones_with_and_without_country_code(store):
+    # Contact phone +14151234567 of person 16 is the phone (415) 123-4567 of person 15
+    contacts = FindContactsByPersonId(16).get_query_result(True)
+    assert [contact['id'] for contact in contacts] == [15]
+
+
+def test_experiences_at_person_companies_query_uses_indexes(store):
+    query, binds = FindExperiencesAtPersonCompanies(1).get_query()
+    plan = query_plan(query, binds)
+    assert_uses_indexes(plan)
+    assert any('experience_company_start_date_end_date_person_id_title' in detail for detail in plan)
+
+
+@pytest.mark.parametrize('show_only_contacts_matching_person', [True, False])
+def test_contact_relations_query_uses_indexes(store, show_only_contacts_matching_person):
+    plan = query_plan(*FindContactRelationsByPersonId(1).get_query(show_only_contacts_matching_person))
+    assert not [detail for detail in plan if detail.split(' ')[:2] in (['SCAN', table] for table in ('contact', 'phone', 'person'))]
+
+
+def test_connections_query_uses_primary_key(store):
+    query, binds = FindConnectionsByPersonId(1).get_query()
+    plan = query_plan(query, binds)
+    assert_uses_indexes(plan)
+    assert any('PRIMARY KEY' in detail for detail in plan if 'pc' in detail)
+
+
+@pytest.mark.parametrize('show_only_contacts_matching_person', [True, False])
+def test_relationships_query_reads_the_edges_of_the_person(store, show_only_contacts_matching_person):
+    plan = query_plan(*FindRelationshipsByPersonId(1).get_query(show_only_contacts_matching_person))
+    assert 'SEARCH pc USING PRIMARY KEY (person_a=?)' in plan
+    # The experiences are read by person, never by company
+    assert not [detail for detail in plan if 'experience_company' in detail]
+    assert not [detail for detail in plan if detail.split(' ')[:2] in (['SCAN', table] for table in ('experience', 'contact', 'phone', 'person'))]
+
+
+def test_connections_match_both_rules(store):
+    persons = load_person_records(FILES['person_records'])
+    contacts = load_contacts(FILES['contact_records'])
+    key_owner = {canonical_phone_key(person['phone']): person['id'] for person in persons}
+    by_contact = set()
+    for contact in contacts:
+        for phone in contact['phone']:
+            person_id = key_owner.get(canonical_phone_key(phone['number']))
+            if person_id is not None and person_id != contact['owner_id']:
+                by_contact |= {(contact['owner_id'], person_id), (person_id, contact['owner_id'])}
+
+    for person in persons:
+        person_id = person['id']
+        relationships = PersonRepository(person_id).get_person_relationships(person_id=person_id)['relationships']
+        by_experience = set(find_connections_via_experiences(persons, person_id)) - {person_id}
+        assert {related['person']['id'] for related in relationships['by_experiences']} == by_experience
+        assert {related['id'] for related in relationships['by_contacts']} == {b for a, b in by_contact if a == person_id}
+
+
+def test_person_relationships_are_symmetric(store):
+    relationships = PersonRepository(16).get_person_relationships(person_id=16)['relationships']
+    # Person 1 has the phone of person 16 in their contacts
+    assert 1 in [related['id'] for related in relationships['by_contacts']]
+
+
+EXPERIENCE_KEYS = {'person', 'company', 'title', 'start_date', 'end_date', 'overlap_days'}
+CONTACT_KEYS = {'id', 'contact_owner_name', 'nickname', 'type', 'number', 'contact_id', 'contact_person_name', 'person'}
+
+
+@pytest.mark.parametrize('min_permanence_days', [1, 90, 1000])
+@pytest.mark.parametrize('only_contacts_with_related_person', [True, False])
+def test_relationships_have_one_shape_for_every_option(store, min_permanence_days, only_contacts_with_related_person):
+    repository = PersonRepository()
+    experiences, contacts = 0, 0
+    for person_id in range(1, 18):
+        person_relation_ships = repository.get_person_relationships(person_id=person_id, min_permanence_days=min_permanence_days, only_contacts_with_related_person=only_contacts_with_related_person)
+        assert set(person_relation_ships) == {'id', 'first_name', 'last_name', 'phone', 'phone_key', 'relationships'}
+        for related in person_relation_ships['relationships']['by_experiences']:
+            assert set(related) == EXPERIENCE_KEYS
+            assert related['overlap_days'] >= min_permanence_days
+            experiences += 1
+        for related in person_relation_ships['relationships']['by_contacts']:
+            assert set(related) == CONTACT_KEYS
+            assert related['id'] is not None or not only_contacts_with_related_person
+            contacts += 1
+    assert experiences and contacts
+
+
+def test_resolve_all_relationships_matches_single_lookups(store):
+    resolved = list(resolve_relationships())
+
+    assert [person_id for person_id, _ in resolved] == list(range(1, 18))
+    for person_id, person_relation_ships in resolved:
+        single = PersonRepository(person_id).get_person_relationships(person_id=person_id)
+        assert person_relation_ships == single
+
+
+def test_profiled_lookup_reports_the_rows_found(store):
+    profiler.enable(db)
+    try:
+        PersonRepository().get_person_relationships(person_id=1)
+        relationships = FindRelationshipsByPersonId(1).get_query_result()
+        with pytest.raises(Person.DoesNotExist):
+            PersonRepository().get_person_relationships(person_id=999)
+    finally:
+        profiler.disable()
+    sections = profiler.report()['sections']
+    assert sections['FindPersonById.execute_query']['calls'] == 2
+    assert sections['FindPersonById.execute_query']['rows'] == 1
+    assert sections['FindRelationshipsByPersonId.execute_query']['rows'] == len(relationships['by_experiences']) + len(relationships['by_contacts']) > 0
+
+
+def test_resolve_relationships_reports_missing_ids(store):
+    resolved = list(resolve_relationships([3, 999, 1]))
+
+    assert [person_id for person_id, _ in resolved] == [3, 999, 1]
+    assert resolved[1][1] is None
+    assert resolved[2][1]['first_name'] == 'John'
+
+
+def test_related_persons_match_the_stored_connections(store):
+    repository = PersonRepository()
+    for person_id in range(1, 18):
+        connections = repository.get_person_related_people_by_connections(person_id=person_id)
+        expected = [
+            (connection['id'], connection['first_name'], connection['last_name'], [rule for rule, flag in (('shared_company', connection['via_experience']), ('contact', connection['via_contact'])) if flag])
+            for connection in connections
+        ]
+        assert repository.get_person_related_people(person_id=person_id) == expected
+
+
+def test_related_persons_with_another_overlap_in_one_statement(store):
+    profiling = Profiler()
+    profiling.enable(db)
+    try:
+        for person_id in range(1, 18):
+            related = PersonRepository().get_person_related_people(person_id=person_id, min_permanence_days=1000)
+            by_experience = {experience.person_id for experience in PersonRepository().get_person_related_people_by_experiences(person_id=person_id, min_permanence_days=1000)}
+            assert {person.id for person in related if 'shared_company' in person.rules} == by_experience
+            assert [person.id for person in related] == sorted({person.id for person in related})
+        profiling.reset()
+        PersonRepository().get_person_related_people(person_id=1, min_permanence_days=1000)
+        assert profiling.report()['sql']['statements'] == 1
+    finally:
+        profiling.disable()
+    # Only the CTE results are scanned, every table is searched through an index
+    plan = query_plan(*FindRelatedPersons(1).get_query())
+    assert not [detail for detail in plan if detail.split(' ')[:2] in (['SCAN', table] for table in ('experience', 'contact', 'phone', 'person'))]
+
+
+@pytest.fixture
+def crowded_store(tmp_path):
+    # Every person worked at one of two companies, so each person is related to hundreds of others
+    files = {'person_records': str(tmp_path / 'persons.json'), 'contact_records': str(tmp_path / 'contacts.json')}
+    SyntheticDataGenerator(400, seed=3, companies=2, median_tenure_days=3000).write(files['person_records'], files['contact_records'])
+    if not db.is_closed():
+        db.close()
+    open_store(path=str(tmp_path), files=files)
+    Migration(stream=True, files=files)
+    yield db
+    if not db.is_closed():
+        db.close()
+    db.init(None)
+
+
+@pytest.mark.parametrize('min_permanence_days, only_contacts_with_related_person, queries', [(90, True, 2), (30, False, 3)])
+def test_relationship_lookups_run_a_constant_number_of_queries(crowded_store, min_permanence_days, only_contacts_with_related_person, queries):
+    repository = PersonRepository()
+    profiling = Profiler()
+    profiling.enable(db)
+    statements, related = set(), []
+    try:
+        for person_id in range(1, 401, 20):
+            profiling.reset()
+            relationships = repository.get_person_relationships(person_id=person_id, min_permanence_days=min_permanence_days, only_contacts_with_related_person=only_contacts_with_related_person)['relationships']
+            statements.add(profiling.report()['sql']['statements'])
+            related.append(len(relationships['by_experiences']))
+    finally:
+        profiling.disable()
+    assert max(related) > 100
+    assert statements == {queries}
+
+
+@pytest.mark.parametrize('only_contacts_with_related_person', [True, False])
+def test_stored_connection_lookups_match_the_records(crowded_store, only_contacts_with_related_person):
+    repository = PersonRepository()
+    for person_id in range(1, 401, 7):
+        person_relation_ships = repository.get_person_relationships(person_id=person_id, only_contacts_with_related_person=only_contacts_with_related_person)
+        experiences = FindExperiencesAtPersonCompanies(person_id).get_query_result()
+        contacts = FindContactRelationsByPersonId(person_id).get_query_result(only_contacts_with_related_person)
+        assert person_relation_ships['relationships'] == PersonRepository.relationships_from_rows(person_id, experiences, contacts)
+
+
+def test_resolve_all_relationships_reads_one_set_of_scans(crowded_store):
+    profiling = Profiler()
+    profiling.enable(db)
+    try:
+        resolved = [person_relation_ships for _, person_relation_ships in resolve_relationships()]
+        statements = profiling.report()['sql']['statements']
+    finally:
+        profiling.disable()
+    assert [person_relation_ships['id'] for person_relation_ships in resolved] == list(range(1, 401))
+    assert statements < 10
+    repository = PersonRepository()
+    for person_relation_ships in resolved[::13]:
+        assert person_relation_ships == repository.get_person_relationships(person_id=person_relation_ships['id'])
+
+
+# Runs in a new interpreter, so the modules imported by the other tests do not count
+STARTUP_CHECK = '''
+import os, sys
+from src.lib.database.migration.models.db import db, database_path
+stores = set(os.listdir(database_path))
+from src.services.person_relationships import resolve_relationships
+assert db.database is None, db.database
+assert set(os.listdir(database_path)) == stores
+assert [person_id for person_id, _ in resolve_relationships([1])] == [1]
+ingest = ('src.lib.database.migration.migration', 'src.lib.database.migration.bulk_loader', 'src.services.connection_graph', 'concurrent.futures')
+print(sorted(module for module in sys.modules if module.startswith(ingest)))
+'''
+
+
+def test_lookup_against_ready_store_imports_no_ingest_code(store):
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run([sys.executable, '-c', STARTUP_CHECK], cwd=root, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '[]'
@@ -0,0 +1,63 @@
+import json
+import pytest
+from src.lib.database.store import FILES
+from src.services.direct_read_data import load_person_records, load_contacts, find_connections_via_experiences, DirectReadIndex, find_connections_via_contacts_indexed, main
+from src.services.person_store import PersonStore, PersonView
+
+
+@pytest.fixture(scope='module')
+def person_records():
+    return load_person_records(FILES['person_records'])
+
+
+def test_store_round_trips_records(person_records):
+    store = PersonStore.from_json(FILES['person_records'])
+    assert len(store) == len(person_records)
+    assert [person.to_record() for person in store] == person_records
+    assert store[-1].to_record() == person_records[-1]
+    with pytest.raises(IndexError):
+        store[len(store)]
+
+
+def test_views_expose_typed_fields(person_records):
+    store = PersonStore(person_records)
+    person = store.get(1)
+    assert isinstance(person, PersonView)
+    assert not hasattr(person, '__dict__')
+    assert (person.id, person.first_name, person.last_name, person.phone_key) == (1, 'John', 'Doe', 11234567890)
+    experience = person.experiences[0]
+    assert experience.company == 'OrangeCart' and experience.end_ordinal is None
+    assert experience.start_date.isoformat() == '2017-01-01'
+    assert store.company_code('OrangeCart') == experience.company_code
+    assert store.get(999) is None
+    # Repeated names and companies are stored once
+    assert len(store.company_names.values) == len({exp['company'] for p in person_records for exp in p['experience']})
+
+
+def test_store_stands_in_for_records(person_records):
+    store = PersonStore(person_records)
+    contact_records = load_contacts(FILES['contact_records'])
+    index = DirectReadIndex(store, contact_records)
+    expected_index = DirectReadIndex(person_records, contact_records)
+    for person in person_records:
+        assert find_connections_via_experiences(store, person['id']) == find_connections_via_experiences(person_records, person['id'])
+        assert find_connections_via_contacts_indexed(index, person['id']) == find_connections_via_contacts_indexed(expected_index, person['id'])
+
+
+def test_direct_lookup_prints_the_same_from_the_store(person_records, capsys):
+    contact_records = load_contacts(FILES['contact_records'])
+    store = PersonStore.from_json(FILES['person_records'])
+    for person_id in (1, 3, 999):
+        main(person_records, person_id, contact_records)
+        expected = capsys.readouterr().out
+        main(store, person_id, contact_records)
+        assert capsys.readouterr().out == expected
+
+
+def test_numpy_columns_share_memory(person_records):
+    np = pytest.importorskip('numpy')
+    store = PersonStore(person_records)
+    starts = store.numpy_column('starts')
+    assert starts.dtype == np.int32
+    assert starts.tolist() == list(store.starts)
+    assert store.nbytes() < len(json.dumps(person_records))
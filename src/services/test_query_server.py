@@ -0,0 +1,115 @@
+import json
+import threading
+import http.client
+import pytest
+from src.services.query_server import LRUCache, RelationshipService, create_server
+from src.services.person_relationships import PersonRepository
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put(1, b'one')
+    cache.put(2, b'two')
+    assert cache.get(1) == b'one'
+    cache.put(3, b'three')
+
+    assert cache.get(2) is None
+    assert cache.get(1) == b'one'
+    assert cache.get(3) == b'three'
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+@pytest.fixture(scope='module')
+def server():
+    service = RelationshipService(cache_size=8)
+    server = create_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path):
+    conn = http.client.HTTPConnection(*server.server_address[:2])
+    conn.request('GET', path)
+    response = conn.getresponse()
+    body = json.loads(response.read())
+    conn.close()
+    return response.status, body
+
+
+def test_relationships_match_repository(server):
+    status, body = get(server, '/persons/1/relationships')
+    assert status == 200
+    assert body == json.loads(json.dumps(PersonRepository(1).get_person_relationships(person_id=1)))
+
+    # The second request is answered from the cache
+    assert get(server, '/persons/1/relationships') == (status, body)
+    assert server.RequestHandlerClass.service.cache.hits >= 1
+
+
+def test_missing_person_and_unknown_path(server):
+    assert get(server, '/persons/999/relationships')[0] == 404
+    assert get(server, '/unknown')[0] == 404
+
+
+def test_health_and_metrics(server):
+    status, health = get(server, '/health')
+    assert status == 200
+    assert health['status'] == 'ok'
+
+    status, metrics = get(server, '/metrics')
+    assert status == 200
+    assert metrics['data_version'] == health['data_version']
+    assert metrics['requests'] >= 1
+
+
+def test_failed_lookups_are_counted(server, monkeypatch):
+    service = server.RequestHandlerClass.service
+    errors = service.metrics()['errors']
+
+    def fail(person_id):
+        raise Exception('lookup failed')
+
+    monkeypatch.setattr(service, 'get_relationships', fail)
+    threads = [threading.Thread(target=get, args=(server, '/persons/1/relationships')) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    status, body = get(server, '/persons/1/relationships')
+    assert (status, body) == (500, {'error': 'lookup failed'})
+    assert service.metrics()['errors'] == errors + 9
+
+
+def test_check_data_version_without_changes(server):
+    assert server.RequestHandlerClass.service.check_data_version() is False
+
+
+def test_lookups_are_served_while_a_new_store_is_built(server, monkeypatch):
+    service = server.RequestHandlerClass.service
+    published, generation = service.connections.published, service.connections.generation
+    building, built = threading.Event(), threading.Event()
+
+    def slow_build_store():
+        building.set()
+        built.wait(5)
+        return published
+
+    monkeypatch.setattr('src.services.query_server.current_data_version', lambda: 'new-data-version')
+    monkeypatch.setattr('src.services.query_server.build_store', slow_build_store)
+    reload = threading.Thread(target=service.check_data_version)
+    reload.start()
+    assert building.wait(5)
+
+    # The previous store keeps answering until the new one is published
+    assert get(server, '/persons/1/relationships')[0] == 200
+    assert service.data_version != 'new-data-version'
+    built.set()
+    reload.join(5)
+
+    assert service.data_version == 'new-data-version'
+    assert service.connections.generation == generation + 1
+    assert len(service.cache) == 0
+    assert get(server, '/persons/1/relationships')[0] == 200